@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +56,7 @@ ROOT_URLCONF = 'food_diary.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'main.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,10 +78,89 @@ WSGI_APPLICATION = 'food_diary.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('FOOD_DIARY_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# Рабочий режим SQLite (FOOD_DIARY_SQLITE_MODE=production):
+# журнал WAL (чтение не ждёт запись), ожидание блокировки вместо
+# мгновенной ошибки «database is locked», BEGIN IMMEDIATE для транзакций,
+# чтобы запись брала блокировку сразу, а не при первом UPDATE,
+# и постоянные соединения с проверкой перед использованием.
+SQLITE_MODE = os.environ.get('FOOD_DIARY_SQLITE_MODE', 'default')
+
+if SQLITE_MODE == 'production':
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': os.environ.get('FOOD_DIARY_SQLITE_SYNCHRONOUS', 'NORMAL'),
+        # Отрицательное значение — размер в КиБ.
+        'cache_size': -1024 * int(os.environ.get('FOOD_DIARY_SQLITE_CACHE_MB', '64')),
+        'mmap_size': 1024 * 1024 * int(os.environ.get('FOOD_DIARY_SQLITE_MMAP_MB', '256')),
+        'temp_store': 'MEMORY',
+    }
+    DATABASES['default']['OPTIONS'] = {
+        'timeout': float(os.environ.get('FOOD_DIARY_SQLITE_BUSY_TIMEOUT', '20')),
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': ';'.join(
+            f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()
+        ),
+    }
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('FOOD_DIARY_CONN_MAX_AGE', '600'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# По умолчанию кеш хранится в памяти процесса. Чтобы несколько
+# процессов сервера делили кеш страниц, задайте каталог
+# FOOD_DIARY_CACHE_DIR (файловый кеш) или FOOD_DIARY_REDIS_URL.
+
+if os.environ.get('FOOD_DIARY_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['FOOD_DIARY_REDIS_URL'],
+        }
+    }
+elif os.environ.get('FOOD_DIARY_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['FOOD_DIARY_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'food-diary',
+        }
+    }
+
+# Кеш отрисованных страниц списка блюд.
+PAGE_CACHE_ENABLED = os.environ.get('FOOD_DIARY_PAGE_CACHE', '1') != '0'
+
+
+# Замеры запросов, времени SQL и шаблонов по представлениям
+# (заголовок Server-Timing и страница /stats/ для администраторов).
+INSTRUMENTATION_ENABLED = os.environ.get('FOOD_DIARY_INSTRUMENTATION', '1') != '0'
+
+# Заголовок Server-Timing для всех ответов, а не только для администраторов
+# (при DEBUG он отдаётся всегда).
+SERVER_TIMING_HEADER = os.environ.get('FOOD_DIARY_SERVER_TIMING', '0') == '1'
+
+# Асинхронные версии списка блюд, профиля и списков аллергенов
+# (main/async_views.py). Выключены по умолчанию: на SQLite они медленнее
+# синхронных (см. README), выигрыш возможен с удалённой базой или кешем.
+ASYNC_READ_VIEWS = os.environ.get('FOOD_DIARY_ASYNC_VIEWS', '0') == '1'
+
+# Ограничение времени подбора блюд под дневную норму, секунды.
+MEAL_PLANNER_TIME_BUDGET = float(os.environ.get('FOOD_DIARY_PLANNER_TIME_BUDGET', '0.5'))
+
+# Превышение бюджета запросов представления: исключение вместо
+# предупреждения в журнале. Тесты включают его через override_settings.
+QUERY_BUDGETS_RAISE = os.environ.get('FOOD_DIARY_QUERY_BUDGETS_RAISE', '0') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.hashers import make_password
-from .models import User, Dish, Allergen
+from django import forms
+from .composition import creates_cycle
+from .models import User, Dish, DishComponent, Allergen, MealEntry, Serving
 from .forms import UserAdminForm
 
 @admin.register(User)
@@ -25,6 +27,28 @@ class AllergenAdmin(admin.ModelAdmin):
     readonly_fields = ('id',)
     list_editable = ('name',)
 
+class ServingInline(admin.TabularInline):
+    model = Serving
+    extra = 0
+    fields = ('name', 'weight_grams', 'calories', 'proteins', 'fats', 'carbohydrates')
+    readonly_fields = ('calories', 'proteins', 'fats', 'carbohydrates')
+
+class DishComponentInlineForm(forms.ModelForm):
+    def clean(self):
+        cleaned_data = super().clean()
+        component = cleaned_data.get('component')
+        parent_id = self.instance.parent_id
+        if component and parent_id and creates_cycle(parent_id, component.pk):
+            raise forms.ValidationError('Блюдо уже содержит этот рецепт, получится цикл.')
+        return cleaned_data
+
+class DishComponentInline(admin.TabularInline):
+    model = DishComponent
+    form = DishComponentInlineForm
+    fk_name = 'parent'
+    extra = 0
+    raw_id_fields = ('component',)
+
 @admin.register(Dish)
 class DishAdmin(admin.ModelAdmin):
     list_display = (
@@ -38,15 +62,21 @@ class DishAdmin(admin.ModelAdmin):
         'name', 'description',
         'user__login', 'user__email'
     )
-    readonly_fields = ('id', 'created_at')
+    readonly_fields = ('id', 'created_at', 'calories_100g', 'proteins_100g', 'fats_100g', 'carbohydrates_100g')
     list_editable = (
         'name', 'calories', 'proteins', 'fats', 'carbohydrates'
     )
     filter_horizontal = ('allergens',)  # ← удобный выбор при редактировании
+    inlines = (ServingInline, DishComponentInline)
 
     @admin.display(description='Аллергены')
     def show_allergens(self, obj):
         names = obj.allergens.values_list('name', flat=True)
         return ", ".join(names) if names else "—"
 
-
+@admin.register(MealEntry)
+class MealEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'name', 'portion', 'eaten_at', 'calories')
+    list_filter = ('eaten_on',)
+    search_fields = ('name',)
+    readonly_fields = ('id', 'eaten_on')
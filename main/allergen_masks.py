@@ -0,0 +1,196 @@
+"""
+Битовая маска аллергенов блюда.
+
+Каждому аллергену выдаётся номер бита, уникальный среди аллергенов,
+видимых одному пользователю (глобальные и его собственные).
+В ``Dish.allergen_mask`` хранится объединение битов аллергенов блюда,
+поэтому исключение аллергенов сводится к условию по одной колонке
+без JOIN и DISTINCT. Аллергены, которым бит не достался,
+фильтруются по-старому через связь ManyToMany.
+
+Бит выдаётся уже сохранённому аллергену в транзакции, которая сначала
+увеличивает счётчик ``CacheVersion`` области ``MASK_BITS_SCOPE``:
+UPDATE этой строки держит блокировку до фиксации, поэтому
+одновременные выдачи идут по очереди и не видят один и тот же
+свободный бит. Ограничения модели дополнительно не дают двум
+глобальным аллергенам (или двум аллергенам одного пользователя)
+получить одинаковый бит.
+"""
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.lookups import Exact
+
+# Используются биты 0..62, чтобы маска оставалась положительным BIGINT.
+MASK_BITS = 63
+
+# Строка-счётчик, на которой выдачи битов выстраиваются в очередь.
+MASK_BITS_SCOPE = 'allergen-mask-bits'
+
+
+def _first_free_bit(used):
+    for bit in range(MASK_BITS):
+        if bit not in used:
+            return bit
+    return None
+
+
+def allocate_mask_bit(allergen, allergen_model=None):
+    """
+    Подбирает свободный бит для нового аллергена.
+
+    Бит глобального аллергена не должен совпадать ни с одним
+    существующим битом, бит пользовательского — с битами глобальных
+    аллергенов и остальных аллергенов этого пользователя.
+    Возвращает ``None``, если свободных битов не осталось.
+    """
+    allergen_model = allergen_model or type(allergen)
+    taken = allergen_model.objects.exclude(mask_bit=None)
+    if allergen.pk is not None:
+        taken = taken.exclude(pk=allergen.pk)
+    if not allergen.is_global:
+        taken = taken.filter(
+            Q(is_global=True) | Q(created_by_id=allergen.created_by_id)
+        )
+    return _first_free_bit(set(taken.values_list('mask_bit', flat=True)))
+
+
+def lock_mask_bits():
+    """
+    Блокирует выдачу битов другими транзакциями до фиксации текущей.
+    """
+    from .caching import bump_versions
+    bump_versions(MASK_BITS_SCOPE)
+
+
+def assign_mask_bit(allergen, allergen_model=None, lock=True):
+    """
+    Выдаёт сохранённому аллергену свободный бит и записывает его в базу.
+
+    ``lock=False`` — без блокировки, когда параллельных выдач
+    быть не может (миграции). Возвращает бит или ``None``.
+    """
+    allergen_model = allergen_model or type(allergen)
+    with transaction.atomic():
+        if lock:
+            lock_mask_bits()
+        bit = allocate_mask_bit(allergen, allergen_model)
+        if bit is not None:
+            allergen_model.objects.filter(pk=allergen.pk).update(mask_bit=bit)
+    allergen.mask_bit = bit
+    return bit
+
+
+def update_dish_masks(dish_ids, dish_model=None):
+    """
+    Пересчитывает маски аллергенов для указанных блюд.
+    """
+    if dish_model is None:
+        from .models import Dish
+        dish_model = Dish
+
+    dish_ids = list(dish_ids)
+    if not dish_ids:
+        return {}
+
+    through = dish_model.allergens.through
+    masks = dict.fromkeys(dish_ids, 0)
+    rows = through.objects.filter(
+        dish_id__in=dish_ids,
+        allergen__mask_bit__isnull=False
+    ).values_list('dish_id', 'allergen__mask_bit')
+    for dish_id, bit in rows:
+        masks[dish_id] |= 1 << bit
+
+    by_mask = {}
+    for dish_id, mask in masks.items():
+        by_mask.setdefault(mask, []).append(dish_id)
+    for mask, ids in by_mask.items():
+        dish_model.objects.filter(pk__in=ids).update(allergen_mask=mask)
+
+    return masks
+
+
+def clear_mask_bit(allergen, dish_model=None):
+    """
+    Снимает бит удаляемого аллергена с масок всех блюд.
+    """
+    if allergen.mask_bit is None:
+        return
+    if dish_model is None:
+        from .models import Dish
+        dish_model = Dish
+    dish_model.objects.filter(allergens=allergen).update(
+        allergen_mask=F('allergen_mask').bitand(~(1 << allergen.mask_bit))
+    )
+
+
+def parse_allergen_ids(values):
+    """
+    Разбирает идентификаторы исключаемых аллергенов из параметров запроса.
+
+    Если хотя бы одно значение не число, исключение не применяется.
+    """
+    try:
+        return [int(value) for value in values]
+    except (ValueError, TypeError):
+        return []
+
+
+def exclude_dishes_with_allergens(queryset, allergen_ids, available_allergens):
+    """
+    Исключает из queryset блюда с любым из указанных аллергенов.
+
+    ``available_allergens`` — аллергены, видимые владельцу блюд;
+    идентификаторы, которых среди них нет, игнорируются, поскольку
+    биты уникальны только в пределах одного пользователя.
+    """
+    allergen_ids = set(allergen_ids)
+    mask = 0
+    unmasked = []
+    for allergen in available_allergens:
+        if allergen.pk not in allergen_ids:
+            continue
+        if allergen.mask_bit is None:
+            unmasked.append(allergen.pk)
+        else:
+            mask |= 1 << allergen.mask_bit
+
+    if mask:
+        queryset = queryset.filter(
+            Exact(F('allergen_mask').bitand(mask), 0)
+        )
+    if unmasked:
+        queryset = queryset.exclude(allergens__in=unmasked)
+    return queryset
+
+
+def backfill_allergen_masks(allergen_model, dish_model, batch_size=1000, lock=False):
+    """
+    Выдаёт биты аллергенам без бита и пересчитывает маски всех блюд.
+
+    ``lock`` — выдавать биты под блокировкой ``lock_mask_bits``
+    (при запуске на работающем сервере).
+    Возвращает пару (число аллергенов с новым битом, число блюд).
+    """
+    assigned = 0
+    for allergen in allergen_model.objects.filter(
+        mask_bit=None
+    ).order_by('-is_global', 'pk'):
+        if assign_mask_bit(allergen, allergen_model, lock=lock) is not None:
+            assigned += 1
+
+    updated = 0
+    dish_ids = dish_model.objects.order_by('pk').values_list('pk', flat=True)
+    batch = []
+    for dish_id in dish_ids.iterator(chunk_size=batch_size):
+        batch.append(dish_id)
+        if len(batch) >= batch_size:
+            update_dish_masks(batch, dish_model)
+            updated += len(batch)
+            batch = []
+    if batch:
+        update_dish_masks(batch, dish_model)
+        updated += len(batch)
+
+    return assigned, updated
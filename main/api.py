@@ -0,0 +1,249 @@
+"""
+JSON API для блюд и аллергенов.
+
+Списки блюд фильтруются и сортируются так же, как страница
+``DishesListView``, и листаются курсорами. Параметр ``fields``
+ограничивает набор полей в ответе и столбцов в запросе.
+Каждый ответ несёт сильный ETag, построенный по версиям данных
+пользователя (``CacheVersion``); при совпадении с ``If-None-Match``
+ответ 304 отдаётся без единого запроса к блюдам.
+"""
+
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags, quote_etag
+from django.views.generic import View
+
+from .caching import normalized_query, request_data_versions
+from .catalog import get_available_allergens
+from .models import Allergen, Dish
+from .pagination import CursorPaginator, InvalidCursor
+from .views import DishFilterMixin
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# Поле ответа -> столбцы модели, которые для него нужны.
+DISH_FIELDS = {
+    'id': ('id',),
+    'name': ('name',),
+    'description': ('description',),
+    'calories': ('calories',),
+    'proteins': ('proteins',),
+    'fats': ('fats',),
+    'carbohydrates': ('carbohydrates',),
+    'weight_grams': ('weight_grams',),
+    'calories_100g': ('calories_100g',),
+    'proteins_100g': ('proteins_100g',),
+    'fats_100g': ('fats_100g',),
+    'carbohydrates_100g': ('carbohydrates_100g',),
+    'url': ('url',),
+    'created_at': ('created_at',),
+    'allergens': (),
+    'photo': ('photo', 'photo_renditions', 'photo_status'),
+}
+
+ALLERGEN_FIELDS = ('id', 'name', 'is_global')
+
+
+class ApiError(Exception):
+    """Ошибка запроса, которая возвращается клиенту с кодом ``status``."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_fields(request, available):
+    """
+    Возвращает список запрошенных полей из параметра ``fields``.
+
+    Без параметра возвращаются все поля.
+    """
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(available)
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ApiError('Неизвестные поля: ' + ', '.join(unknown))
+    return list(dict.fromkeys(fields))
+
+
+def parse_limit(request):
+    """
+    Возвращает размер страницы из параметра ``limit``.
+    """
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit должен быть целым числом')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def serialize_dish(dish, fields):
+    """
+    Возвращает представление блюда с указанными полями.
+    """
+    data = {}
+    for field in fields:
+        if field == 'allergens':
+            data[field] = [
+                {'id': allergen.pk, 'name': allergen.name}
+                for allergen in dish.allergens.all()
+            ]
+        elif field == 'photo':
+            data[field] = {
+                'url': dish.photo.url,
+                'thumb': dish.photo_thumb_url,
+                'medium': dish.photo_medium_url,
+                'status': dish.photo_status,
+            } if dish.photo else None
+        else:
+            data[field] = getattr(dish, field)
+    return data
+
+
+def serialize_allergen(allergen, fields):
+    """
+    Возвращает представление аллергена с указанными полями.
+    """
+    return {field: getattr(allergen, field) for field in fields}
+
+
+def version_etag(request):
+    """
+    Возвращает сильный ETag ответа, не выполняя сам запрос.
+
+    Тело ответа однозначно определяется адресом, параметрами
+    и версиями данных пользователя, поэтому их хеш меняется
+    тогда и только тогда, когда может измениться тело.
+    """
+    parts = [
+        *map(str, request_data_versions(request)),
+        str(request.user.pk),
+        request.path,
+        normalized_query(request.GET),
+    ]
+    return quote_etag(hashlib.sha256(':'.join(parts).encode()).hexdigest()[:32])
+
+
+def not_modified(request, etag):
+    """
+    Проверяет, что у клиента уже есть ответ с этим ETag.
+    """
+    return etag in parse_etags(request.headers.get('If-None-Match', ''))
+
+
+def _with_validators(response, etag):
+    response['ETag'] = etag
+    # Ответ зависит от пользователя и не должен попадать в общие кеши.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def json_response(etag, data):
+    """
+    Возвращает JSON-ответ с ETag.
+    """
+    body = json.dumps(
+        data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')
+    ).encode()
+    return _with_validators(
+        HttpResponse(body, content_type='application/json'), etag
+    )
+
+
+class ApiView(View):
+    """
+    Базовое представление API: только чтение, вход по сессии,
+    ошибки в виде JSON.
+    """
+
+    http_method_names = ['get', 'head', 'options']
+    query_budget = 5
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Требуется вход'}, status=401)
+        self.etag = version_etag(request)
+        if request.method in ('GET', 'HEAD') and not_modified(request, self.etag):
+            return _with_validators(HttpResponseNotModified(), self.etag)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as exc:
+            return JsonResponse({'error': str(exc)}, status=exc.status)
+
+
+class DishQueryMixin(DishFilterMixin):
+    """
+    Выбирает блюда пользователя только со столбцами запрошенных полей.
+    """
+
+    def get_dish_queryset(self, fields):
+        columns = {'id'}
+        for field in fields:
+            columns.update(DISH_FIELDS[field])
+        queryset = Dish.objects.filter(user=self.request.user)
+        if 'allergens' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('allergens', queryset=Allergen.objects.only('id', 'name'))
+            )
+        return queryset, columns
+
+
+class DishListApiView(DishQueryMixin, ApiView):
+    """
+    Список блюд: ``GET /api/dishes/?fields=…&limit=…&cursor=…``
+    и те же параметры фильтрации, что у страницы блюд.
+    """
+
+    def get(self, request, *args, **kwargs):
+        fields = parse_fields(request, DISH_FIELDS)
+        queryset, columns = self.get_dish_queryset(fields)
+        sort_key = self.get_sort_key()
+        columns.add(sort_key.lstrip('-'))
+        queryset = self.filter_dishes(queryset.only(*columns))
+
+        paginator = CursorPaginator(queryset, sort_key, parse_limit(request))
+        try:
+            page = paginator.get_page(request.GET.get('cursor'))
+        except InvalidCursor as exc:
+            raise ApiError(str(exc))
+
+        return json_response(self.etag, {
+            'results': [serialize_dish(dish, fields) for dish in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        })
+
+
+class DishDetailApiView(DishQueryMixin, ApiView):
+    """
+    Одно блюдо: ``GET /api/dishes/<id>/?fields=…``.
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        fields = parse_fields(request, DISH_FIELDS)
+        queryset, columns = self.get_dish_queryset(fields)
+        dish = queryset.only(*columns).filter(pk=pk).first()
+        if dish is None:
+            raise ApiError('Блюдо не найдено', status=404)
+        return json_response(self.etag, serialize_dish(dish, fields))
+
+
+class AllergenListApiView(ApiView):
+    """
+    Аллергены, доступные пользователю: глобальные и его собственные.
+    """
+
+    def get(self, request, *args, **kwargs):
+        fields = parse_fields(request, ALLERGEN_FIELDS)
+        allergens = get_available_allergens(request.user, request_data_versions(request))
+        return json_response(self.etag, {
+            'results': [serialize_allergen(allergen, fields) for allergen in allergens],
+        })
@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        """
+        Подключает обработчики сигналов приложения.
+        """
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import signals  # noqa: F401
+        from .instrumentation import install_query_collector
+        from .search import ensure_search_index, register_sqlite_functions
+
+        connection_created.connect(register_sqlite_functions)
+        connection_created.connect(install_query_collector)
+        post_migrate.connect(ensure_search_index, sender=self)
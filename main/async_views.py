@@ -0,0 +1,233 @@
+"""
+Асинхронные версии страниц только для чтения.
+
+Под ASGI синхронное представление целиком выполняется в потоке
+``sync_to_async``; эти версии работают в цикле событий и обращаются
+к базе через асинхронный ORM Django. Независимые запросы (страница
+блюд, статистика, справочник аллергенов) запускаются одновременно
+через ``asyncio.gather``. Запись (POST) выполняют прежние синхронные
+представления, поэтому контекст шаблонов и результат совпадают
+с синхронными версиями.
+
+Подключаются вместо синхронных при ``ASYNC_READ_VIEWS = True``
+(переменная окружения ``FOOD_DIARY_ASYNC_VIEWS=1``). По умолчанию
+выключены и под ASGI: на SQLite они медленнее синхронных.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import InvalidPage
+from django.http import Http404
+from django.template.response import TemplateResponse
+
+from . import views
+from .caching import request_data_versions
+from .catalog import get_available_allergens
+from .forms import GlobalAllergenForm, UserAllergenForm
+from .instrumentation import query_budget
+from .models import Allergen, UserNutritionSummary
+from .pagination import CursorPaginator, InvalidCursor
+
+
+async def resolve_user(request):
+    """
+    Загружает пользователя запроса и подставляет его в ``request.user``,
+    чтобы дальнейший код не обращался к базе синхронно.
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+async def aget_summary(user):
+    """
+    Асинхронный вариант ``nutrition.get_summary``.
+    """
+    summary = await UserNutritionSummary.objects.filter(user=user).afirst()
+    return summary or UserNutritionSummary(user=user)
+
+
+async def aget_available_allergens(request):
+    versions = await sync_to_async(request_data_versions)(request)
+    return await sync_to_async(get_available_allergens)(request.user, versions)
+
+
+class DishesListView(views.DishesListView):
+    """
+    Асинхронный список блюд.
+
+    Фильтры, сортировка, пагинация, кеш страниц и контекст шаблона —
+    те же, что у синхронной версии; отличается только получение данных.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await resolve_user(request)
+        if not user.is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        # Исключение аллергенов строится по справочнику,
+        # поэтому тогда он нужен до запроса блюд.
+        if request.GET.getlist('exclude_allergens'):
+            self._available_allergens = await aget_available_allergens(request)
+            pending_catalog = None
+        else:
+            pending_catalog = aget_available_allergens(request)
+
+        self.object_list = self.get_queryset()
+        tasks = [self.aget_dish_stats(), self.aget_page_rows()]
+        if pending_catalog is not None:
+            tasks.append(pending_catalog)
+        stats, rows, *catalog = await asyncio.gather(*tasks)
+
+        self._dish_stats = stats
+        if catalog:
+            self._available_allergens = catalog[0]
+        self._page = self.build_page(rows)
+        context = self.get_context_data()
+        return self.render_to_response(context)
+
+    async def aget_dish_stats(self):
+        if not self.has_active_filters():
+            return (await aget_summary(self.request.user)).as_stats()
+        row = await self.object_list.order_by().aaggregate(**self.get_stats_aggregates())
+        return self.stats_from_row(row)
+
+    def requested_page_number(self):
+        """
+        Номер страницы, если его можно узнать без подсчёта блюд.
+        """
+        page = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        try:
+            number = int(page)
+        except (TypeError, ValueError):
+            return None
+        return number if number >= 1 else None
+
+    async def aget_page_rows(self):
+        """
+        Загружает блюда страницы вместе с аллергенами.
+
+        В курсорном режиме возвращает готовый результат
+        ``paginate_queryset``; при номере
+        вида «last» возвращает ``None`` — страница выбирается после
+        подсчёта блюд.
+        """
+        if self.is_cursor_pagination():
+            paginator = CursorPaginator(self.object_list, self.get_sort_key(), self.paginate_by)
+            try:
+                page = await sync_to_async(paginator.get_page)(self.request.GET.get('cursor'))
+            except InvalidCursor as exc:
+                raise Http404(str(exc))
+            return (paginator, page, page.object_list, page.has_other_pages())
+
+        number = self.requested_page_number()
+        if number is None:
+            return None
+        offset = (number - 1) * self.paginate_by
+        return [dish async for dish in self.object_list[offset:offset + self.paginate_by]]
+
+    def build_page(self, rows):
+        """
+        Собирает результат ``paginate_queryset`` из загруженных данных.
+        """
+        if self.is_cursor_pagination():
+            return rows
+
+        paginator = self.get_paginator(
+            self.object_list, self.paginate_by,
+            orphans=self.get_paginate_orphans(),
+            allow_empty_first_page=self.get_allow_empty(),
+        )
+        page_number = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        if page_number == 'last':
+            page_number = paginator.num_pages
+        try:
+            page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise Http404(f'Неверная страница ({page_number}): {exc}')
+        if rows is not None:
+            page.object_list = rows
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def paginate_queryset(self, queryset, page_size):
+        page = getattr(self, '_page', None)
+        if page is not None:
+            return page
+        return super().paginate_queryset(queryset, page_size)
+
+
+@query_budget(4)
+@login_required
+async def profile_view(request):
+    """
+    Асинхронная страница профиля.
+    """
+    user = await resolve_user(request)
+    summary = await aget_summary(user)
+
+    top_usage = sorted(
+        summary.allergen_usage.items(),
+        key=lambda item: item[1],
+        reverse=True
+    )[:5]
+    names = {
+        pk: name async for pk, name in Allergen.objects.filter(
+            pk__in=[int(pk) for pk, _ in top_usage]
+        ).values_list('pk', 'name')
+    } if top_usage else {}
+
+    return TemplateResponse(request, 'main/profile.html', {
+        'dish_stats': summary.as_stats(),
+        'top_allergens': [
+            {'name': names[int(pk)], 'count': count}
+            for pk, count in top_usage if int(pk) in names
+        ],
+    })
+
+
+@query_budget(3)
+@login_required
+async def admin_create_allergen(request):
+    """
+    Асинхронный просмотр глобальных аллергенов; создание
+    выполняет синхронное представление.
+    """
+    if request.method == 'POST':
+        return await sync_to_async(views.admin_create_allergen)(request)
+
+    user = await resolve_user(request)
+    allergens = [
+        allergen async for allergen in Allergen.objects.filter(
+            is_global=True
+        ).select_related('created_by').order_by('name')
+    ]
+    return TemplateResponse(request, 'main/admin_create_allergen.html', {
+        'form': GlobalAllergenForm() if user.is_staff else None,
+        'allergens': allergens,
+    })
+
+
+@query_budget(3)
+@login_required
+async def user_create_allergen(request):
+    """
+    Асинхронный просмотр личных аллергенов; создание
+    выполняет синхронное представление.
+    """
+    if request.method == 'POST':
+        return await sync_to_async(views.user_create_allergen)(request)
+
+    user = await resolve_user(request)
+    allergens = [
+        allergen async for allergen in Allergen.objects.filter(
+            is_global=False,
+            created_by=user
+        ).order_by('name')
+    ]
+    return TemplateResponse(request, 'main/user_create_allergen.html', {
+        'form': UserAllergenForm(user=user),
+        'allergens': allergens,
+    })
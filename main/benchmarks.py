@@ -0,0 +1,467 @@
+"""
+Синтетические данные и замеры производительности на реальных адресах.
+
+``seed_benchmark_data`` создаёт пользователей ``bench_*`` с глобальными
+и личными аллергенами и блюдами. Число блюд у пользователей распределено
+логнормально: у большинства их немного, у нескольких — на порядок больше,
+как в живой базе. Генератор детерминирован: при одном ``seed`` данные
+совпадают, и результаты разных коммитов можно сравнивать.
+
+``run_benchmarks`` проходит сценарии через тестовый клиент Django
+со всеми middleware и пишет в JSON медиану и 95-й перцентиль
+времени ответа, число запросов и пик памяти для каждого сценария.
+"""
+
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .caching import bump_global_version
+from .models import Allergen, Dish
+from .nutrition import rebuild_summaries
+
+BENCH_PREFIX = 'bench_'
+BENCH_PASSWORD = 'bench-password'
+
+GLOBAL_ALLERGEN_NAMES = (
+    'Молоко', 'Яйца', 'Арахис', 'Орехи', 'Соя', 'Пшеница', 'Рыба',
+    'Моллюски', 'Ракообразные', 'Кунжут', 'Горчица', 'Сельдерей',
+    'Люпин', 'Сульфиты', 'Мёд', 'Цитрусовые', 'Клубника', 'Шоколад',
+)
+
+DISH_BASES = (
+    'Суп', 'Борщ', 'Салат', 'Каша', 'Омлет', 'Паста', 'Плов', 'Рагу',
+    'Запеканка', 'Котлеты', 'Блины', 'Сырники', 'Пирог', 'Смузи', 'Гуляш',
+    'Ризотто', 'Драники', 'Пельмени', 'Вареники', 'Шашлык',
+)
+DISH_INGREDIENTS = (
+    'с курицей', 'с говядиной', 'с грибами', 'с сыром', 'с овощами',
+    'с лососем', 'с тыквой', 'с рисом', 'с гречкой', 'с творогом',
+    'с ягодами', 'с фасолью', 'с индейкой', 'с картофелем', 'со шпинатом',
+)
+DISH_STYLES = ('', 'домашний', 'по-деревенски', 'острый', 'лёгкий', 'праздничный')
+
+
+def bench_users():
+    return get_user_model().objects.filter(username__startswith=BENCH_PREFIX)
+
+
+def clear_benchmark_data():
+    """
+    Удаляет пользователей ``bench_*`` вместе с их блюдами и аллергенами.
+    """
+    users = bench_users()
+    Dish.objects.filter(user__in=users).delete()
+    Allergen.objects.filter(created_by__in=users).delete()
+    return users.delete()[1].get(get_user_model()._meta.label, 0)
+
+
+def _dish_counts(rng, users, median, max_dishes):
+    """
+    Логнормальное распределение числа блюд по пользователям.
+    """
+    mu = math.log(max(median, 1))
+    return [
+        min(max_dishes, max(1, int(rng.lognormvariate(mu, 1.0))))
+        for _ in range(users)
+    ]
+
+
+def _dish_name(rng):
+    name = f'{rng.choice(DISH_BASES)} {rng.choice(DISH_INGREDIENTS)}'
+    style = rng.choice(DISH_STYLES)
+    return f'{name} {style}'.strip()
+
+
+def _maybe(rng, value, missing=0.1):
+    return None if rng.random() < missing else value
+
+
+def _macros(rng):
+    proteins = round(rng.uniform(0, 40), 1)
+    fats = round(rng.uniform(0, 35), 1)
+    carbohydrates = round(rng.uniform(0, 90), 1)
+    calories = round(proteins * 4 + fats * 9 + carbohydrates * 4, 1)
+    return {
+        'calories': _maybe(rng, calories),
+        'proteins': _maybe(rng, proteins),
+        'fats': _maybe(rng, fats),
+        'carbohydrates': _maybe(rng, carbohydrates),
+    }
+
+
+def seed_benchmark_data(users=50, median_dishes=40, max_dishes=5000,
+                        user_allergens=3, seed=1, batch_size=1000, stdout=None):
+    """
+    Создаёт синтетических пользователей, аллергены и блюда.
+
+    Возвращает словарь с числом созданных объектов.
+    """
+    rng = random.Random(seed)
+    User = get_user_model()
+    now = timezone.now()
+
+    staff, _ = User.objects.get_or_create(
+        username=f'{BENCH_PREFIX}staff',
+        defaults={'is_staff': True, 'password': make_password(BENCH_PASSWORD)}
+    )
+    global_allergens = []
+    for name in GLOBAL_ALLERGEN_NAMES:
+        allergen = Allergen.objects.filter(is_global=True, name=name).first()
+        if allergen is None:
+            # Через save(), чтобы аллерген получил бит маски.
+            allergen = Allergen.objects.create(name=name, is_global=True, created_by=staff)
+        global_allergens.append(allergen)
+
+    # Хеш пароля вычисляется один раз: он намеренно медленный.
+    password = make_password(BENCH_PASSWORD)
+    counts = _dish_counts(rng, users, median_dishes, max_dishes)
+    created = {'users': 0, 'allergens': 0, 'dishes': 0}
+    through = Dish.allergens.through
+
+    for index, dish_count in enumerate(counts):
+        user = User.objects.create(
+            username=f'{BENCH_PREFIX}{seed}_{index:04d}', password=password
+        )
+        created['users'] += 1
+        own = [
+            Allergen.objects.create(
+                name=f'Личный аллерген {number + 1}',
+                is_global=False,
+                created_by=user
+            )
+            for number in range(rng.randint(0, user_allergens))
+        ]
+        created['allergens'] += len(own)
+        pool = global_allergens + own
+
+        remaining = dish_count
+        while remaining:
+            size = min(batch_size, remaining)
+            remaining -= size
+            dishes, links = [], []
+            for _ in range(size):
+                chosen = rng.sample(pool, k=min(len(pool), rng.choice((0, 0, 1, 1, 2, 3))))
+                dish = Dish(
+                    user=user,
+                    name=_dish_name(rng),
+                    description=_maybe(rng, 'Синтетическое блюдо для замеров', 0.5),
+                    **_macros(rng),
+                )
+                for allergen in chosen:
+                    if allergen.mask_bit is not None:
+                        dish.allergen_mask |= 1 << allergen.mask_bit
+                dishes.append(dish)
+                links.append(chosen)
+
+            with transaction.atomic():
+                dishes = Dish.objects.bulk_create(dishes)
+                # auto_now_add не даёт задать дату при вставке.
+                for dish in dishes:
+                    dish.created_at = now - timedelta(
+                        days=rng.uniform(0, 365), seconds=rng.randint(0, 86399)
+                    )
+                Dish.objects.bulk_update(dishes, ['created_at'], batch_size=batch_size)
+                through.objects.bulk_create([
+                    through(dish_id=dish.pk, allergen_id=allergen.pk)
+                    for dish, chosen in zip(dishes, links)
+                    for allergen in chosen
+                ], batch_size=batch_size)
+            created['dishes'] += size
+
+        if stdout is not None:
+            stdout.write(f'{user.username}: блюд {dish_count}')
+
+    rebuild_summaries(list(bench_users().values_list('pk', flat=True)))
+    bump_global_version()
+    return created
+
+
+class Scenario:
+    """
+    Один замеряемый запрос: метод, адрес и данные формы.
+
+    ``path``, ``params`` и ``data`` — значения или функции от контекста
+    с данными пользователя; ``requires`` — ключи контекста, без которых
+    сценарий пропускается. Запросы на запись выполняются в транзакции, которая откатывается,
+    чтобы повторы не меняли данные.
+    """
+
+    def __init__(self, name, path, params=None, method='get', data=None, requires=()):
+        self.name = name
+        self.path = path
+        self.params = params or {}
+        self.method = method
+        self.data = data
+        self.requires = requires
+
+    @property
+    def writes(self):
+        return self.method != 'get'
+
+    def request(self, client, context):
+        path = self.path(context) if callable(self.path) else reverse(self.path)
+        if self.writes:
+            return client.post(path, self.data(context) if self.data else {})
+        params = self.params(context) if callable(self.params) else self.params
+        return client.get(path, params)
+
+
+SORT_KEYS = (
+    '-created_at', 'created_at', 'name', '-name',
+    'calories', '-calories', 'proteins', '-proteins',
+    'fats', '-fats', 'carbohydrates', '-carbohydrates',
+)
+
+FILTER_PRESETS = {
+    'all': {},
+    'name': {'name': 'кур'},
+    'calories': {'calories_min': '200', 'calories_max': '500'},
+    'macros': {'protein_min': '10', 'fat_max': '20', 'carbs_max': '60'},
+    'created': lambda context: {
+        'created_after': (timezone.localdate() - timedelta(days=30)).isoformat(),
+    },
+    'allergens': lambda context: {'exclude_allergens': context['allergen_ids'][:3]},
+}
+
+
+def _with_sort(preset, sort_key):
+    def params(context):
+        values = preset(context) if callable(preset) else dict(preset)
+        return {**values, 'sort_by': sort_key}
+    return params
+
+
+def _dish_edit_path(context):
+    return reverse('dish_edit', args=[context['dish_id']])
+
+
+def default_scenarios():
+    """
+    Сценарии: список блюд со всеми сочетаниями фильтров и сортировок
+    и основные страницы приложения.
+    """
+    scenarios = [
+        Scenario(f'dishes[{filter_name}|{sort_key}]', 'dishes', _with_sort(preset, sort_key))
+        for filter_name, preset in FILTER_PRESETS.items()
+        for sort_key in SORT_KEYS
+    ]
+    scenarios += [
+        Scenario('dishes[cursor]', 'dishes', {'pagination': 'cursor'}),
+        Scenario('dishes[page 5]', 'dishes', {'page': '5'}),
+        Scenario('create_dish[get]', 'create_dish'),
+        Scenario('create_dish[post]', 'create_dish', method='post', data=lambda context: {
+            'name': 'Замер', 'calories': '250', 'allergens': context['allergen_ids'][:2],
+        }),
+        Scenario('dish_edit[get]', _dish_edit_path, requires=('dish_id',)),
+        Scenario(
+            'dish_edit[post]', _dish_edit_path, method='post',
+            data=lambda context: {'name': 'Замер', 'calories': '300'},
+            requires=('dish_id',),
+        ),
+        Scenario('user_create_allergen', 'user_create_allergen'),
+        Scenario('admin_create_allergen', 'admin_create_allergen'),
+        Scenario('profile', 'profile'),
+        Scenario('api_dishes', 'api_dishes', {'limit': '50'}),
+    ]
+    return scenarios
+
+
+def percentile(values, fraction):
+    """
+    Перцентиль с линейной интерполяцией между соседними значениями.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * fraction
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _send(scenario, client, context):
+    if scenario.writes:
+        with transaction.atomic():
+            response = scenario.request(client, context)
+            transaction.set_rollback(True)
+    else:
+        response = scenario.request(client, context)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{scenario.name}: ответ {response.status_code}')
+    return response
+
+
+def _measure(scenario, client, context):
+    start = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        _send(scenario, client, context)
+    return time.perf_counter() - start, len(queries)
+
+
+def _measure_memory(scenario, client, context):
+    """
+    Пик выделенной памяти за запрос в байтах.
+
+    Отдельным проходом: трассировка памяти замедляет Python
+    в несколько раз и исказила бы время ответа.
+    """
+    tracemalloc.start()
+    try:
+        _send(scenario, client, context)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_scenario(scenario, client, context, iterations=20, warmup=2):
+    """
+    Замеряет сценарий и возвращает сводку в миллисекундах и килобайтах.
+    """
+    for _ in range(warmup):
+        _send(scenario, client, context)
+    timings, query_counts = [], []
+    for _ in range(iterations):
+        elapsed, queries = _measure(scenario, client, context)
+        timings.append(elapsed * 1000)
+        query_counts.append(queries)
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': max(query_counts),
+        'peak_kb': round(_measure_memory(scenario, client, context) / 1024, 1),
+    }
+
+
+def benchmark_context(user):
+    """
+    Данные пользователя, которые подставляются в адреса и формы.
+    """
+    dish = Dish.objects.filter(user=user).order_by('-created_at').first()
+    allergen_ids = list(
+        Allergen.objects.filter(dish__user=user)
+        .annotate(uses=Count('dish')).order_by('-uses')
+        .values_list('pk', flat=True)[:5]
+    )
+    return {
+        'dish_id': dish.pk if dish else None,
+        'allergen_ids': allergen_ids,
+        'dish_count': Dish.objects.filter(user=user).count(),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(user, scenarios=None, iterations=20, warmup=2, stdout=None):
+    """
+    Прогоняет сценарии от имени пользователя и возвращает результаты.
+    """
+    scenarios = scenarios if scenarios is not None else default_scenarios()
+    context = benchmark_context(user)
+    client = Client()
+    client.force_login(user)
+
+    results = {}
+    for scenario in scenarios:
+        if any(context.get(key) is None for key in scenario.requires):
+            continue
+        results[scenario.name] = run_scenario(
+            scenario, client, context, iterations, warmup
+        )
+        if stdout is not None:
+            row = results[scenario.name]
+            stdout.write(
+                f"{scenario.name:<40} p50 {row['p50_ms']:8.2f} мс  "
+                f"p95 {row['p95_ms']:8.2f} мс  запросов {row['queries']:3d}  "
+                f"память {row['peak_kb']:8.1f} КБ"
+            )
+
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'created_at': timezone.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'user': user.username,
+            'dish_count': context['dish_count'],
+            'iterations': iterations,
+        },
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, threshold=0.2):
+    """
+    Сравнивает два прогона и возвращает строки с изменениями.
+
+    Регрессией считается рост p95 больше чем на ``threshold``
+    или любой рост числа запросов.
+    """
+    rows = []
+    for name, row in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        change = (row['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0
+        regression = change > threshold or row['queries'] > old['queries']
+        rows.append({
+            'name': name,
+            'p95_before': old['p95_ms'],
+            'p95_after': row['p95_ms'],
+            'p95_change': round(change, 3),
+            'queries_before': old['queries'],
+            'queries_after': row['queries'],
+            'regression': regression,
+        })
+    return rows
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as stream:
+        return json.load(stream)
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump(results, stream, ensure_ascii=False, indent=2)
+
+
+def default_benchmark_user():
+    """
+    Пользователь ``bench_*`` с наибольшим числом блюд.
+    """
+    return (
+        bench_users().filter(is_staff=False)
+        .annotate(dish_total=Count('dish'))
+        .order_by('-dish_total', 'pk').first()
+    )
+
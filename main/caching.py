@@ -0,0 +1,276 @@
+"""
+Кеш отрисованных страниц с версиями данных пользователя.
+
+Ключ записи складывается из пользователя, нормализованных
+GET-параметров и текущих версий его данных (``CacheVersion``).
+Изменение блюда или аллергена увеличивает версию одной строкой
+UPDATE, после чего старые записи перестают находиться и со временем
+вытесняются бэкендом, — устаревшая страница не отдаётся никогда.
+Подходит любой бэкенд Django: локальная память, файлы, Redis, Memcached.
+"""
+
+import hashlib
+import secrets
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse
+
+# Общие для всех пользователей данные (глобальные аллергены);
+# версия входит в ключ каждой страницы.
+GLOBAL_SCOPE = 'global'
+
+HITS_KEY = 'page-cache:hits'
+MISSES_KEY = 'page-cache:misses'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def allergens_scope(user_id):
+    # Меняется только вместе с личными аллергенами пользователя,
+    # в отличие от ``user_scope``, которую сдвигает и правка блюд.
+    return f'allergens:{user_id}'
+
+
+def get_page_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def get_versions(*scopes):
+    """
+    Возвращает версии областей одним запросом.
+
+    Область, которую ещё ни разу не меняли, имеет версию 0.
+    При первом изменении версия начинается со случайного числа.
+    """
+    from .models import CacheVersion
+
+    found = dict(
+        CacheVersion.objects.filter(scope__in=scopes).values_list('scope', 'version')
+    )
+    return tuple(found.get(scope, 0) for scope in scopes)
+
+
+def bump_versions(*scopes):
+    """
+    Увеличивает версии областей.
+    """
+    from .models import CacheVersion
+
+    for scope in dict.fromkeys(scopes):
+        updated = CacheVersion.objects.filter(scope=scope).update(
+            version=F('version') + 1
+        )
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                # Случайное начало: после отката или очистки таблицы
+                # номера не повторяют уже использованные в ключах.
+                CacheVersion.objects.create(
+                    scope=scope, version=secrets.randbelow(2 ** 48) + 1
+                )
+        except IntegrityError:
+            CacheVersion.objects.filter(scope=scope).update(
+                version=F('version') + 1
+            )
+
+
+def bump_user_versions(*user_ids):
+    """
+    Отмечает изменение данных пользователей.
+    """
+    bump_versions(*(user_scope(user_id) for user_id in user_ids if user_id is not None))
+
+
+def bump_global_version():
+    """
+    Отмечает изменение общих данных, например глобальных аллергенов.
+
+    Делает устаревшими страницы всех пользователей, поэтому
+    используется и после массовых исправлений данных.
+    """
+    bump_versions(GLOBAL_SCOPE)
+
+
+def bump_allergens_versions(*user_ids):
+    """
+    Отмечает изменение личных аллергенов пользователей.
+    """
+    bump_versions(*(allergens_scope(user_id) for user_id in user_ids if user_id is not None))
+
+
+def global_version():
+    """
+    Версия общих данных.
+    """
+    return get_versions(GLOBAL_SCOPE)[0]
+
+
+def user_data_versions(user_id):
+    """
+    Версии всех данных, от которых зависят страницы пользователя:
+    (данные пользователя, общие данные, личные аллергены).
+    """
+    return get_versions(user_scope(user_id), GLOBAL_SCOPE, allergens_scope(user_id))
+
+
+def request_data_versions(request):
+    """
+    Версии данных пользователя запроса; читаются один раз за запрос.
+    """
+    versions = getattr(request, '_data_versions', None)
+    if versions is None:
+        versions = request._data_versions = user_data_versions(request.user.pk)
+    return versions
+
+
+def normalized_query(query_dict, ignore=()):
+    """
+    Возвращает GET-параметры в каноническом виде: без пустых
+    значений, с упорядоченными ключами и значениями.
+    """
+    items = []
+    for key in sorted(query_dict):
+        if key in ignore:
+            continue
+        for value in sorted(query_dict.getlist(key)):
+            if value.strip():
+                items.append((key, value.strip()))
+    return urlencode(items)
+
+
+def _count(name):
+    cache = get_page_cache()
+    cache.add(name, 0, timeout=None)
+    try:
+        cache.incr(name)
+    except ValueError:
+        # Счётчик успели вытеснить между add и incr.
+        cache.set(name, 1, timeout=None)
+
+
+def page_cache_stats():
+    """
+    Возвращает число попаданий и промахов кеша страниц.
+    """
+    cache = get_page_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else None,
+    }
+
+
+def reset_page_cache_stats():
+    get_page_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+class VersionedPageCacheMixin:
+    """
+    Кеширует GET-ответ представления для пользователя.
+
+    Страница не кешируется и не берётся из кеша, пока у пользователя
+    есть непоказанные сообщения: они выводятся в шаблоне. Хеш секрета
+    CSRF входит в ключ, чтобы токены в формах страницы подходили
+    к cookie браузера, который её получает. Подходит и для асинхронных
+    представлений.
+    """
+
+    page_cache_prefix = None
+    page_cache_timeout = 300
+
+    def get_page_cache_key(self, request):
+        csrf_secret = request.META.get('CSRF_COOKIE', '')
+        parts = [
+            *map(str, request_data_versions(request)),
+            normalized_query(request.GET),
+            hashlib.sha256(csrf_secret.encode()).hexdigest()[:16],
+        ]
+        digest = hashlib.sha256(':'.join(parts).encode()).hexdigest()
+        prefix = self.page_cache_prefix or type(self).__name__
+        return f'page:{prefix}:{request.user.pk}:{digest}'
+
+    def can_use_page_cache(self, request):
+        return (
+            getattr(settings, 'PAGE_CACHE_ENABLED', True)
+            and request.method == 'GET'
+            # Без cookie CSRF страница выдала бы новый секрет,
+            # который нельзя отдать другим запросам из кеша.
+            and bool(request.META.get('CSRF_COOKIE'))
+            and request.user.is_authenticated
+            and not len(get_messages(request))
+        )
+
+    def _cached_response(self, cached):
+        _count(HITS_KEY)
+        content, content_type = cached
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Page-Cache'] = 'hit'
+        return response
+
+    def _store_response(self, request, key, response, csrf_secret):
+        """
+        Отрисовывает ответ и сохраняет его в кеш, если это возможно.
+        """
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        if (
+            response.status_code == 200
+            and not response.streaming
+            # Секрет CSRF сменился при отрисовке: ключ уже не тот.
+            and request.META.get('CSRF_COOKIE') == csrf_secret
+        ):
+            get_page_cache().set(
+                key,
+                (response.content, response['Content-Type']),
+                self.page_cache_timeout
+            )
+        response['X-Page-Cache'] = 'miss'
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if getattr(self, 'view_is_async', False):
+            return self._adispatch(request, *args, **kwargs)
+        if not self.can_use_page_cache(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = self.get_page_cache_key(request)
+        cached = get_page_cache().get(key)
+        if cached is not None:
+            return self._cached_response(cached)
+
+        _count(MISSES_KEY)
+        csrf_secret = request.META.get('CSRF_COOKIE')
+        response = super().dispatch(request, *args, **kwargs)
+        return self._store_response(request, key, response, csrf_secret)
+
+    async def _adispatch(self, request, *args, **kwargs):
+        """
+        То же для асинхронного представления: сессия, версии и кеш
+        читаются в потоке, чтобы не блокировать цикл событий.
+        """
+        if not await sync_to_async(self.can_use_page_cache)(request):
+            return await super().dispatch(request, *args, **kwargs)
+
+        key = await sync_to_async(self.get_page_cache_key)(request)
+        cached = await get_page_cache().aget(key)
+        if cached is not None:
+            return await sync_to_async(self._cached_response)(cached)
+
+        await sync_to_async(_count)(MISSES_KEY)
+        csrf_secret = request.META.get('CSRF_COOKIE')
+        response = await super().dispatch(request, *args, **kwargs)
+        return await sync_to_async(self._store_response)(
+            request, key, response, csrf_secret
+        )
@@ -0,0 +1,89 @@
+"""
+Кешированный справочник аллергенов, доступных пользователю.
+
+Глобальные аллергены одинаковы для всех, поэтому их список хранится
+в памяти процесса; список личных аллергенов пользователя — в кеше
+Django. Оба списка привязаны к версиям ``CacheVersion``: правка
+глобального аллергена увеличивает версию ``global``, правка личного —
+версию ``allergens:<id>``, которую не трогают правки блюд, и при
+следующем обращении список перечитывается. Ключ личного списка
+включает и версию ``global``, чтобы массовые исправления
+(``bump_global_version``) сбрасывали и его.
+
+Версия 0 означает, что строки версии нет (область ещё не менялась
+или таблицу очистили). Для глобального списка в памяти процесса
+она не используется как ключ: после очистки таблицы номер мог бы
+совпасть с уже виденным, поэтому такой список перечитывается.
+"""
+
+from django.core.cache import cache
+
+from .caching import global_version, user_data_versions
+from .models import Allergen
+
+USER_ALLERGENS_TIMEOUT = 24 * 60 * 60
+
+# Поля, которые нужны форме блюда и фильтрам списка.
+CATALOG_FIELDS = ('id', 'name', 'is_global', 'created_by', 'mask_bit')
+
+# (версия, список) глобальных аллергенов этого процесса.
+_global_allergens = (None, [])
+
+
+def _sort_key(allergen):
+    return (allergen.name, allergen.pk)
+
+
+def get_global_allergens(version):
+    """
+    Возвращает глобальные аллергены для версии ``version``.
+    """
+    global _global_allergens
+
+    cached_version, allergens = _global_allergens
+    if not version or cached_version != version:
+        allergens = sorted(
+            Allergen.objects.filter(is_global=True).only(*CATALOG_FIELDS),
+            key=_sort_key
+        )
+        if version:
+            _global_allergens = (version, allergens)
+    return allergens
+
+
+def get_user_allergens(user_id, version, shared_version=0):
+    """
+    Возвращает личные аллергены пользователя для версии
+    его аллергенов ``version`` и версии общих данных ``shared_version``.
+    """
+    key = f'allergens:user:{user_id}:{version}:{shared_version}'
+    allergens = cache.get(key)
+    if allergens is None:
+        allergens = sorted(
+            Allergen.objects.filter(
+                created_by_id=user_id, is_global=False
+            ).only(*CATALOG_FIELDS),
+            key=_sort_key
+        )
+        cache.set(key, allergens, USER_ALLERGENS_TIMEOUT)
+    return allergens
+
+
+def get_available_allergens(user, versions=None):
+    """
+    Возвращает глобальные и личные аллергены пользователя,
+    упорядоченные по названию.
+
+    ``versions`` — уже прочитанные версии данных пользователя
+    (см. ``request_data_versions``); без них версии читаются заново.
+    """
+    if user is None or not user.is_authenticated:
+        return list(get_global_allergens(global_version()))
+    _, shared_version, allergens_version = versions or user_data_versions(user.pk)
+    return sorted(
+        [
+            *get_global_allergens(shared_version),
+            *get_user_allergens(user.pk, allergens_version, shared_version),
+        ],
+        key=_sort_key
+    )
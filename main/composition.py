@@ -0,0 +1,193 @@
+"""
+Блюда-рецепты, собранные из других блюд.
+
+Связи ``DishComponent`` образуют ориентированный граф без циклов:
+рецепт → его части. Нутриенты рецепта — сумма нутриентов частей,
+умноженных на количество порций (неизвестный у части нутриент
+пропускается, у рецепта он неизвестен, только если неизвестен
+у всех частей). Аллергены рецепта — объединение аллергенов частей.
+Вес порции рецепта не пересчитывается: готовое блюдо обычно весит
+иначе, чем сумма сырых продуктов, и вес указывается вручную.
+
+Итоги хранятся в самих блюдах-рецептах. После фиксации транзакции,
+в которой изменились блюдо, его аллергены или состав рецепта,
+``update_compositions`` собирает всех предков изменённых блюд
+(по одному запросу на уровень графа), упорядочивает их топологически
+и пересчитывает каждый рецепт один раз после всех его частей.
+Рецепты сохраняются обычным ``save``, поэтому сводки, индекс похожих
+блюд, порции и кеш страниц обновляются как при ручной правке.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import MACRO_FIELDS, Dish, DishComponent
+
+
+class CompositionCycle(Exception):
+    """Связи рецептов образуют цикл."""
+
+
+def creates_cycle(parent_id, component_id):
+    """
+    Проверяет, что добавление части ``component_id`` в рецепт
+    ``parent_id`` замкнёт цикл: рецепт уже входит в состав части.
+    """
+    if parent_id == component_id:
+        return True
+    seen = {component_id}
+    frontier = {component_id}
+    while frontier:
+        children = set(DishComponent.objects.filter(
+            parent_id__in=frontier
+        ).values_list('component_id', flat=True))
+        if parent_id in children:
+            return True
+        frontier = children - seen
+        seen |= frontier
+    return False
+
+
+def collect_ancestors(dish_ids):
+    """
+    Возвращает ``dish_ids`` вместе со всеми рецептами,
+    в которые они входят прямо или через другие рецепты.
+    """
+    nodes = set(dish_ids)
+    frontier = set(nodes)
+    while frontier:
+        parents = set(DishComponent.objects.filter(
+            component_id__in=frontier
+        ).values_list('parent_id', flat=True))
+        frontier = parents - nodes
+        nodes |= frontier
+    return nodes
+
+
+def topological_order(recipes):
+    """
+    Упорядочивает рецепты ``{id: [id части, ...]}`` так, чтобы каждый
+    шёл после своих частей из того же словаря.
+
+    Вызывает ``CompositionCycle``, если упорядочить нельзя.
+    """
+    waiting = {
+        pk: {part for part in parts if part in recipes}
+        for pk, parts in recipes.items()
+    }
+    used_in = defaultdict(list)
+    for pk, parts in waiting.items():
+        for part in parts:
+            used_in[part].append(pk)
+
+    ready = sorted(pk for pk, parts in waiting.items() if not parts)
+    order = []
+    while ready:
+        pk = ready.pop()
+        order.append(pk)
+        for parent in used_in[pk]:
+            waiting[parent].discard(pk)
+            if not waiting[parent]:
+                ready.append(parent)
+    if len(order) != len(recipes):
+        raise CompositionCycle(
+            'Цикл в составе блюд: ' + ', '.join(
+                str(pk) for pk in sorted(set(recipes) - set(order))
+            )
+        )
+    return order
+
+
+def rolled_up(parts, values):
+    """
+    Суммирует нутриенты частей ``[(id, количество), ...]``
+    по значениям ``values`` (``{id: {нутриент: значение}}``).
+    """
+    totals = {}
+    for field in MACRO_FIELDS:
+        known = [
+            values[pk][field] * quantity
+            for pk, quantity in parts
+            if values[pk][field] is not None
+        ]
+        totals[field] = sum(known) if known else None
+    return totals
+
+
+def update_compositions(dish_ids):
+    """
+    Пересчитывает блюда-рецепты среди ``dish_ids`` и всех их предков.
+
+    Возвращает число изменённых рецептов.
+    """
+    nodes = collect_ancestors(dish_ids)
+    recipes = defaultdict(list)
+    for parent_id, component_id, quantity in DishComponent.objects.filter(
+        parent_id__in=nodes
+    ).values_list('parent_id', 'component_id', 'quantity'):
+        recipes[parent_id].append((component_id, quantity))
+    if not recipes:
+        return 0
+
+    order = topological_order({pk: [part for part, _ in parts] for pk, parts in recipes.items()})
+    involved = set(recipes).union(
+        part for parts in recipes.values() for part, _ in parts
+    )
+    values = {
+        row.pop('pk'): row
+        for row in Dish.objects.filter(pk__in=involved).values('pk', *MACRO_FIELDS)
+    }
+    allergens = defaultdict(set)
+    for dish_id, allergen_id in Dish.allergens.through.objects.filter(
+        dish_id__in=involved
+    ).values_list('dish_id', 'allergen_id'):
+        allergens[dish_id].add(allergen_id)
+    dishes = Dish.objects.in_bulk(list(recipes))
+
+    updated = 0
+    with transaction.atomic():
+        for pk in order:
+            dish = dishes.get(pk)
+            if dish is None:
+                continue
+            parts = [(part, quantity) for part, quantity in recipes[pk] if part in values]
+            totals = rolled_up(parts, values)
+            union = set().union(*(allergens[part] for part, _ in parts))
+            values[pk] = totals
+
+            # Рецепт сохраняется без повторного запуска пересчёта:
+            # его предки уже стоят дальше в этом же порядке.
+            dish._composition_update = True
+            changed = False
+            if any(getattr(dish, field) != totals[field] for field in MACRO_FIELDS):
+                for field, value in totals.items():
+                    setattr(dish, field, value)
+                dish.save()
+                changed = True
+            if union != allergens[pk]:
+                dish.allergens.set(union)
+                allergens[pk] = union
+                changed = True
+            updated += changed
+    return updated
+
+
+def schedule_update(*dish_ids):
+    """
+    Пересчитывает рецепты, зависящие от ``dish_ids``,
+    после фиксации текущей транзакции.
+    """
+    ids = [pk for pk in dict.fromkeys(dish_ids) if pk is not None]
+    if ids:
+        transaction.on_commit(lambda: update_compositions(ids))
+
+
+def rebuild_compositions(user_ids=None):
+    """
+    Пересчитывает все блюда-рецепты (или рецепты пользователей ``user_ids``).
+    """
+    recipes = DishComponent.objects.all()
+    if user_ids is not None:
+        recipes = recipes.filter(parent__user_id__in=user_ids)
+    return update_compositions(set(recipes.values_list('parent_id', flat=True)))
@@ -0,0 +1,216 @@
+"""
+Потоковая выгрузка блюд в CSV, JSON Lines и XLSX.
+
+Каждый формат — генератор фрагментов ответа: блюда читаются из
+queryset итератором по частям, поэтому расход памяти не зависит
+от числа блюд. XLSX собирается прямо в поток: ZIP-архив пишется
+без перемотки, а строки листа — как inline-строки без общей
+таблицы строк, которую пришлось бы держать в памяти.
+"""
+
+import csv
+import json
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import MACRO_FIELDS
+
+EXPORT_COLUMNS = (
+    ('name', 'Название'),
+    ('description', 'Описание'),
+    ('weight_grams', 'Вес порции, г'),
+    ('calories', 'Калории'),
+    ('proteins', 'Белки'),
+    ('fats', 'Жиры'),
+    ('carbohydrates', 'Углеводы'),
+    ('created_at', 'Дата добавления'),
+    ('allergens', 'Аллергены'),
+)
+
+# Сколько строк собирать перед отправкой очередного фрагмента.
+ROWS_PER_CHUNK = 500
+
+
+def dish_row(dish):
+    """
+    Возвращает данные блюда для выгрузки в виде словаря.
+    """
+    row = {
+        'name': dish.name,
+        'description': dish.description or '',
+        'weight_grams': dish.weight_grams,
+        'created_at': timezone.localtime(dish.created_at).isoformat(timespec='seconds'),
+        'allergens': [allergen.name for allergen in dish.allergens.all()],
+    }
+    for field in MACRO_FIELDS:
+        row[field] = getattr(dish, field)
+    return row
+
+
+def _chunked(dishes):
+    chunk = []
+    for dish in dishes:
+        chunk.append(dish_row(dish))
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Echo:
+    """
+    Псевдофайл для csv.writer: возвращает записанную строку.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_csv(dishes):
+    """
+    Выгрузка в CSV с BOM, чтобы Excel распознал UTF-8.
+    """
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow([title for _, title in EXPORT_COLUMNS])
+    for chunk in _chunked(dishes):
+        lines = []
+        for row in chunk:
+            row['allergens'] = '; '.join(row['allergens'])
+            lines.append(writer.writerow(
+                ['' if row[key] is None else row[key] for key, _ in EXPORT_COLUMNS]
+            ))
+        yield ''.join(lines)
+
+
+def export_jsonl(dishes):
+    """
+    Выгрузка в JSON Lines: одно блюдо — одна строка.
+    """
+    for chunk in _chunked(dishes):
+        yield ''.join(
+            json.dumps(row, ensure_ascii=False) + '\n' for row in chunk
+        )
+
+
+class _ZipStream:
+    """
+    Файлоподобный буфер без перемотки, из которого забираются
+    уже записанные байты ZIP-архива.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Блюда" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_INVALID.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def export_xlsx(dishes):
+    """
+    Выгрузка в XLSX с одним листом.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        yield stream.pop()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>'
+                + _xlsx_row(title for _, title in EXPORT_COLUMNS)
+            ).encode())
+            for chunk in _chunked(dishes):
+                rows = []
+                for row in chunk:
+                    row['allergens'] = '; '.join(row['allergens'])
+                    rows.append(_xlsx_row(row[key] for key, _ in EXPORT_COLUMNS))
+                sheet.write(''.join(rows).encode())
+                yield stream.pop()
+            sheet.write(b'</sheetData></worksheet>')
+    yield stream.pop()
+
+
+# Формат -> (генератор, MIME-тип, расширение файла).
+EXPORT_FORMATS = {
+    'csv': (export_csv, 'text/csv; charset=utf-8', 'csv'),
+    'jsonl': (export_jsonl, 'application/x-ndjson; charset=utf-8', 'jsonl'),
+    'xlsx': (
+        export_xlsx,
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'xlsx',
+    ),
+}
@@ -1,7 +1,10 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import Allergen, Dish
+from .catalog import get_available_allergens
+from .composition import creates_cycle
+from .models import MACRO_FIELDS, Allergen, Dish, DishComponent, MealEntry, Serving
+from .portions import BASIS_100G, BASIS_CHOICES, BASIS_SERVING
 import os
 
 class UserAdminForm(forms.ModelForm):
@@ -167,10 +170,26 @@ class DishForm(forms.ModelForm):
         })
     )
 
-    def __init__(self, *args, user=None, **kwargs):
+    basis = forms.ChoiceField(
+        label='Нутриенты указаны',
+        choices=BASIS_CHOICES,
+        initial=BASIS_SERVING,
+        required=False,
+        help_text='Значения на 100 г пересчитываются на порцию по её весу'
+    )
+
+    field_order = [
+        'name', 'description', 'photo', 'weight_grams', 'basis',
+        'calories', 'proteins', 'fats', 'carbohydrates',
+    ]
+
+    def __init__(self, *args, user=None, versions=None, **kwargs):
         """
         Инициализирует форму и настраивает список аллергенов
         в зависимости от пользователя.
+
+        ``versions`` — версии данных пользователя, если они уже
+        прочитаны в этом запросе.
         """
         super().__init__(*args, **kwargs)
 
@@ -181,22 +200,46 @@ class DishForm(forms.ModelForm):
                 Allergen.objects.filter(created_by=user)
             )
 
+        # Queryset нужен только для проверки отправленных значений,
+        # список для отрисовки берётся из кешированного справочника.
         self.fields['allergens'].queryset = base_qs.order_by('name')
+        self.available_allergens = get_available_allergens(user, versions=versions)
+        self.fields['allergens'].choices = [
+            (allergen.pk, allergen.name) for allergen in self.available_allergens
+        ]
 
         self.fields['photo'].help_text = (
             'Загрузите фотографию блюда (JPG, PNG)'
         )
         self.fields['photo'].label = 'Фотография блюда'
 
+        # У рецепта нутриенты и аллергены пересчитываются по составу
+        # и перезаписали бы введённое вручную, поэтому поля только для чтения.
+        self.is_recipe = bool(self.instance.pk) and self.instance.components.exists()
+        if self.is_recipe:
+            for field_name in (*MACRO_FIELDS, 'basis', 'allergens'):
+                self.fields[field_name].disabled = True
+                self.fields[field_name].help_text = 'Считается по составу блюда'
+
         for field_name, field in self.fields.items():
             if field_name not in ['allergens', 'photo']:
                 field.widget.attrs.update({'class': 'form-control'})
 
+    def allergen_options(self):
+        """
+        Возвращает пары (аллерген, отмечен ли) для флажков формы.
+        """
+        selected = {str(value) for value in self['allergens'].value() or []}
+        return [
+            (allergen, str(allergen.pk) in selected)
+            for allergen in self.available_allergens
+        ]
+
     class Meta:
         """Метаданные формы блюда."""
         model = Dish
         fields = [
-            'name', 'description', 'photo', 'calories',
+            'name', 'description', 'photo', 'weight_grams', 'calories',
             'proteins', 'fats', 'carbohydrates',
             'url', 'allergens'
         ]
@@ -210,6 +253,9 @@ class DishForm(forms.ModelForm):
                     'placeholder': 'Описание блюда...'
                 }
             ),
+            'weight_grams': forms.NumberInput(
+                attrs={'step': '1', 'min': '1', 'placeholder': 'например, 250'}
+            ),
             'calories': forms.NumberInput(
                 attrs={'step': '0.1', 'min': '0', 'placeholder': '0.0'}
             ),
@@ -229,6 +275,7 @@ class DishForm(forms.ModelForm):
         labels = {
             'name': 'Название блюда',
             'description': 'Описание',
+            'weight_grams': 'Вес порции, г',
             'calories': 'Калории',
             'proteins': 'Белки',
             'fats': 'Жиры',
@@ -316,3 +363,255 @@ class DishForm(forms.ModelForm):
             )
         return carbohydrates
 
+    def clean_weight_grams(self):
+        """
+        Проверяет, что вес порции положительный.
+        """
+        weight = self.cleaned_data.get('weight_grams')
+        if weight is not None and weight <= 0:
+            raise forms.ValidationError(
+                'Вес порции должен быть больше нуля'
+            )
+        return weight
+
+    def clean(self):
+        """
+        Переводит нутриенты, указанные на 100 г, в значения на порцию.
+        """
+        cleaned_data = super().clean()
+        if cleaned_data.get('basis') != BASIS_100G:
+            return cleaned_data
+
+        weight = cleaned_data.get('weight_grams')
+        if not weight:
+            if 'weight_grams' not in self.errors:
+                self.add_error(
+                    'weight_grams',
+                    'Укажите вес порции, чтобы пересчитать значения на 100 г'
+                )
+            return cleaned_data
+
+        for field in MACRO_FIELDS:
+            value = cleaned_data.get(field)
+            if value is not None:
+                cleaned_data[field] = value * weight / 100
+        return cleaned_data
+
+
+
+class DishImportForm(forms.Form):
+    """
+    Форма загрузки файла для массового импорта блюд.
+    """
+
+    file = forms.FileField(
+        label='Файл с блюдами',
+        help_text='CSV с заголовком или JSON Lines, кодировка UTF-8',
+        widget=forms.FileInput(attrs={'accept': '.csv,.jsonl,.ndjson'})
+    )
+
+    def clean_file(self):
+        """
+        Проверяет расширение загружаемого файла.
+        """
+        upload = self.cleaned_data.get('file')
+        ext = os.path.splitext(upload.name)[1].lower()
+        if ext not in ('.csv', '.jsonl', '.ndjson'):
+            raise forms.ValidationError(
+                'Поддерживаются только файлы CSV и JSON Lines.'
+            )
+        return upload
+
+
+class MealPlanForm(forms.Form):
+    """
+    Дневная норма для подбора блюд: калории, границы БЖУ
+    и исключаемые аллергены.
+    """
+
+    calories = forms.FloatField(label='Калории', min_value=1)
+    protein_min = forms.FloatField(label='Белки от', min_value=0, required=False)
+    protein_max = forms.FloatField(label='Белки до', min_value=0, required=False)
+    fat_min = forms.FloatField(label='Жиры от', min_value=0, required=False)
+    fat_max = forms.FloatField(label='Жиры до', min_value=0, required=False)
+    carbs_min = forms.FloatField(label='Углеводы от', min_value=0, required=False)
+    carbs_max = forms.FloatField(label='Углеводы до', min_value=0, required=False)
+    max_dishes = forms.IntegerField(
+        label='Блюд не больше',
+        min_value=1,
+        max_value=6,
+        initial=3,
+        required=False
+    )
+
+    # Поля границ по нутриентам модели блюда.
+    BOUND_FIELDS = {
+        'proteins': ('protein_min', 'protein_max'),
+        'fats': ('fat_min', 'fat_max'),
+        'carbohydrates': ('carbs_min', 'carbs_max'),
+    }
+
+    def __init__(self, *args, user=None, versions=None, **kwargs):
+        """
+        Подставляет аллергены пользователя для исключения.
+        """
+        super().__init__(*args, **kwargs)
+        self.available_allergens = get_available_allergens(user, versions=versions)
+        for field in self.fields.values():
+            field.widget.attrs.update({'class': 'form-control'})
+
+    def clean(self):
+        """
+        Проверяет, что нижняя граница не больше верхней.
+        """
+        cleaned_data = super().clean()
+        for min_key, max_key in self.BOUND_FIELDS.values():
+            low = cleaned_data.get(min_key)
+            high = cleaned_data.get(max_key)
+            if low is not None and high is not None and low > high:
+                self.add_error(max_key, 'Верхняя граница меньше нижней.')
+        return cleaned_data
+
+    def bounds(self):
+        """
+        Границы по нутриентам в виде ``{'proteins': (от, до), ...}``.
+        """
+        return {
+            field: (self.cleaned_data.get(min_key), self.cleaned_data.get(max_key))
+            for field, (min_key, max_key) in self.BOUND_FIELDS.items()
+        }
+
+
+class MealEntryForm(forms.ModelForm):
+    """
+    Форма записи в дневник: размер порции и время приёма пищи.
+    """
+
+    class Meta:
+        """Метаданные формы записи дневника."""
+        model = MealEntry
+        fields = ['portion', 'eaten_at']
+        widgets = {
+            'portion': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.1', 'min': '0.1'}),
+            'eaten_at': forms.DateTimeInput(
+                attrs={'class': 'form-control', 'type': 'datetime-local'},
+                format='%Y-%m-%dT%H:%M'
+            ),
+        }
+        help_texts = {
+            'portion': '1 — одна порция блюда, 0.5 — половина',
+        }
+
+    def clean_portion(self):
+        """
+        Проверяет, что порция положительная и разумного размера.
+        """
+        portion = self.cleaned_data.get('portion')
+        if portion is None or portion <= 0:
+            raise forms.ValidationError('Порция должна быть больше нуля.')
+        if portion > 20:
+            raise forms.ValidationError('Порция не может быть больше 20.')
+        return portion
+
+
+class ServingForm(forms.ModelForm):
+    """
+    Форма именованной порции блюда: название и вес.
+    """
+
+    class Meta:
+        """Метаданные формы порции."""
+        model = Serving
+        fields = ['name', 'weight_grams']
+        widgets = {
+            'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Тарелка'}),
+            'weight_grams': forms.NumberInput(attrs={'class': 'form-control', 'step': '1', 'min': '1'}),
+        }
+
+    def clean_weight_grams(self):
+        """
+        Проверяет, что вес порции положительный.
+        """
+        weight = self.cleaned_data.get('weight_grams')
+        if weight is None or weight <= 0:
+            raise forms.ValidationError('Вес порции должен быть больше нуля')
+        return weight
+
+
+class DishComponentForm(forms.ModelForm):
+    """
+    Форма части рецепта: блюдо пользователя и количество его порций.
+
+    Блюд у пользователя могут быть десятки тысяч, поэтому вместо
+    выпадающего списка блюдо ищется по названию: подсказки подгружает
+    страница из ``/api/dishes/?name=…``, а выбранный id передаётся
+    в скрытом поле ``component``. Без id блюдо берётся по точному
+    названию.
+    """
+
+    component_name = forms.CharField(
+        label='Блюдо',
+        required=False,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'list': 'component-options',
+            'autocomplete': 'off',
+            'placeholder': 'Начните вводить название',
+        })
+    )
+
+    field_order = ['component_name', 'component', 'quantity']
+
+    def __init__(self, *args, parent, **kwargs):
+        """
+        Ограничивает выбор блюдами владельца рецепта, кроме самого рецепта.
+        """
+        super().__init__(*args, **kwargs)
+        self.parent = parent
+        self.fields['component'].queryset = Dish.objects.filter(
+            user_id=parent.user_id
+        ).exclude(pk=parent.pk)
+        self.fields['component'].required = False
+
+    class Meta:
+        """Метаданные формы части рецепта."""
+        model = DishComponent
+        fields = ['component', 'quantity']
+        widgets = {
+            'component': forms.HiddenInput,
+            'quantity': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.1', 'min': '0.1'}),
+        }
+        help_texts = {
+            'quantity': '1 — одна порция блюда, 0.5 — половина',
+        }
+
+    def clean_quantity(self):
+        """
+        Проверяет, что количество порций положительное.
+        """
+        quantity = self.cleaned_data.get('quantity')
+        if quantity is None or quantity <= 0:
+            raise forms.ValidationError('Количество должно быть больше нуля.')
+        return quantity
+
+    def clean_component(self):
+        """
+        Не даёт добавить блюдо дважды или замкнуть цикл рецептов.
+        """
+        component = self.cleaned_data.get('component')
+        if component is None:
+            name = self.cleaned_data.get('component_name', '').strip()
+            if not name:
+                raise forms.ValidationError('Выберите блюдо.')
+            component = self.fields['component'].queryset.filter(
+                name=name
+            ).order_by('pk').first()
+            if component is None:
+                raise forms.ValidationError('Блюдо с таким названием не найдено.')
+        if self.parent.components.filter(component=component).exists():
+            raise forms.ValidationError('Это блюдо уже входит в рецепт.')
+        if creates_cycle(self.parent.pk, component.pk):
+            raise forms.ValidationError(
+                'Это блюдо само содержит рецепт, добавить его нельзя.'
+            )
+        return component
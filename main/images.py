@@ -0,0 +1,98 @@
+"""
+Производные изображения (рендиции) для фотографий блюд.
+
+Для каждой загруженной фотографии строятся уменьшенные копии
+фиксированной ширины в WebP и JPEG без EXIF. Имена файлов содержат
+хеш исходного файла, поэтому одинаковые фотографии используют
+одни и те же рендиции, а изменённые — никогда не попадают в кеш
+браузера под старым именем.
+"""
+
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+# Имя рендиции и её ширина в пикселях.
+RENDITIONS = (
+    ('thumb', 320),
+    ('medium', 960),
+)
+
+RENDITIONS_DIR = 'renditions'
+
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+
+def _formats():
+    formats = [('jpeg', 'JPEG', {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True})]
+    if features.check('webp'):
+        formats.insert(0, ('webp', 'WEBP', {'quality': WEBP_QUALITY, 'method': 4}))
+    return formats
+
+
+def rendition_name(digest, width, extension):
+    """
+    Возвращает путь рендиции в хранилище по хешу исходного файла.
+    """
+    return f'{RENDITIONS_DIR}/{digest[:2]}/{digest}_{width}.{extension}'
+
+
+def render_renditions(photo_name, storage=None):
+    """
+    Строит рендиции для файла ``photo_name`` и сохраняет их в хранилище.
+
+    Функция не обращается к базе данных, поэтому её можно вызывать
+    в отдельных процессах. Возвращает словарь вида
+    ``{'thumb': {'width': 320, 'webp': ..., 'jpeg': ...}, ...}``.
+    """
+    storage = storage or default_storage
+
+    with storage.open(photo_name, 'rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            # Прозрачность заменяется белым фоном: JPEG её не поддерживает.
+            background = Image.new('RGB', image.size, 'white')
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        elif image.mode == 'L':
+            image = image.convert('RGB')
+
+        renditions = {}
+        for label, width in RENDITIONS:
+            target_width = min(width, image.width)
+            height = max(1, round(image.height * target_width / image.width))
+            resized = image.resize((target_width, height), Image.Resampling.LANCZOS)
+
+            rendition = {'width': target_width}
+            for extension, pil_format, options in _formats():
+                name = rendition_name(digest, target_width, extension)
+                if not storage.exists(name):
+                    buffer = BytesIO()
+                    # Метаданные (EXIF, GPS) в рендиции не переносятся.
+                    resized.save(buffer, pil_format, **options)
+                    storage.save(name, ContentFile(buffer.getvalue()))
+                rendition[extension] = name
+            renditions[label] = rendition
+
+    return renditions
+
+
+def build_dish_renditions(dish):
+    """
+    Строит рендиции фотографии блюда и сохраняет их описание в блюде.
+    """
+    from .models import Dish
+
+    renditions = render_renditions(dish.photo.name) if dish.photo else {}
+    Dish.objects.filter(pk=dish.pk).update(photo_renditions=renditions)
+    dish.photo_renditions = renditions
+    return renditions
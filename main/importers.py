@@ -0,0 +1,227 @@
+"""
+Массовый импорт блюд из CSV и JSON Lines.
+
+Файл читается построчно, каждая строка проверяется теми же правилами,
+что и ``DishForm``. Аллергены сопоставляются по названию со словарём,
+из кешированного справочника. Блюда и их связи с аллергенами пишутся
+через ``bulk_create`` пачками; сводка питания пользователя
+пересчитывается один раз в конце, так как ``bulk_create``
+не вызывает сигналы.
+"""
+
+import csv
+import io
+import json
+
+from django.db import transaction
+
+from .caching import bump_user_versions, user_data_versions
+from .catalog import get_available_allergens
+from .exports import EXPORT_COLUMNS
+from .forms import DishForm
+from .models import Dish
+from .nutrition import rebuild_summaries
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+DEFAULT_BATCH_SIZE = 500
+
+# Поля, которые принимаются из файла. Заголовки выгрузки
+# (``Название``, ``Калории``…) тоже распознаются.
+IMPORT_FIELDS = (
+    'name', 'description', 'weight_grams', 'calories', 'proteins',
+    'fats', 'carbohydrates', 'url', 'allergens',
+)
+_HEADER_ALIASES = {title.casefold(): key for key, title in EXPORT_COLUMNS}
+_HEADER_ALIASES['ссылка на рецепт'] = 'url'
+
+
+class ImportReport:
+    """
+    Итог импорта: число созданных блюд и ошибки по строкам.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+    @property
+    def failed(self):
+        return len({line for line, _ in self.errors})
+
+
+def detect_format(filename):
+    """
+    Определяет формат по расширению файла.
+    """
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'csv'
+
+
+def _normalize_key(key):
+    key = (key or '').strip()
+    return _HEADER_ALIASES.get(key.casefold(), key.casefold())
+
+
+def read_rows(stream, file_format):
+    """
+    Читает текстовый поток и возвращает пары (номер строки, словарь).
+
+    Строка, которую не удалось разобрать, возвращается как ``None``.
+    """
+    if file_format == 'jsonl':
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, None
+                continue
+            if not isinstance(row, dict):
+                yield number, None
+                continue
+            yield number, {_normalize_key(key): value for key, value in row.items()}
+        return
+
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, {
+            _normalize_key(key): value for key, value in row.items()
+            if key is not None
+        }
+
+
+def _allergen_names(value):
+    if value is None or value == '':
+        return []
+    if isinstance(value, str):
+        value = value.replace(',', ';').split(';')
+    return [str(name).strip() for name in value if str(name).strip()]
+
+
+def _form_errors(form):
+    messages = []
+    for field, errors in form.errors.items():
+        label = form.fields[field].label if field in form.fields else None
+        for error in errors:
+            messages.append(f'{label}: {error}' if label else error)
+    return '; '.join(messages)
+
+
+class DishImporter:
+    """
+    Создаёт блюда пользователя из строк файла.
+    """
+
+    def __init__(self, user, batch_size=DEFAULT_BATCH_SIZE):
+        self.user = user
+        self.batch_size = max(1, batch_size)
+        # Версии читаются один раз, чтобы форма каждой строки
+        # не обращалась за ними к базе.
+        self.versions = user_data_versions(user.pk)
+        self.allergens = self._load_allergens()
+
+    def _load_allergens(self):
+        """
+        Возвращает словарь видимых пользователю аллергенов
+        из справочника.
+
+        При совпадении названий свой аллерген важнее глобального.
+        """
+        allergens = {}
+        available = sorted(
+            get_available_allergens(self.user, self.versions),
+            key=lambda allergen: (not allergen.is_global, allergen.pk)
+        )
+        for allergen in available:
+            allergens[allergen.name.strip().casefold()] = allergen
+        return allergens
+
+    def build_dish(self, row):
+        """
+        Проверяет строку и возвращает пару (блюдо, аллергены)
+        или текст ошибки.
+        """
+        data = {
+            field: '' if row.get(field) is None else row.get(field)
+            for field in IMPORT_FIELDS if field != 'allergens'
+        }
+        form = DishForm(data=data, user=self.user, versions=self.versions)
+        if not form.is_valid():
+            return None, _form_errors(form)
+
+        allergens = []
+        unknown = []
+        for name in _allergen_names(row.get('allergens')):
+            allergen = self.allergens.get(name.casefold())
+            if allergen is None:
+                unknown.append(name)
+            elif allergen not in allergens:
+                allergens.append(allergen)
+        if unknown:
+            return None, 'Неизвестные аллергены: ' + ', '.join(unknown)
+
+        dish = form.save(commit=False)
+        dish.user = self.user
+        # bulk_create не отправляет pre_save, значения на 100 г считаются здесь.
+        dish.fill_per_100g()
+        for allergen in allergens:
+            if allergen.mask_bit is not None:
+                dish.allergen_mask |= 1 << allergen.mask_bit
+        return (dish, allergens), None
+
+    def _flush(self, batch):
+        through = Dish.allergens.through
+        with transaction.atomic():
+            dishes = Dish.objects.bulk_create([dish for dish, _ in batch])
+            through.objects.bulk_create([
+                through(dish_id=dish.pk, allergen_id=allergen.pk)
+                for dish, (_, allergens) in zip(dishes, batch)
+                for allergen in allergens
+            ], batch_size=self.batch_size)
+        return len(dishes)
+
+    def run(self, rows):
+        """
+        Импортирует строки вида (номер строки, словарь) и возвращает отчёт.
+        """
+        report = ImportReport()
+        batch = []
+        try:
+            for line, row in rows:
+                if row is None:
+                    report.add_error(line, 'Не удалось разобрать строку')
+                    continue
+                built, error = self.build_dish(row)
+                if error:
+                    report.add_error(line, error)
+                    continue
+                batch.append(built)
+                if len(batch) >= self.batch_size:
+                    report.created += self._flush(batch)
+                    batch = []
+            if batch:
+                report.created += self._flush(batch)
+        finally:
+            if report.created:
+                rebuild_summaries([self.user.pk])
+                bump_user_versions(self.user.pk)
+        return report
+
+
+def import_dishes(user, stream, file_format='csv', batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Импортирует блюда пользователя из текстового или двоичного потока.
+    """
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f'Неизвестный формат импорта: {file_format}')
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    importer = DishImporter(user, batch_size=batch_size)
+    return importer.run(read_rows(stream, file_format))
@@ -0,0 +1,355 @@
+"""
+Замеры запросов к базе, времени шаблонов и размера ответов по представлениям.
+
+``InstrumentationMiddleware`` считает запросы и время SQL через
+``execute_wrapper``, подключённый к каждому соединению,
+а шаблонный бэкенд ``InstrumentedDjangoTemplates`` — время отрисовки.
+Итоги складываются в реестр по имени URL и показываются администраторам
+на странице статистики; заголовок ``Server-Timing`` получают только
+администраторы, а при ``DEBUG`` или ``SERVER_TIMING_HEADER`` — все.
+
+Представление может объявить бюджет запросов для GET-запросов:
+атрибутом ``query_budget`` у класса или декоратором ``query_budget``
+у функции. Бюджет считается с холодным кешем и включает запросы
+сессии и пользователя. При превышении бюджета пишется предупреждение
+в журнал, а при ``QUERY_BUDGETS_RAISE = True`` (тесты включают его
+через ``override_settings``) выбрасывается ``QueryBudgetExceeded``.
+"""
+
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('instrumentation_collector', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """Представление выполнило больше запросов, чем объявлено в бюджете."""
+
+
+def query_budget(limit):
+    """
+    Декоратор для функций-представлений: объявляет бюджет запросов.
+    """
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+def get_query_budget(view_func):
+    """
+    Возвращает бюджет запросов представления или ``None``.
+    """
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None and hasattr(view_func, 'view_class'):
+        budget = getattr(view_func.view_class, 'query_budget', None)
+    return budget
+
+
+class RequestCollector:
+    """
+    Замеры одного запроса.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.view_name = None
+        self.budget = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """
+        Значение заголовка ``Server-Timing`` в миллисекундах.
+        """
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.render_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+    def over_budget(self):
+        return self.budget is not None and self.queries > self.budget
+
+
+class ViewStats:
+    """
+    Накопленные замеры одного представления.
+    """
+
+    def __init__(self, view_name):
+        self.view_name = view_name
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self.response_bytes = 0
+        self.budget = None
+        self.over_budget = 0
+
+    def add(self, collector, response_bytes):
+        self.requests += 1
+        self.queries += collector.queries
+        self.max_queries = max(self.max_queries, collector.queries)
+        self.sql_time += collector.sql_time
+        self.render_time += collector.render_time
+        self.total_time += collector.total_time
+        self.response_bytes += response_bytes
+        self.budget = collector.budget
+        if collector.over_budget():
+            self.over_budget += 1
+
+    def as_dict(self):
+        requests = self.requests or 1
+        return {
+            'view_name': self.view_name,
+            'requests': self.requests,
+            'avg_queries': self.queries / requests,
+            'max_queries': self.max_queries,
+            'avg_sql_ms': self.sql_time * 1000 / requests,
+            'avg_render_ms': self.render_time * 1000 / requests,
+            'avg_total_ms': self.total_time * 1000 / requests,
+            'avg_bytes': self.response_bytes / requests,
+            'budget': self.budget,
+            'over_budget': self.over_budget,
+        }
+
+
+class StatsRegistry:
+    """
+    Реестр замеров по именам URL.
+
+    Хранится в памяти процесса: у каждого процесса сервера свой.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, collector, response_bytes):
+        name = collector.view_name or '<unresolved>'
+        with self._lock:
+            stats = self._views.get(name)
+            if stats is None:
+                stats = self._views[name] = ViewStats(name)
+            stats.add(collector, response_bytes)
+
+    def snapshot(self):
+        """
+        Возвращает замеры, начиная с самых дорогих по времени SQL.
+        """
+        with self._lock:
+            rows = [stats.as_dict() for stats in self._views.values()]
+        return sorted(rows, key=lambda row: row['avg_sql_ms'] * row['requests'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = StatsRegistry()
+
+
+def _check_budget(collector):
+    if not collector.over_budget():
+        return
+    message = (
+        f'{collector.view_name}: выполнено запросов {collector.queries}, '
+        f'бюджет {collector.budget}'
+    )
+    if getattr(settings, 'QUERY_BUDGETS_RAISE', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+def _collect_query(execute, sql, params, many, context):
+    collector = _current.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+
+def install_query_collector(sender, connection, **kwargs):
+    """
+    Подключает к соединению сборщик запросов текущего замера
+    (обработчик сигнала ``connection_created``).
+
+    Замер хранится в контекстной переменной, а она переходит
+    и в потоки ``sync_to_async``, где асинхронные представления
+    выполняют запросы ORM.
+    """
+    if _collect_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_collect_query)
+
+
+def _timing_visible(user):
+    """
+    Показывать ли заголовок ``Server-Timing``: он раскрывает число
+    и время запросов, поэтому отдаётся только администраторам,
+    а всем — при ``DEBUG`` или ``SERVER_TIMING_HEADER = True``.
+    """
+    if settings.DEBUG or getattr(settings, 'SERVER_TIMING_HEADER', False):
+        return True
+    return bool(user is not None and user.is_staff)
+
+
+class InstrumentationMiddleware:
+    """
+    Считает запросы, время SQL и шаблонов и размер ответа.
+
+    Ставится первым в ``MIDDLEWARE``, чтобы в замер попадали и запросы
+    остальных middleware (сессия, пользователь). Работает и в синхронной,
+    и в асинхронной цепочке обработки.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, 'INSTRUMENTATION_ENABLED', True):
+            return self.get_response(request)
+
+        collector = RequestCollector()
+        token = _current.set(collector)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        user = getattr(request, 'user', None)
+        return self._process_response(collector, response, _timing_visible(user))
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'INSTRUMENTATION_ENABLED', True):
+            return await self.get_response(request)
+
+        collector = RequestCollector()
+        token = _current.set(collector)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        user = await request.auser() if hasattr(request, 'auser') else None
+        return self._process_response(collector, response, _timing_visible(user))
+
+    def _process_response(self, collector, response, show_timing):
+        if response.streaming:
+            response.streaming_content = self._measure_stream(
+                collector, response.streaming_content
+            )
+        else:
+            self._finish(collector, len(response.content))
+        if show_timing:
+            response['Server-Timing'] = collector.server_timing()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        collector = _current.get()
+        if collector is not None:
+            collector.view_name = request.resolver_match.view_name
+            # Бюджет относится к чтению: запись вызывает сигналы,
+            # пересчёт сводок и версий, и число запросов там иное.
+            if request.method in ('GET', 'HEAD'):
+                collector.budget = get_query_budget(view_func)
+
+    def _finish(self, collector, response_bytes):
+        registry.record(collector, response_bytes)
+        _check_budget(collector)
+
+    def _measure_stream(self, collector, content):
+        """
+        Продолжает замер, пока ответ отдаётся по частям:
+        запросы потоковой выгрузки выполняются уже после
+        выхода из представления.
+        """
+        size = 0
+        with _wrap_connections(collector):
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        self._finish(collector, size)
+
+
+class _wrap_connections:
+    """
+    Подключает сборщик ко всем настроенным базам данных.
+    """
+
+    def __init__(self, collector):
+        self.collector = collector
+        self._contexts = []
+
+    def __enter__(self):
+        for alias in connections:
+            context = connections[alias].execute_wrapper(self.collector)
+            context.__enter__()
+            self._contexts.append(context)
+        return self
+
+    def __exit__(self, *exc_info):
+        while self._contexts:
+            self._contexts.pop().__exit__(*exc_info)
+
+
+class _TimedTemplate:
+    """
+    Шаблон, который добавляет время отрисовки к текущему замеру.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        collector = _current.get()
+        if collector is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            collector.render_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    Стандартный шаблонный бэкенд Django с замером времени отрисовки.
+    """
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,139 @@
+"""
+Инкрементальное обновление итогов дневника ``DailyIntake`` и ``WeeklyIntake``.
+
+При создании, изменении и удалении записи ``MealEntry`` из итогов
+её старого дня вычитаются старые значения, а к итогам нового дня
+прибавляются новые. Календарь и недельная динамика читают только
+готовые строки итогов по индексу (пользователь, день) или
+(пользователь, неделя).
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .models import MACRO_FIELDS, DailyIntake, MealEntry, WeeklyIntake
+
+
+def entry_values(entry):
+    """
+    Возвращает день и нутриенты записи в виде словаря.
+    """
+    return {
+        'day': entry.eaten_on,
+        **{field: getattr(entry, field) for field in MACRO_FIELDS},
+    }
+
+
+def week_start(day):
+    """
+    Понедельник недели, в которую входит ``day``.
+    """
+    return day - timedelta(days=day.weekday())
+
+
+def _locked(model, user_id, **key):
+    row, _ = model.objects.select_for_update().get_or_create(user_id=user_id, **key)
+    return row
+
+
+def _add(totals, values, sign):
+    totals.entry_count += sign
+    if any(values[field] is None for field in MACRO_FIELDS):
+        totals.incomplete_entries += sign
+    for field in MACRO_FIELDS:
+        if values[field] is not None:
+            setattr(totals, field, getattr(totals, field) + sign * values[field])
+
+
+def _save_or_delete(totals):
+    if totals.entry_count > 0:
+        totals.save()
+    elif totals.pk is not None:
+        totals.delete()
+
+
+def apply_entry_change(user_id, old=None, new=None):
+    """
+    Учитывает в итогах пользователя создание (``old=None``),
+    изменение или удаление (``new=None``) записи дневника.
+
+    ``old`` и ``new`` — словари ``entry_values``.
+    """
+    if old == new:
+        return
+    changes = [(values, sign) for values, sign in ((old, -1), (new, 1)) if values is not None]
+    days = sorted({values['day'] for values, _ in changes})
+    weeks = sorted({week_start(day) for day in days})
+
+    with transaction.atomic():
+        daily = {day: _locked(DailyIntake, user_id, day=day) for day in days}
+        weekly = {week: _locked(WeeklyIntake, user_id, week_start=week) for week in weeks}
+        logged_before = {day: row.entry_count > 0 for day, row in daily.items()}
+
+        for values, sign in changes:
+            _add(daily[values['day']], values, sign)
+            _add(weekly[week_start(values['day'])], values, sign)
+
+        for day, row in daily.items():
+            logged = row.entry_count > 0
+            if logged != logged_before[day]:
+                weekly[week_start(day)].days_logged += 1 if logged else -1
+
+        for row in [*daily.values(), *weekly.values()]:
+            _save_or_delete(row)
+
+
+def rebuild_intake(user_ids=None):
+    """
+    Пересчитывает дневные и недельные итоги с нуля по записям дневника.
+
+    Возвращает число дневных строк.
+    """
+    entries = MealEntry.objects.all()
+    daily_rows = DailyIntake.objects.all()
+    weekly_rows = WeeklyIntake.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        daily_rows = daily_rows.filter(user_id__in=user_ids)
+        weekly_rows = weekly_rows.filter(user_id__in=user_ids)
+
+    incomplete = Q()
+    for field in MACRO_FIELDS:
+        incomplete |= Q(**{f'{field}__isnull': True})
+    aggregates = {
+        'entry_count': Count('id'),
+        'incomplete_entries': Count('id', filter=incomplete),
+        **{field: Sum(field) for field in MACRO_FIELDS},
+    }
+
+    daily = []
+    weekly = {}
+    for row in entries.order_by().values('user_id', 'eaten_on').annotate(**aggregates):
+        totals = {key: row[key] or 0 for key in aggregates}
+        daily.append(DailyIntake(user_id=row['user_id'], day=row['eaten_on'], **totals))
+
+        key = (row['user_id'], week_start(row['eaten_on']))
+        week = weekly.setdefault(key, defaultdict(float))
+        week['days_logged'] += 1
+        for name, value in totals.items():
+            week[name] += value
+
+    with transaction.atomic():
+        daily_rows.delete()
+        weekly_rows.delete()
+        DailyIntake.objects.bulk_create(daily, batch_size=1000)
+        WeeklyIntake.objects.bulk_create([
+            WeeklyIntake(
+                user_id=user_id,
+                week_start=start,
+                days_logged=int(totals.pop('days_logged')),
+                entry_count=int(totals.pop('entry_count')),
+                incomplete_entries=int(totals.pop('incomplete_entries')),
+                **totals
+            )
+            for (user_id, start), totals in weekly.items()
+        ], batch_size=1000)
+    return len(daily)
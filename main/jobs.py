@@ -0,0 +1,194 @@
+"""
+Локальная очередь фоновых задач в базе данных.
+
+Брокер не нужен: задача — это строка ``Job``, созданная в той же
+транзакции, что и данные, к которым она относится. Обработчики
+запускаются командой ``manage.py run_worker``; задачу забирает тот
+процесс, чей условный UPDATE первым перевёл её в состояние «выполняется».
+"""
+
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import bump_user_versions
+from .images import build_dish_renditions
+from .models import Dish, Job
+
+# Тип задачи -> (обработчик, обработчик окончательной ошибки).
+JOB_HANDLERS = {}
+
+# Через сколько «выполняющаяся» задача считается брошенной упавшим процессом.
+STALE_JOB_TIMEOUT = timedelta(minutes=10)
+
+# Пауза перед повтором растёт как RETRY_DELAY * 2 ** (попытка - 1).
+RETRY_DELAY = timedelta(seconds=30)
+
+
+def job_handler(kind, on_failure=None):
+    """
+    Регистрирует функцию ``handler(payload)`` для задач типа ``kind``.
+
+    ``on_failure(payload, error)`` вызывается, когда попытки исчерпаны.
+    """
+    def decorator(func):
+        JOB_HANDLERS[kind] = (func, on_failure)
+        return func
+    return decorator
+
+
+def enqueue(kind, payload, **options):
+    """
+    Ставит задачу в очередь.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Неизвестный тип задачи: {kind}')
+    return Job.objects.create(kind=kind, payload=payload, **options)
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_job(worker_id, batch=10):
+    """
+    Забирает из очереди одну готовую к выполнению задачу.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        status=Job.PENDING,
+        run_after__lte=now
+    ).order_by('run_after', 'pk').values_list('pk', flat=True)[:batch]
+
+    for pk in candidates:
+        claimed = Job.objects.filter(pk=pk, status=Job.PENDING).update(
+            status=Job.RUNNING,
+            locked_at=now,
+            locked_by=worker_id,
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """
+    Выполняет задачу и записывает результат.
+
+    При ошибке задача возвращается в очередь с задержкой, пока
+    не исчерпаны попытки, после чего помечается как неудачная.
+    """
+    handler, on_failure = JOB_HANDLERS.get(job.kind, (None, None))
+    try:
+        if handler is None:
+            raise LookupError(f'Нет обработчика для задачи {job.kind}')
+        # Обработчик сам решает, нужна ли ему транзакция: держать её
+        # открытой на время обработки изображения нельзя.
+        handler(job.payload)
+    except Exception as exc:  # noqa: BLE001 - ошибка задачи не должна останавливать обработчик
+        job.last_error = traceback.format_exc()
+        job.locked_at = None
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+            if on_failure is not None:
+                on_failure(job.payload, exc)
+        else:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+        job.save()
+        return False
+
+    job.status = Job.DONE
+    job.finished_at = timezone.now()
+    job.locked_at = None
+    job.save(update_fields=['status', 'finished_at', 'locked_at'])
+    return True
+
+
+def requeue_stale_jobs(timeout=STALE_JOB_TIMEOUT):
+    """
+    Возвращает в очередь задачи процессов, которые завершились аварийно.
+    """
+    return Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=timezone.now() - timeout
+    ).update(status=Job.PENDING, locked_at=None, locked_by='')
+
+
+def run_pending_jobs(worker_id=None, limit=None):
+    """
+    Выполняет готовые задачи, пока очередь не опустеет.
+
+    Возвращает число обработанных задач.
+    """
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_job(worker_id)
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def work(stop_event, worker_id=None, poll_interval=1.0, once=False):
+    """
+    Основной цикл обработчика очереди.
+    """
+    worker_id = worker_id or default_worker_id()
+    while not stop_event.is_set():
+        close_old_connections()
+        requeue_stale_jobs()
+        processed = run_pending_jobs(worker_id)
+        if once and not processed:
+            break
+        if not processed:
+            stop_event.wait(poll_interval)
+
+
+def _photo_failed(payload, error):
+    dishes = Dish.objects.filter(pk=payload['dish_id'], photo=payload['photo'])
+    owners = list(dishes.values_list('user_id', flat=True))
+    dishes.update(photo_status=Dish.PHOTO_FAILED)
+    bump_user_versions(*owners)
+
+
+@job_handler('dish_photo_renditions', on_failure=_photo_failed)
+def process_dish_photo(payload):
+    """
+    Строит уменьшенные копии фотографии блюда.
+
+    Если фотографию успели заменить или блюдо удалено,
+    задача устарела и ничего не делает.
+    """
+    dish = Dish.objects.filter(
+        pk=payload['dish_id'],
+        photo=payload['photo']
+    ).first()
+    if dish is None:
+        return
+    build_dish_renditions(dish)
+    Dish.objects.filter(pk=dish.pk, photo=payload['photo']).update(
+        photo_status=Dish.PHOTO_READY
+    )
+    bump_user_versions(dish.user_id)
+
+
+def schedule_photo_processing(dish):
+    """
+    Ставит обработку фотографии блюда в очередь.
+
+    Блюдо должно быть уже сохранено с ``photo_status = processing``.
+    """
+    return enqueue(
+        'dish_photo_renditions',
+        {'dish_id': dish.pk, 'photo': dish.photo.name}
+    )
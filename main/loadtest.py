@@ -0,0 +1,576 @@
+"""
+Нагрузочный прогон приложения с одновременными пользователями.
+
+Каждый виртуальный пользователь входит в систему через страницу входа
+(так нагружается таблица сессий) и затем выполняет случайные действия
+в заданной пропорции: просмотр и фильтрация списка, создание,
+изменение и удаление блюд.
+
+Цели прогона:
+
+* ``wsgi`` — ``food_diary.wsgi.application`` за многопоточным
+  HTTP-сервером Django, запущенным в этом же процессе; пользователи —
+  потоки с HTTP-клиентом;
+* ``asgi`` — ``food_diary.asgi.application``, который вызывается
+  напрямую по протоколу ASGI; пользователи — задачи asyncio;
+* ``url`` — уже запущенный сервер по адресу.
+
+Ошибки блокировки SQLite (``database is locked``) считаются отдельно
+по сигналу ``got_request_exception``, поэтому видны только для
+целей в этом процессе; для внешнего сервера учитываются коды ответа.
+"""
+
+import asyncio
+import http.client
+import math
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connections
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmarks import BENCH_PASSWORD, FILTER_PRESETS, bench_users, percentile
+from .caching import bump_user_versions
+from .models import Dish
+from .nutrition import rebuild_summaries
+
+ACTIONS = ('browse', 'filter', 'create', 'edit', 'delete')
+
+DEFAULT_MIX = {'browse': 50, 'filter': 30, 'create': 10, 'edit': 5, 'delete': 5}
+
+# Блюда, созданные прогоном, отличаются по началу названия
+# и удаляются после него.
+LOAD_MARKER = 'Нагрузка'
+
+# Сколько блюд заранее создаётся каждому пользователю
+# для изменения и удаления.
+DISH_POOL_SIZE = 20
+
+# Верхние границы интервалов гистограммы задержек, мс.
+HISTOGRAM_BOUNDS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def parse_mix(value):
+    """
+    Разбирает пропорцию действий вида ``browse=50,create=10``.
+    """
+    mix = {}
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ACTIONS:
+            raise ValueError(f'Неизвестное действие: {name}')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise ValueError(f'Вес действия {name} должен быть числом')
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError('Пропорция действий пуста')
+    return mix
+
+
+def histogram(latencies):
+    """
+    Возвращает число ответов в каждом интервале задержек.
+    """
+    counts = Counter()
+    for latency in latencies:
+        for bound in HISTOGRAM_BOUNDS:
+            if latency <= bound:
+                counts[f'<={bound}'] += 1
+                break
+        else:
+            counts[f'>{HISTOGRAM_BOUNDS[-1]}'] += 1
+    labels = [f'<={bound}' for bound in HISTOGRAM_BOUNDS] + [f'>{HISTOGRAM_BOUNDS[-1]}']
+    return {label: counts[label] for label in labels}
+
+
+class ErrorCollector:
+    """
+    Классифицирует исключения, случившиеся при обработке запросов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def __call__(self, sender, request=None, **kwargs):
+        exc = sys.exc_info()[1]
+        if isinstance(exc, OperationalError) and 'locked' in str(exc):
+            kind = 'database_locked'
+        else:
+            kind = type(exc).__name__ if exc else 'unknown'
+        with self._lock:
+            self.counts[kind] += 1
+
+    def __enter__(self):
+        got_request_exception.connect(self, dispatch_uid='loadtest-errors')
+        return self
+
+    def __exit__(self, *exc_info):
+        got_request_exception.disconnect(dispatch_uid='loadtest-errors')
+
+
+class Recorder:
+    """
+    Результаты всех пользователей прогона.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {action: [] for action in ('login', *ACTIONS)}
+        self.statuses = Counter()
+        self.transport_errors = Counter()
+
+    def record(self, action, latency, status):
+        with self._lock:
+            self.latencies[action].append(latency * 1000)
+            self.statuses[status] += 1
+
+    def record_failure(self, action, exc):
+        with self._lock:
+            self.transport_errors[f'{action}: {type(exc).__name__}'] += 1
+
+    def report(self, elapsed, server_errors):
+        everything = [value for values in self.latencies.values() for value in values]
+        actions = {}
+        for action, values in self.latencies.items():
+            if not values:
+                continue
+            actions[action] = {
+                'requests': len(values),
+                'p50_ms': round(percentile(values, 0.5), 2),
+                'p95_ms': round(percentile(values, 0.95), 2),
+                'p99_ms': round(percentile(values, 0.99), 2),
+                'max_ms': round(max(values), 2),
+            }
+        return {
+            'duration_s': round(elapsed, 2),
+            'requests': len(everything),
+            'throughput_rps': round(len(everything) / elapsed, 2) if elapsed else None,
+            'p50_ms': round(percentile(everything, 0.5), 2) if everything else None,
+            'p95_ms': round(percentile(everything, 0.95), 2) if everything else None,
+            'p99_ms': round(percentile(everything, 0.99), 2) if everything else None,
+            'histogram_ms': histogram(everything),
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'server_errors': dict(server_errors),
+            'lock_timeouts': server_errors.get('database_locked', 0),
+            'transport_errors': dict(self.transport_errors),
+            'actions': actions,
+        }
+
+
+class SimulatedUser:
+    """
+    Состояние одного виртуального пользователя: cookie, блюда
+    для изменения и удаления и выбор следующего действия.
+
+    Не зависит от способа отправки запросов: драйверы WSGI и ASGI
+    получают от него запрос и возвращают ответ.
+    """
+
+    def __init__(self, username, dish_ids, mix, rng):
+        self.username = username
+        self.dish_ids = list(dish_ids)
+        self.actions = list(mix)
+        self.weights = [mix[action] for action in self.actions]
+        self.rng = rng
+        self.cookies = {}
+
+    def cookie_header(self):
+        return '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+
+    def remember_cookies(self, set_cookie_headers):
+        for header in set_cookie_headers:
+            cookie = SimpleCookie()
+            cookie.load(header)
+            for name, morsel in cookie.items():
+                if morsel['max-age'] == '0' or not morsel.value:
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+
+    def _form(self, data):
+        data = {**data, 'csrfmiddlewaretoken': self.cookies.get('csrftoken', '')}
+        return urlencode(data, doseq=True).encode()
+
+    def login_requests(self):
+        """
+        Запросы входа: страница с cookie CSRF и отправка формы.
+        """
+        yield 'GET', reverse('login'), None
+        yield 'POST', reverse('login'), self._form({
+            'username': self.username, 'password': BENCH_PASSWORD,
+        })
+
+    def next_request(self):
+        """
+        Возвращает (действие, метод, путь, тело) следующего запроса.
+        """
+        action = self.rng.choices(self.actions, self.weights)[0]
+        if action in ('edit', 'delete') and not self.dish_ids:
+            action = 'browse'
+
+        if action == 'browse':
+            page = self.rng.choice(('1', '1', '1', '2', '3'))
+            return action, 'GET', f"{reverse('dishes')}?page={page}", None
+        if action == 'filter':
+            preset = FILTER_PRESETS[self.rng.choice([name for name in FILTER_PRESETS if name != 'allergens'])]
+            params = preset({}) if callable(preset) else dict(preset)
+            params['sort_by'] = self.rng.choice(('-created_at', 'name', '-calories'))
+            return action, 'GET', f"{reverse('dishes')}?{urlencode(params)}", None
+        if action == 'create':
+            return action, 'POST', reverse('create_dish'), self._form({
+                'name': f'{LOAD_MARKER} {self.rng.randint(1, 10 ** 6)}',
+                'calories': str(self.rng.randint(50, 900)),
+            })
+        if action == 'edit':
+            dish_id = self.rng.choice(self.dish_ids)
+            return action, 'POST', reverse('dish_edit', args=[dish_id]), self._form({
+                'name': f'{LOAD_MARKER} {dish_id}',
+                'calories': str(self.rng.randint(50, 900)),
+            })
+        dish_id = self.dish_ids.pop(self.rng.randrange(len(self.dish_ids)))
+        return action, 'POST', reverse('dish_delete', args=[dish_id]), self._form({})
+
+
+def prepare_users(count, pool_size=DISH_POOL_SIZE):
+    """
+    Выбирает пользователей ``bench_*`` и создаёт им блюда для прогона.
+
+    Возвращает список пар (логин, идентификаторы блюд).
+    """
+    users = list(bench_users().filter(is_staff=False).order_by('username')[:count])
+    if len(users) < count:
+        raise ValueError(
+            f'Нужно {count} пользователей bench_*, есть {len(users)}; '
+            f'заполните базу командой seed_benchmark_data'
+        )
+    Dish.objects.bulk_create([
+        Dish(user=user, name=f'{LOAD_MARKER} {number}', calories=100)
+        for user in users
+        for number in range(pool_size)
+    ])
+    pools = {user.pk: [] for user in users}
+    for dish_id, user_id in Dish.objects.filter(
+        user__in=users, name__startswith=LOAD_MARKER
+    ).values_list('pk', 'user_id'):
+        pools[user_id].append(dish_id)
+    user_ids = [user.pk for user in users]
+    rebuild_summaries(user_ids)
+    bump_user_versions(*user_ids)
+    return [(user.username, pools[user.pk]) for user in users]
+
+
+def cleanup_users(usernames):
+    """
+    Удаляет блюда, созданные прогоном.
+    """
+    users = bench_users().filter(username__in=usernames)
+    user_ids = list(users.values_list('pk', flat=True))
+    Dish.objects.filter(user__in=user_ids, name__startswith=LOAD_MARKER).delete()
+    rebuild_summaries(user_ids)
+    bump_user_versions(*user_ids)
+
+
+class _HttpSession:
+    """
+    Синхронный HTTP-клиент пользователя для серверов WSGI и внешних.
+    """
+
+    def __init__(self, base_url, user):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.user = user
+        self.connection = None
+
+    def request(self, method, path, body):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = {'Cookie': self.user.cookie_header()}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        self.user.remember_cookies(response.headers.get_all('Set-Cookie') or [])
+        if response.will_close:
+            self.close()
+        return response.status
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def _run_thread_user(base_url, user, recorder, deadline, think_time):
+    session = _HttpSession(base_url, user)
+    try:
+        for method, path, body in user.login_requests():
+            start = time.perf_counter()
+            status = session.request(method, path, body)
+            recorder.record('login', time.perf_counter() - start, status)
+        while time.monotonic() < deadline:
+            action, method, path, body = user.next_request()
+            start = time.perf_counter()
+            try:
+                status = session.request(method, path, body)
+            except (OSError, http.client.HTTPException) as exc:
+                recorder.record_failure(action, exc)
+                continue
+            recorder.record(action, time.perf_counter() - start, status)
+            if think_time:
+                time.sleep(user.rng.uniform(0, 2 * think_time))
+    except (OSError, http.client.HTTPException) as exc:
+        recorder.record_failure('login', exc)
+    finally:
+        session.close()
+
+
+def run_threaded(base_url, users, recorder, duration, think_time):
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=_run_thread_user,
+            args=(base_url, user, recorder, deadline, think_time),
+            daemon=True,
+        )
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class InProcessWSGIServer:
+    """
+    Многопоточный HTTP-сервер Django (как у ``runserver``)
+    на свободном порту в фоновом потоке.
+    """
+
+    def __init__(self, application):
+        from django.core.servers.basehttp import (
+            ThreadedWSGIServer,
+            WSGIRequestHandler,
+        )
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=True)
+        self.server.set_app(application)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+async def _asgi_request(application, user, method, path, body):
+    """
+    Вызывает ASGI-приложение с одним HTTP-запросом.
+    """
+    path, _, query = path.partition('?')
+    headers = [(b'host', b'testserver'), (b'cookie', user.cookie_header().encode())]
+    if body is not None:
+        headers += [
+            (b'content-type', b'application/x-www-form-urlencoded'),
+            (b'content-length', str(len(body)).encode()),
+        ]
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': headers,
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body or b'', 'more_body': False}
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    status = None
+    set_cookies = []
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            set_cookies.extend(
+                value.decode('latin-1') for name, value in message['headers']
+                if name.lower() == b'set-cookie'
+            )
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            disconnected.set()
+
+    await application(scope, receive, send)
+    disconnected.set()
+    user.remember_cookies(set_cookies)
+    return status
+
+
+async def _run_asgi_user(application, user, recorder, deadline, think_time):
+    for method, path, body in user.login_requests():
+        start = time.perf_counter()
+        status = await _asgi_request(application, user, method, path, body)
+        recorder.record('login', time.perf_counter() - start, status)
+    while time.monotonic() < deadline:
+        action, method, path, body = user.next_request()
+        start = time.perf_counter()
+        status = await _asgi_request(application, user, method, path, body)
+        recorder.record(action, time.perf_counter() - start, status)
+        if think_time:
+            await asyncio.sleep(user.rng.uniform(0, 2 * think_time))
+
+
+def run_asgi(users, recorder, duration, think_time):
+    from food_diary.asgi import application
+
+    async def main():
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*(
+            _run_asgi_user(application, user, recorder, deadline, think_time)
+            for user in users
+        ))
+
+    asyncio.run(main())
+
+
+def database_profile():
+    """
+    Настройки базы, от которых зависит поведение под нагрузкой.
+    """
+    connection = connections['default']
+    profile = {
+        'vendor': connection.vendor,
+        'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+        'options': {
+            key: value for key, value in connection.settings_dict['OPTIONS'].items()
+            if key != 'init_command'
+        },
+    }
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            profile['journal_mode'] = cursor.fetchone()[0]
+    return profile
+
+
+def run_load_test(target='wsgi', users=10, duration=30.0, mix=None, think_time=0.0,
+                  url=None, seed=1):
+    """
+    Проводит нагрузочный прогон и возвращает отчёт.
+
+    ``target`` — ``wsgi``, ``asgi`` или ``url`` (тогда нужен ``url``).
+    """
+    mix = mix or DEFAULT_MIX
+    prepared = prepare_users(users)
+    simulated = [
+        SimulatedUser(username, dish_ids, mix, random.Random(seed * 1000 + index))
+        for index, (username, dish_ids) in enumerate(prepared)
+    ]
+    # Соединение основного потока не должно держать транзакцию
+    # или блокировку, пока работают пользователи.
+    connections.close_all()
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    try:
+        with ErrorCollector() as errors:
+            if target == 'wsgi':
+                from food_diary.wsgi import application
+
+                with InProcessWSGIServer(application) as server:
+                    run_threaded(server.url, simulated, recorder, duration, think_time)
+            elif target == 'asgi':
+                run_asgi(simulated, recorder, duration, think_time)
+            elif target == 'url':
+                run_threaded(url, simulated, recorder, duration, think_time)
+            else:
+                raise ValueError(f'Неизвестная цель прогона: {target}')
+        elapsed = time.perf_counter() - started
+    finally:
+        cleanup_users([username for username, _ in prepared])
+
+    report = recorder.report(elapsed, errors.counts)
+    report['meta'] = {
+        'target': target,
+        'database': database_profile(),
+        'users': users,
+        'mix': mix,
+        'think_time_s': think_time,
+        'created_at': timezone.now().isoformat(timespec='seconds'),
+    }
+    return report
+
+
+def format_report(report):
+    """
+    Возвращает отчёт в виде строк для вывода в консоль.
+    """
+    database = report['meta']['database']
+    lines = [
+        f"База: {database['vendor']}, журнал {database.get('journal_mode', '—')}, "
+        f"CONN_MAX_AGE {database['conn_max_age']}, параметры {database['options']}",
+        f"Запросов: {report['requests']} за {report['duration_s']} с, "
+        f"{report['throughput_rps']} запр/с",
+        f"Задержка: p50 {report['p50_ms']} мс, p95 {report['p95_ms']} мс, "
+        f"p99 {report['p99_ms']} мс",
+        f"Коды ответа: {report['statuses']}",
+        f"Ошибки сервера: {report['server_errors'] or 'нет'}; "
+        f"блокировки SQLite: {report['lock_timeouts']}",
+    ]
+    if report['transport_errors']:
+        lines.append(f"Ошибки соединения: {report['transport_errors']}")
+    lines.append('Гистограмма, мс:')
+    total = report['requests'] or 1
+    for label, count in report['histogram_ms'].items():
+        bar = '#' * math.ceil(40 * count / total) if count else ''
+        lines.append(f'  {label:>8} {count:7d} {bar}')
+    lines.append('Действия:')
+    for action, row in report['actions'].items():
+        lines.append(
+            f"  {action:<7} {row['requests']:7d}  p50 {row['p50_ms']:8.2f}  "
+            f"p95 {row['p95_ms']:8.2f}  p99 {row['p99_ms']:8.2f}  max {row['max_ms']:8.2f}"
+        )
+    return lines
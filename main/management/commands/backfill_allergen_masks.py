@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from main.allergen_masks import backfill_allergen_masks
+from main.caching import bump_global_version
+from main.models import Allergen, Dish
+
+
+class Command(BaseCommand):
+    """
+    Выдаёт биты аллергенам и пересчитывает маски аллергенов всех блюд.
+    """
+
+    help = 'Заполняет битовые маски аллергенов для существующих блюд'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько блюд пересчитывать за один запрос'
+        )
+
+    def handle(self, *args, **options):
+        assigned, updated = backfill_allergen_masks(
+            Allergen, Dish, batch_size=options['batch_size'], lock=True
+        )
+        bump_global_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Новых битов аллергенов: {assigned}, пересчитано блюд: {updated}'
+        ))
@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+# Модели импортируются внутри функций: при запуске процессов через spawn
+# (macOS, Windows) дочерний процесс импортирует этот модуль до настройки
+# Django, и импорт main.models на уровне модуля упал бы с AppRegistryNotReady.
+
+
+def _init_worker():
+    """
+    Настраивает Django в дочернем процессе пула.
+    """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _render(dish_id, photo_name):
+    """
+    Строит рендиции в дочернем процессе; база данных здесь не нужна.
+    """
+    from main.images import render_renditions
+
+    try:
+        return dish_id, render_renditions(photo_name), None
+    except Exception as exc:  # noqa: BLE001 - ошибка одного файла не должна останавливать остальные
+        return dish_id, None, f'{type(exc).__name__}: {exc}'
+
+
+class Command(BaseCommand):
+    """
+    Строит уменьшенные копии фотографий блюд параллельно на всех ядрах.
+    """
+
+    help = 'Генерирует уменьшенные копии фотографий блюд'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересобрать копии и для блюд, у которых они уже есть'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Число процессов (по умолчанию — число ядер)'
+        )
+
+    def handle(self, *args, **options):
+        from main.caching import bump_global_version
+        from main.models import Dish
+
+        dishes = Dish.objects.exclude(photo='').exclude(photo=None)
+        if not options['all']:
+            dishes = dishes.filter(photo_renditions={})
+        jobs = list(dishes.values_list('pk', 'photo'))
+
+        if not jobs:
+            self.stdout.write('Нет фотографий для обработки')
+            return
+
+        # Соединения с базой не должны наследоваться дочерними процессами.
+        connections.close_all()
+
+        done = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=max(1, options['workers']), initializer=_init_worker
+        ) as pool:
+            futures = [pool.submit(_render, pk, photo) for pk, photo in jobs]
+            for future in as_completed(futures):
+                dish_id, renditions, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'Блюдо {dish_id}: {error}')
+                    continue
+                Dish.objects.filter(pk=dish_id).update(
+                    photo_renditions=renditions, photo_status=Dish.PHOTO_READY
+                )
+                done += 1
+
+        if done:
+            bump_global_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано фотографий: {done}, с ошибками: {failed}'
+        ))
@@ -0,0 +1,59 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from main.importers import DEFAULT_BATCH_SIZE, IMPORT_FORMATS, detect_format, import_dishes
+
+
+class Command(BaseCommand):
+    """
+    Импортирует блюда пользователя из файла CSV или JSON Lines.
+    """
+
+    help = 'Импортирует блюда из CSV или JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Путь к файлу или «-» для чтения из стандартного ввода'
+        )
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Логин пользователя, которому добавляются блюда'
+        )
+        parser.add_argument(
+            '--format',
+            choices=IMPORT_FORMATS,
+            help='Формат файла (по умолчанию определяется по расширению)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Сколько блюд записывать одним запросом'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+
+        path = options['path']
+        file_format = options['format'] or detect_format(path)
+        if path == '-':
+            report = import_dishes(user, sys.stdin.buffer, file_format, options['batch_size'])
+        else:
+            try:
+                with open(path, 'rb') as stream:
+                    report = import_dishes(user, stream, file_format, options['batch_size'])
+            except OSError as exc:
+                raise CommandError(f'Не удалось открыть файл: {exc}')
+
+        for line, message in report.errors:
+            self.stderr.write(f'Строка {line}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено блюд: {report.created}, строк с ошибками: {report.failed}'
+        ))
@@ -0,0 +1,109 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.caching import bump_global_version
+from main.models import Dish, Job
+from main.storage import (
+    PHOTOS_DIR,
+    content_name,
+    digest_from_name,
+    file_digest,
+    photo_storage,
+    rebuild_blob_counts,
+)
+
+
+def _format_size(size):
+    for unit in ('Б', 'КБ', 'МБ'):
+        if size < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.1f} ГБ'
+
+
+class Command(BaseCommand):
+    """
+    Переносит фотографии блюд в хранилище с адресацией по содержимому.
+
+    Одинаковые файлы склеиваются в один, ссылки блюд обновляются,
+    счётчики ``PhotoBlob`` пересчитываются.
+    """
+
+    help = 'Переносит фотографии блюд в раскладку по хешу содержимого'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--delete-orphans',
+            action='store_true',
+            help='Удалить файлы в корне каталога фотографий, на которые не ссылается ни одно блюдо'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        names = (
+            Dish.objects.exclude(photo='').exclude(photo=None)
+            .order_by().values_list('photo', flat=True).distinct()
+        )
+        legacy = [
+            name for name in names
+            if not (name.startswith(f'{PHOTOS_DIR}/') and digest_from_name(name))
+        ]
+
+        moved = merged = missing = 0
+        reclaimed = 0
+        stored = set()
+        for name in legacy:
+            if not photo_storage.exists(name):
+                missing += 1
+                self.stderr.write(f'Файл не найден: {name}')
+                continue
+
+            with photo_storage.open(name, 'rb') as source:
+                target = content_name(file_digest(source), name)
+                duplicate = target in stored or photo_storage.exists(target)
+                if not dry_run and not duplicate:
+                    photo_storage.save(name, source)
+            stored.add(target)
+            if duplicate:
+                merged += 1
+                reclaimed += photo_storage.size(name)
+            moved += 1
+            if dry_run:
+                continue
+
+            with transaction.atomic():
+                Dish.objects.filter(photo=name).update(photo=target)
+                for job in Job.objects.filter(
+                    status__in=[Job.PENDING, Job.RUNNING],
+                    payload__photo=name
+                ):
+                    job.payload['photo'] = target
+                    job.save(update_fields=['payload'])
+            photo_storage.delete(name)
+
+        orphans = 0
+        if options['delete_orphans'] and photo_storage.exists(''):
+            referenced = set(Dish.objects.values_list('photo', flat=True))
+            for filename in photo_storage.listdir('')[1]:
+                if filename in referenced:
+                    continue
+                orphans += 1
+                reclaimed += photo_storage.size(filename)
+                if not dry_run:
+                    photo_storage.delete(filename)
+
+        if not dry_run:
+            rebuild_blob_counts()
+            bump_global_version()
+
+        prefix = 'Пробный запуск, изменения не сохранены. ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Перенесено файлов: {moved}, из них дубликатов: {merged}, '
+            f'не найдено: {missing}, лишних файлов удалено: {orphans}. '
+            f'Освобождено: {_format_size(reclaimed)} ({reclaimed} байт)'
+        ))
@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from main.composition import rebuild_compositions
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает нутриенты и аллергены блюд-рецептов по их составу.
+    """
+
+    help = 'Пересчитывает нутриенты и аллергены блюд-рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            help='Логин пользователя; можно указать несколько раз'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = None
+        usernames = options['usernames']
+        if usernames:
+            users = get_user_model().objects.filter(username__in=usernames)
+            user_ids = list(users.values_list('pk', flat=True))
+            if len(user_ids) != len(set(usernames)):
+                raise CommandError('Часть пользователей не найдена')
+
+        updated = rebuild_compositions(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рецептов: {updated}'
+        ))
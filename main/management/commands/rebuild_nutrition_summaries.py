@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from main.caching import bump_global_version
+from main.nutrition import rebuild_summaries
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает сводки питания пользователей по таблице блюд.
+    """
+
+    help = 'Пересчитывает сводки питания и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            help='Логин пользователя; можно указать несколько раз'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = None
+        usernames = options['usernames']
+        if usernames:
+            users = get_user_model().objects.filter(username__in=usernames)
+            user_ids = list(users.values_list('pk', flat=True))
+            if len(user_ids) != len(set(usernames)):
+                raise CommandError('Часть пользователей не найдена')
+
+        changed = rebuild_summaries(user_ids)
+        if changed:
+            bump_global_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено сводок: {changed}'
+        ))
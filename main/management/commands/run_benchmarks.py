@@ -0,0 +1,113 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from main.benchmarks import (
+    compare_results,
+    default_benchmark_user,
+    default_scenarios,
+    load_results,
+    run_benchmarks,
+    save_results,
+)
+
+
+class Command(BaseCommand):
+    """
+    Замеряет время ответа, число запросов и память на основных страницах.
+    """
+
+    help = 'Прогоняет сценарии замеров и сохраняет результаты в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Логин пользователя (по умолчанию bench_* с наибольшим числом блюд)'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Сколько замеров на сценарий'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=2,
+            help='Сколько прогревочных запросов перед замерами'
+        )
+        parser.add_argument(
+            '--only',
+            action='append',
+            help='Запустить только сценарии, имя которых начинается с этой строки'
+        )
+        parser.add_argument(
+            '--page-cache',
+            action='store_true',
+            help='Не отключать кеш страниц (по умолчанию замеряется отрисовка)'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для результатов в JSON'
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON предыдущего прогона для сравнения'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.2,
+            help='Допустимый рост p95 при сравнении (доля, 0.2 = 20%%)'
+        )
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = get_user_model().objects.filter(username=options['user']).first()
+        else:
+            user = default_benchmark_user()
+        if user is None:
+            raise CommandError(
+                'Пользователь не найден; заполните базу командой seed_benchmark_data'
+            )
+
+        scenarios = default_scenarios()
+        if options['only']:
+            scenarios = [
+                scenario for scenario in scenarios
+                if scenario.name.startswith(tuple(options['only']))
+            ]
+
+        with override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            PAGE_CACHE_ENABLED=options['page_cache'],
+        ):
+            results = run_benchmarks(
+                user,
+                scenarios,
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                stdout=self.stdout,
+            )
+
+        if options['output']:
+            save_results(results, options['output'])
+            self.stdout.write(f"Результаты сохранены в {options['output']}")
+
+        if options['compare']:
+            rows = compare_results(
+                load_results(options['compare']), results, options['threshold']
+            )
+            regressions = [row for row in rows if row['regression']]
+            for row in rows:
+                mark = self.style.ERROR('хуже') if row['regression'] else 'ок'
+                self.stdout.write(
+                    f"{row['name']:<40} p95 {row['p95_before']:8.2f} → "
+                    f"{row['p95_after']:8.2f} мс ({row['p95_change']:+.0%}), "
+                    f"запросов {row['queries_before']} → {row['queries_after']}  {mark}"
+                )
+            if regressions:
+                self.stderr.write(f'Регрессий: {len(regressions)}')
+                sys.exit(1)
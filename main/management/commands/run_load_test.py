@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from main.benchmarks import save_results
+from main.loadtest import DEFAULT_MIX, format_report, parse_mix, run_load_test
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный прогон с одновременными пользователями.
+    """
+
+    help = 'Нагружает приложение (WSGI, ASGI или внешний сервер) виртуальными пользователями'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target',
+            choices=('wsgi', 'asgi', 'url'),
+            default='wsgi',
+            help='wsgi — сервер в этом процессе, asgi — вызов ASGI-приложения, url — внешний сервер'
+        )
+        parser.add_argument(
+            '--url',
+            help='Адрес внешнего сервера для --target url, например http://127.0.0.1:8000'
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=10,
+            help='Число одновременных пользователей (берутся из bench_*)'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=30,
+            help='Длительность прогона в секундах'
+        )
+        parser.add_argument(
+            '--mix',
+            default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+            help='Пропорция действий, например browse=50,filter=30,create=10,edit=5,delete=5'
+        )
+        parser.add_argument(
+            '--think-time',
+            type=float,
+            default=0,
+            help='Средняя пауза пользователя между запросами в секундах'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1,
+            help='Начальное значение генератора действий'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для отчёта в JSON'
+        )
+
+    def handle(self, *args, **options):
+        if options['target'] == 'url' and not options['url']:
+            raise CommandError('Для --target url нужен --url')
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        # Как на рабочем сервере: без отладочного журнала запросов
+        # и страниц ошибок.
+        with override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=['127.0.0.1', 'localhost', 'testserver'],
+        ):
+            try:
+                report = run_load_test(
+                    target=options['target'],
+                    users=options['users'],
+                    duration=options['duration'],
+                    mix=mix,
+                    think_time=options['think_time'],
+                    url=options['url'],
+                    seed=options['seed'],
+                )
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        for line in format_report(report):
+            self.stdout.write(line)
+        if options['output']:
+            save_results(report, options['output'])
+            self.stdout.write(f"Отчёт сохранён в {options['output']}")
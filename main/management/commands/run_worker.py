@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main.jobs import default_worker_id, work
+
+
+def _worker_main(stop_event, index, poll_interval, once):
+    """
+    Точка входа дочернего процесса очереди задач.
+    """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+    # Остановкой управляет родительский процесс через stop_event.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(
+        stop_event,
+        worker_id=f'{default_worker_id()}/{index}',
+        poll_interval=poll_interval,
+        once=once
+    )
+
+
+class Command(BaseCommand):
+    """
+    Запускает пул процессов, выполняющих фоновые задачи из очереди.
+    """
+
+    help = 'Обрабатывает фоновые задачи (например, фотографии блюд)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Число процессов-обработчиков (по умолчанию — число ядер)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Пауза между проверками пустой очереди, в секундах'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить накопившиеся задачи и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        # Соединения с базой не должны наследоваться дочерними процессами.
+        connections.close_all()
+
+        context = multiprocessing.get_context()
+        stop_event = context.Event()
+        children = [
+            context.Process(
+                target=_worker_main,
+                args=(stop_event, index, options['poll_interval'], options['once']),
+                daemon=True
+            )
+            for index in range(processes)
+        ]
+
+        def stop(signum, frame):
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, stop)
+
+        for child in children:
+            child.start()
+        self.stdout.write(f'Запущено обработчиков: {processes}')
+
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            stop_event.set()
+            for child in children:
+                child.join()
+
+        self.stdout.write(self.style.SUCCESS('Обработчики остановлены'))
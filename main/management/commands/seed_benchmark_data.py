@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.benchmarks import bench_users, clear_benchmark_data, seed_benchmark_data
+
+
+class Command(BaseCommand):
+    """
+    Создаёт синтетических пользователей, аллергены и блюда для замеров.
+    """
+
+    help = 'Заполняет базу синтетическими данными для замеров производительности'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=50,
+            help='Сколько пользователей создать'
+        )
+        parser.add_argument(
+            '--median-dishes',
+            type=int,
+            default=40,
+            help='Медиана числа блюд у пользователя (распределение логнормальное)'
+        )
+        parser.add_argument(
+            '--max-dishes',
+            type=int,
+            default=5000,
+            help='Наибольшее число блюд у одного пользователя'
+        )
+        parser.add_argument(
+            '--user-allergens',
+            type=int,
+            default=3,
+            help='Наибольшее число личных аллергенов у пользователя'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=1,
+            help='Начальное значение генератора: одинаковый seed — одинаковые данные'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько блюд записывать одним запросом'
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить ранее созданные данные bench_* перед заполнением'
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            removed = clear_benchmark_data()
+            self.stdout.write(f'Удалено пользователей: {removed}')
+        elif bench_users().exclude(username__endswith='staff').exists():
+            raise CommandError(
+                'Данные для замеров уже есть; используйте --clear, чтобы пересоздать их'
+            )
+
+        created = seed_benchmark_data(
+            users=options['users'],
+            median_dishes=options['median_dishes'],
+            max_dishes=options['max_dishes'],
+            user_allergens=options['user_allergens'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            stdout=self.stdout if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано пользователей: {created['users']}, "
+            f"аллергенов: {created['allergens']}, блюд: {created['dishes']}"
+        ))
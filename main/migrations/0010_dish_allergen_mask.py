@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+from main.allergen_masks import backfill_allergen_masks
+
+
+def fill_allergen_masks(apps, schema_editor):
+    backfill_allergen_masks(
+        apps.get_model('main', 'Allergen'),
+        apps.get_model('main', 'Dish'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_dish_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='allergen',
+            name='mask_bit',
+            field=models.SmallIntegerField(blank=True, editable=False, null=True, verbose_name='Бит в маске аллергенов блюда'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='allergen_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Битовая маска аллергенов'),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['user', 'allergen_mask'], name='dish_user_allergens_idx'),
+        ),
+        migrations.RunPython(fill_allergen_masks, migrations.RunPython.noop),
+    ]
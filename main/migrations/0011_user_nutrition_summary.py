@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from main.nutrition import rebuild_summaries
+
+
+def build_summaries(apps, schema_editor):
+    rebuild_summaries(
+        dish_model=apps.get_model('main', 'Dish'),
+        summary_model=apps.get_model('main', 'UserNutritionSummary'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('main', '0010_dish_allergen_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserNutritionSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='nutrition_summary', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('dish_count', models.PositiveIntegerField(default=0, verbose_name='Количество блюд')),
+                ('calories_count', models.PositiveIntegerField(default=0, verbose_name='Блюд с калориями')),
+                ('calories_sum', models.FloatField(default=0, verbose_name='Сумма калорий')),
+                ('calories_min', models.FloatField(blank=True, null=True, verbose_name='Минимум калорий')),
+                ('calories_max', models.FloatField(blank=True, null=True, verbose_name='Максимум калорий')),
+                ('proteins_count', models.PositiveIntegerField(default=0, verbose_name='Блюд с белками')),
+                ('proteins_sum', models.FloatField(default=0, verbose_name='Сумма белков')),
+                ('proteins_min', models.FloatField(blank=True, null=True, verbose_name='Минимум белков')),
+                ('proteins_max', models.FloatField(blank=True, null=True, verbose_name='Максимум белков')),
+                ('fats_count', models.PositiveIntegerField(default=0, verbose_name='Блюд с жирами')),
+                ('fats_sum', models.FloatField(default=0, verbose_name='Сумма жиров')),
+                ('fats_min', models.FloatField(blank=True, null=True, verbose_name='Минимум жиров')),
+                ('fats_max', models.FloatField(blank=True, null=True, verbose_name='Максимум жиров')),
+                ('carbohydrates_count', models.PositiveIntegerField(default=0, verbose_name='Блюд с углеводами')),
+                ('carbohydrates_sum', models.FloatField(default=0, verbose_name='Сумма углеводов')),
+                ('carbohydrates_min', models.FloatField(blank=True, null=True, verbose_name='Минимум углеводов')),
+                ('carbohydrates_max', models.FloatField(blank=True, null=True, verbose_name='Максимум углеводов')),
+                ('allergen_usage', models.JSONField(blank=True, default=dict, verbose_name='Число блюд по аллергенам')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Сводка питания пользователя',
+                'verbose_name_plural': 'Сводки питания пользователей',
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
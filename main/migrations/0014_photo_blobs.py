@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:06
+
+import main.storage
+from django.db import migrations, models
+
+from main.storage import rebuild_blob_counts
+
+
+def count_photo_references(apps, schema_editor):
+    rebuild_blob_counts(
+        dish_model=apps.get_model('main', 'Dish'),
+        blob_model=apps.get_model('main', 'PhotoBlob'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_background_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+            ],
+            options={
+                'verbose_name': 'Файл фотографии',
+                'verbose_name_plural': 'Файлы фотографий',
+            },
+        ),
+        migrations.AlterField(
+            model_name='dish',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=main.storage.ContentAddressedStorage(), upload_to='', verbose_name='Фотография блюда'),
+        ),
+        migrations.RunPython(count_photo_references, migrations.RunPython.noop),
+    ]
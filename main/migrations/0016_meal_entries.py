@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_cache_versions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyIntake',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_count', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('incomplete_entries', models.PositiveIntegerField(default=0, verbose_name='Записей без части нутриентов')),
+                ('calories', models.FloatField(default=0, verbose_name='Калории')),
+                ('proteins', models.FloatField(default=0, verbose_name='Белки')),
+                ('fats', models.FloatField(default=0, verbose_name='Жиры')),
+                ('carbohydrates', models.FloatField(default=0, verbose_name='Углеводы')),
+                ('day', models.DateField(verbose_name='День')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итоги дня',
+                'verbose_name_plural': 'Итоги дней',
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='daily_intake_user_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MealEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField(max_length=100, verbose_name='Название блюда')),
+                ('portion', models.FloatField(default=1, verbose_name='Порция')),
+                ('eaten_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время приёма пищи')),
+                ('eaten_on', models.DateField(editable=False, verbose_name='День')),
+                ('calories', models.FloatField(blank=True, null=True, verbose_name='Калории')),
+                ('proteins', models.FloatField(blank=True, null=True, verbose_name='Белки')),
+                ('fats', models.FloatField(blank=True, null=True, verbose_name='Жиры')),
+                ('carbohydrates', models.FloatField(blank=True, null=True, verbose_name='Углеводы')),
+                ('dish', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='meal_entries', to='main.dish', verbose_name='Блюдо')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_entries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись дневника',
+                'verbose_name_plural': 'Записи дневника',
+                'indexes': [models.Index(fields=['user', 'eaten_on', 'eaten_at'], name='meal_user_day_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WeeklyIntake',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_count', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('incomplete_entries', models.PositiveIntegerField(default=0, verbose_name='Записей без части нутриентов')),
+                ('calories', models.FloatField(default=0, verbose_name='Калории')),
+                ('proteins', models.FloatField(default=0, verbose_name='Белки')),
+                ('fats', models.FloatField(default=0, verbose_name='Жиры')),
+                ('carbohydrates', models.FloatField(default=0, verbose_name='Углеводы')),
+                ('week_start', models.DateField(verbose_name='Начало недели')),
+                ('days_logged', models.PositiveSmallIntegerField(default=0, verbose_name='Дней с записями')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итоги недели',
+                'verbose_name_plural': 'Итоги недель',
+                'constraints': [models.UniqueConstraint(fields=('user', 'week_start'), name='weekly_intake_user_week_uniq')],
+            },
+        ),
+    ]
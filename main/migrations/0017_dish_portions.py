@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_meal_entries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Serving',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='Название порции')),
+                ('weight_grams', models.FloatField(verbose_name='Вес, г')),
+                ('calories', models.FloatField(blank=True, editable=False, null=True, verbose_name='Калории')),
+                ('proteins', models.FloatField(blank=True, editable=False, null=True, verbose_name='Белки')),
+                ('fats', models.FloatField(blank=True, editable=False, null=True, verbose_name='Жиры')),
+                ('carbohydrates', models.FloatField(blank=True, editable=False, null=True, verbose_name='Углеводы')),
+            ],
+            options={
+                'verbose_name': 'Порция',
+                'verbose_name_plural': 'Порции',
+                'ordering': ['weight_grams', 'pk'],
+            },
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='calories_100g',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Калории на 100 г'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='carbohydrates_100g',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Углеводы на 100 г'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='fats_100g',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Жиры на 100 г'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='proteins_100g',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Белки на 100 г'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='weight_grams',
+            field=models.FloatField(blank=True, null=True, verbose_name='Вес порции, г'),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['user', 'calories_100g'], name='dish_user_calories_100g_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['user', 'proteins_100g'], name='dish_user_proteins_100g_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['user', 'fats_100g'], name='dish_user_fats_100g_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['user', 'carbohydrates_100g'], name='dish_user_carbs_100g_idx'),
+        ),
+        migrations.AddField(
+            model_name='serving',
+            name='dish',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='servings', to='main.dish', verbose_name='Блюдо'),
+        ),
+        migrations.AddIndex(
+            model_name='serving',
+            index=models.Index(fields=['dish', 'weight_grams'], name='serving_dish_weight_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_dish_portions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DishComponent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.FloatField(default=1, verbose_name='Количество порций')),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='used_in', to='main.dish', verbose_name='Составная часть')),
+                ('parent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='components', to='main.dish', verbose_name='Блюдо-рецепт')),
+            ],
+            options={
+                'verbose_name': 'Часть рецепта',
+                'verbose_name_plural': 'Части рецептов',
+                'indexes': [models.Index(fields=['component', 'parent'], name='dish_component_used_in_idx')],
+                'constraints': [models.UniqueConstraint(fields=('parent', 'component'), name='dish_component_uniq'), models.CheckConstraint(condition=models.Q(('parent', models.F('component')), _negated=True), name='dish_component_not_self')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_dish_components'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='allergen',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_global', True), ('mask_bit__isnull', False)), fields=('mask_bit',), name='unique_global_mask_bit'),
+        ),
+        migrations.AddConstraint(
+            model_name='allergen',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_global', False), ('mask_bit__isnull', False)), fields=('created_by', 'mask_bit'), name='unique_user_mask_bit'),
+        ),
+    ]
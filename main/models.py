@@ -1,5 +1,8 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+from .storage import photo_storage
 
 
 class User(models.Model):
@@ -54,6 +57,12 @@ class Allergen(models.Model):
         blank=True,
         verbose_name='Создал'
     )
+    mask_bit = models.SmallIntegerField(
+        verbose_name='Бит в маске аллергенов блюда',
+        null=True,
+        blank=True,
+        editable=False
+    )
 
     def __str__(self):
         """
@@ -75,10 +84,39 @@ class Allergen(models.Model):
                 fields=['name'],
                 condition=models.Q(is_global=True),
                 name='unique_global_allergen'
-            )
+            ),
+            # Бит глобального аллергена уникален среди глобальных,
+            # бит пользовательского — среди аллергенов пользователя.
+            models.UniqueConstraint(
+                fields=['mask_bit'],
+                condition=models.Q(is_global=True, mask_bit__isnull=False),
+                name='unique_global_mask_bit'
+            ),
+            models.UniqueConstraint(
+                fields=['created_by', 'mask_bit'],
+                condition=models.Q(is_global=False, mask_bit__isnull=False),
+                name='unique_user_mask_bit'
+            ),
         ]
 
 
+# Поля пищевой ценности блюда, по которым считается статистика.
+MACRO_FIELDS = ('calories', 'proteins', 'fats', 'carbohydrates')
+
+# Столбцы блюда с теми же нутриентами в пересчёте на 100 г.
+PER_100G_FIELDS = {field: f'{field}_100g' for field in MACRO_FIELDS}
+
+
+def per_100g(value, weight_grams):
+    """
+    Пересчитывает значение на порцию весом ``weight_grams`` на 100 г;
+    без значения или веса возвращает None.
+    """
+    if value is None or not weight_grams:
+        return None
+    return value * 100 / weight_grams
+
+
 class Dish(models.Model):
     """
     Модель блюда.
@@ -103,6 +141,21 @@ class Dish(models.Model):
     proteins = models.FloatField(verbose_name='Белки', blank=True, null=True)
     fats = models.FloatField(verbose_name='Жиры', blank=True, null=True)
     carbohydrates = models.FloatField(verbose_name='Углеводы', blank=True, null=True)
+    weight_grams = models.FloatField(verbose_name='Вес порции, г', blank=True, null=True)
+    # Нутриенты на 100 г пересчитываются из значений на порцию
+    # при сохранении и известны только у блюд с указанным весом.
+    calories_100g = models.FloatField(
+        verbose_name='Калории на 100 г', blank=True, null=True, editable=False
+    )
+    proteins_100g = models.FloatField(
+        verbose_name='Белки на 100 г', blank=True, null=True, editable=False
+    )
+    fats_100g = models.FloatField(
+        verbose_name='Жиры на 100 г', blank=True, null=True, editable=False
+    )
+    carbohydrates_100g = models.FloatField(
+        verbose_name='Углеводы на 100 г', blank=True, null=True, editable=False
+    )
     url = models.URLField(verbose_name='Ссылка на рецепт', blank=True, null=True)
     allergens = models.ManyToManyField(
         Allergen,
@@ -114,13 +167,42 @@ class Dish(models.Model):
         auto_now_add=True,
         verbose_name='Дата добавления блюда'
     )
+    allergen_mask = models.BigIntegerField(
+        verbose_name='Битовая маска аллергенов',
+        default=0,
+        editable=False
+    )
 
     photo = models.ImageField(
         upload_to='',
+        storage=photo_storage,
         blank=True,
         null=True,
         verbose_name="Фотография блюда"
     )
+    photo_renditions = models.JSONField(
+        verbose_name='Уменьшенные копии фотографии',
+        default=dict,
+        blank=True,
+        editable=False
+    )
+
+    PHOTO_PROCESSING = 'processing'
+    PHOTO_READY = 'ready'
+    PHOTO_FAILED = 'failed'
+    PHOTO_STATUS_CHOICES = [
+        (PHOTO_PROCESSING, 'Обрабатывается'),
+        (PHOTO_READY, 'Готово'),
+        (PHOTO_FAILED, 'Ошибка обработки'),
+    ]
+    photo_status = models.CharField(
+        verbose_name='Состояние обработки фотографии',
+        max_length=20,
+        choices=PHOTO_STATUS_CHOICES,
+        blank=True,
+        default='',
+        editable=False
+    )
 
     def __str__(self):
         """
@@ -128,7 +210,485 @@ class Dish(models.Model):
         """
         return self.name
 
+    def _rendition_url(self, label, extension):
+        name = self.photo_renditions.get(label, {}).get(extension)
+        return self.photo.storage.url(name) if name else ''
+
+    def _srcset(self, extension):
+        return ', '.join(
+            f"{self.photo.storage.url(rendition[extension])} {rendition['width']}w"
+            for rendition in self.photo_renditions.values()
+            if extension in rendition
+        )
+
+    def fill_per_100g(self):
+        """
+        Пересчитывает нутриенты на 100 г из значений на порцию и веса.
+        """
+        for field in MACRO_FIELDS:
+            value = getattr(self, field)
+            setattr(self, PER_100G_FIELDS[field], per_100g(value, self.weight_grams))
+
+    @property
+    def photo_thumb_url(self):
+        """URL миниатюры фотографии в JPEG."""
+        return self._rendition_url('thumb', 'jpeg')
+
+    @property
+    def photo_medium_url(self):
+        """URL средней копии фотографии, а без неё — оригинала."""
+        url = self._rendition_url('medium', 'jpeg')
+        if not url and self.photo:
+            url = self.photo.url
+        return url
+
+    @property
+    def photo_srcset_webp(self):
+        """Значение srcset для копий в WebP."""
+        return self._srcset('webp')
+
+    @property
+    def photo_srcset_jpeg(self):
+        """Значение srcset для копий в JPEG."""
+        return self._srcset('jpeg')
+
     class Meta:
-        """Метаданные модели блюда."""
+        """Метаданные и индексы модели блюда."""
         verbose_name = 'Блюдо'
         verbose_name_plural = 'Блюда'
+        # Список блюд всегда фильтруется по пользователю, а затем
+        # сортируется или ограничивается диапазоном по одному из полей.
+        # Индексы возрастающие: обратный проход по ним даёт порядок
+        # по убыванию вместе с уточняющим ключом id.
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='dish_user_created_idx'),
+            models.Index(fields=['user', 'name'], name='dish_user_name_idx'),
+            models.Index(fields=['user', 'calories'], name='dish_user_calories_idx'),
+            models.Index(fields=['user', 'proteins'], name='dish_user_proteins_idx'),
+            models.Index(fields=['user', 'fats'], name='dish_user_fats_idx'),
+            models.Index(fields=['user', 'carbohydrates'], name='dish_user_carbs_idx'),
+            models.Index(fields=['user', 'allergen_mask'], name='dish_user_allergens_idx'),
+            models.Index(fields=['user', 'calories_100g'], name='dish_user_calories_100g_idx'),
+            models.Index(fields=['user', 'proteins_100g'], name='dish_user_proteins_100g_idx'),
+            models.Index(fields=['user', 'fats_100g'], name='dish_user_fats_100g_idx'),
+            models.Index(fields=['user', 'carbohydrates_100g'], name='dish_user_carbs_100g_idx'),
+        ]
+
+
+class Serving(models.Model):
+    """
+    Именованная порция блюда (например, «тарелка» или «ломтик»).
+
+    Нутриенты порции хранятся готовыми: они считаются из значений
+    блюда на 100 г при сохранении порции и обновляются при изменении
+    блюда. У блюда без веса нутриенты порций не известны.
+    """
+
+    dish = models.ForeignKey(
+        Dish,
+        on_delete=models.CASCADE,
+        related_name='servings',
+        verbose_name='Блюдо'
+    )
+    name = models.CharField(max_length=50, verbose_name='Название порции')
+    weight_grams = models.FloatField(verbose_name='Вес, г')
+
+    calories = models.FloatField(verbose_name='Калории', blank=True, null=True, editable=False)
+    proteins = models.FloatField(verbose_name='Белки', blank=True, null=True, editable=False)
+    fats = models.FloatField(verbose_name='Жиры', blank=True, null=True, editable=False)
+    carbohydrates = models.FloatField(
+        verbose_name='Углеводы', blank=True, null=True, editable=False
+    )
+
+    def __str__(self):
+        """
+        Возвращает название и вес порции.
+        """
+        return f'{self.name} ({self.weight_grams:g} г)'
+
+    def fill_from_dish(self):
+        """
+        Пересчитывает нутриенты порции из значений блюда на 100 г.
+        """
+        for field in MACRO_FIELDS:
+            value = getattr(self.dish, PER_100G_FIELDS[field])
+            setattr(self, field, None if value is None else value * self.weight_grams / 100)
+
+    @property
+    def portion(self):
+        """
+        Размер порции в долях основной порции блюда или None без веса блюда.
+        """
+        if not self.dish.weight_grams:
+            return None
+        return self.weight_grams / self.dish.weight_grams
+
+    class Meta:
+        """Метаданные порции блюда."""
+        verbose_name = 'Порция'
+        verbose_name_plural = 'Порции'
+        ordering = ['weight_grams', 'pk']
+        indexes = [
+            models.Index(fields=['dish', 'weight_grams'], name='serving_dish_weight_idx'),
+        ]
+
+
+class DishComponent(models.Model):
+    """
+    Составная часть блюда-рецепта: другое блюдо и количество его порций.
+
+    Нутриенты рецепта и объединение аллергенов его частей хранятся
+    в самом блюде-рецепте и пересчитываются при изменении частей
+    (см. ``main.composition``), поэтому списки и фильтры читают
+    обычные столбцы ``Dish``.
+    """
+
+    parent = models.ForeignKey(
+        Dish,
+        on_delete=models.CASCADE,
+        related_name='components',
+        verbose_name='Блюдо-рецепт'
+    )
+    component = models.ForeignKey(
+        Dish,
+        on_delete=models.CASCADE,
+        related_name='used_in',
+        verbose_name='Составная часть'
+    )
+    quantity = models.FloatField(verbose_name='Количество порций', default=1)
+
+    def __str__(self):
+        """
+        Возвращает часть рецепта и её количество.
+        """
+        return f'{self.component} × {self.quantity:g}'
+
+    class Meta:
+        """Метаданные и ограничения части рецепта."""
+        verbose_name = 'Часть рецепта'
+        verbose_name_plural = 'Части рецептов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['parent', 'component'], name='dish_component_uniq'
+            ),
+            models.CheckConstraint(
+                condition=~models.Q(parent=models.F('component')),
+                name='dish_component_not_self'
+            ),
+        ]
+        # Прямой проход (части рецепта) идёт по уникальному индексу,
+        # обратный (рецепты, в которые входит блюдо) — по этому.
+        indexes = [
+            models.Index(fields=['component', 'parent'], name='dish_component_used_in_idx'),
+        ]
+
+
+class UserNutritionSummary(models.Model):
+    """
+    Сводная статистика по блюдам пользователя.
+
+    Обновляется инкрементально сигналами при изменении блюд,
+    чтобы страницы профиля и списка блюд не пересчитывали её
+    по всем строкам ``Dish``. Поля ``<нутриент>_count`` хранят число
+    блюд с заполненным значением и нужны для расчёта среднего.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='nutrition_summary',
+        verbose_name='Пользователь'
+    )
+    dish_count = models.PositiveIntegerField(verbose_name='Количество блюд', default=0)
+
+    calories_count = models.PositiveIntegerField(verbose_name='Блюд с калориями', default=0)
+    calories_sum = models.FloatField(verbose_name='Сумма калорий', default=0)
+    calories_min = models.FloatField(verbose_name='Минимум калорий', null=True, blank=True)
+    calories_max = models.FloatField(verbose_name='Максимум калорий', null=True, blank=True)
+
+    proteins_count = models.PositiveIntegerField(verbose_name='Блюд с белками', default=0)
+    proteins_sum = models.FloatField(verbose_name='Сумма белков', default=0)
+    proteins_min = models.FloatField(verbose_name='Минимум белков', null=True, blank=True)
+    proteins_max = models.FloatField(verbose_name='Максимум белков', null=True, blank=True)
+
+    fats_count = models.PositiveIntegerField(verbose_name='Блюд с жирами', default=0)
+    fats_sum = models.FloatField(verbose_name='Сумма жиров', default=0)
+    fats_min = models.FloatField(verbose_name='Минимум жиров', null=True, blank=True)
+    fats_max = models.FloatField(verbose_name='Максимум жиров', null=True, blank=True)
+
+    carbohydrates_count = models.PositiveIntegerField(verbose_name='Блюд с углеводами', default=0)
+    carbohydrates_sum = models.FloatField(verbose_name='Сумма углеводов', default=0)
+    carbohydrates_min = models.FloatField(verbose_name='Минимум углеводов', null=True, blank=True)
+    carbohydrates_max = models.FloatField(verbose_name='Максимум углеводов', null=True, blank=True)
+
+    allergen_usage = models.JSONField(
+        verbose_name='Число блюд по аллергенам',
+        default=dict,
+        blank=True
+    )
+    updated_at = models.DateTimeField(verbose_name='Обновлено', auto_now=True)
+
+    def __str__(self):
+        """
+        Возвращает логин пользователя, к которому относится сводка.
+        """
+        return str(self.user)
+
+    def as_stats(self):
+        """
+        Возвращает статистику в формате ``DishesListView.get_dish_stats``.
+        """
+        stats = {'count': self.dish_count}
+        for field in MACRO_FIELDS:
+            count = getattr(self, f'{field}_count')
+            total = getattr(self, f'{field}_sum')
+            stats[field] = {
+                'avg': total / count if count else None,
+                'min': getattr(self, f'{field}_min'),
+                'max': getattr(self, f'{field}_max'),
+                'sum': total if count else None,
+            }
+        return stats
+
+    class Meta:
+        """Метаданные сводной статистики пользователя."""
+        verbose_name = 'Сводка питания пользователя'
+        verbose_name_plural = 'Сводки питания пользователей'
+
+
+class Job(models.Model):
+    """
+    Фоновая задача в очереди, хранящейся в базе данных.
+
+    Задачи создаются в той же транзакции, что и изменения данных,
+    и выполняются процессами ``manage.py run_worker``.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    kind = models.CharField(verbose_name='Тип задачи', max_length=50)
+    payload = models.JSONField(verbose_name='Параметры', default=dict, blank=True)
+    status = models.CharField(
+        verbose_name='Состояние',
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField(verbose_name='Максимум попыток', default=3)
+    run_after = models.DateTimeField(verbose_name='Не раньше', default=timezone.now)
+    locked_at = models.DateTimeField(verbose_name='Взята в работу', null=True, blank=True)
+    locked_by = models.CharField(verbose_name='Обработчик', max_length=100, blank=True)
+    last_error = models.TextField(verbose_name='Последняя ошибка', blank=True)
+    created_at = models.DateTimeField(verbose_name='Создана', auto_now_add=True)
+    finished_at = models.DateTimeField(verbose_name='Завершена', null=True, blank=True)
+
+    def __str__(self):
+        """
+        Возвращает тип и номер задачи.
+        """
+        return f'{self.kind} #{self.pk}'
+
+    class Meta:
+        """Метаданные фоновой задачи."""
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+
+class PhotoBlob(models.Model):
+    """
+    Файл фотографии в хранилище и число блюд, которые на него ссылаются.
+
+    Одинаковые фотографии хранятся одним файлом; он удаляется,
+    когда счётчик ссылок доходит до нуля.
+    """
+
+    name = models.CharField(verbose_name='Имя файла', max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(verbose_name='Число ссылок', default=0)
+    created_at = models.DateTimeField(verbose_name='Создан', auto_now_add=True)
+
+    def __str__(self):
+        """
+        Возвращает имя файла.
+        """
+        return self.name
+
+    class Meta:
+        """Метаданные файла фотографии."""
+        verbose_name = 'Файл фотографии'
+        verbose_name_plural = 'Файлы фотографий'
+
+
+class CacheVersion(models.Model):
+    """
+    Номер версии данных, входящий в ключи кеша.
+
+    Любое изменение данных области (``user:<id>`` — блюда и аллергены
+    пользователя, ``global`` — общие данные, например глобальные аллергены)
+    увеличивает номер, и старые записи кеша просто перестают
+    находиться. Номер хранится в базе, поэтому он общий для всех
+    процессов при любом бэкенде кеша.
+    """
+
+    scope = models.CharField(verbose_name='Область', max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(verbose_name='Версия', default=1)
+
+    def __str__(self):
+        """
+        Возвращает область и номер версии.
+        """
+        return f'{self.scope}: {self.version}'
+
+    class Meta:
+        """Метаданные версии кеша."""
+        verbose_name = 'Версия кеша'
+        verbose_name_plural = 'Версии кеша'
+
+
+class MealEntry(models.Model):
+    """
+    Запись дневника: съеденная порция блюда.
+
+    Название и нутриенты порции (значения блюда, умноженные на размер
+    порции) сохраняются в записи: дальнейшие правки или удаление блюда
+    не меняют уже съеденное. ``eaten_on`` — день записи в часовом поясе
+    проекта, по нему записи попадают в дневные и недельные итоги.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='meal_entries',
+        verbose_name='Пользователь'
+    )
+    dish = models.ForeignKey(
+        Dish,
+        on_delete=models.SET_NULL,
+        related_name='meal_entries',
+        null=True,
+        blank=True,
+        verbose_name='Блюдо'
+    )
+    name = models.TextField(max_length=100, verbose_name='Название блюда')
+    portion = models.FloatField(verbose_name='Порция', default=1)
+    eaten_at = models.DateTimeField(verbose_name='Время приёма пищи', default=timezone.now)
+    eaten_on = models.DateField(verbose_name='День', editable=False)
+
+    calories = models.FloatField(verbose_name='Калории', blank=True, null=True)
+    proteins = models.FloatField(verbose_name='Белки', blank=True, null=True)
+    fats = models.FloatField(verbose_name='Жиры', blank=True, null=True)
+    carbohydrates = models.FloatField(verbose_name='Углеводы', blank=True, null=True)
+
+    def __str__(self):
+        """
+        Возвращает название блюда и день записи.
+        """
+        return f'{self.name} ({self.eaten_on})'
+
+    def fill_from_dish(self):
+        """
+        Переносит название и нутриенты блюда с учётом порции.
+        """
+        self.name = self.dish.name
+        for field in MACRO_FIELDS:
+            value = getattr(self.dish, field)
+            setattr(self, field, None if value is None else value * self.portion)
+
+    class Meta:
+        """Метаданные и индексы записи дневника."""
+        verbose_name = 'Запись дневника'
+        verbose_name_plural = 'Записи дневника'
+        indexes = [
+            models.Index(fields=['user', 'eaten_on', 'eaten_at'], name='meal_user_day_idx'),
+        ]
+
+
+class IntakeTotals(models.Model):
+    """
+    Общие поля дневных и недельных итогов дневника.
+
+    ``incomplete_entries`` — число записей, у которых не указан
+    хотя бы один нутриент: суммы по таким дням неполные.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    entry_count = models.PositiveIntegerField(verbose_name='Записей', default=0)
+    incomplete_entries = models.PositiveIntegerField(verbose_name='Записей без части нутриентов', default=0)
+    calories = models.FloatField(verbose_name='Калории', default=0)
+    proteins = models.FloatField(verbose_name='Белки', default=0)
+    fats = models.FloatField(verbose_name='Жиры', default=0)
+    carbohydrates = models.FloatField(verbose_name='Углеводы', default=0)
+
+    class Meta:
+        """Метаданные общих полей итогов."""
+        abstract = True
+
+
+class DailyIntake(IntakeTotals):
+    """
+    Итоги дневника пользователя за день.
+
+    Поддерживаются сигналами при изменении записей; строка
+    удаляется, когда за день не остаётся записей.
+    """
+
+    day = models.DateField(verbose_name='День')
+
+    def __str__(self):
+        """
+        Возвращает пользователя и день.
+        """
+        return f'{self.user}: {self.day}'
+
+    class Meta:
+        """Метаданные дневных итогов."""
+        verbose_name = 'Итоги дня'
+        verbose_name_plural = 'Итоги дней'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='daily_intake_user_day_uniq'),
+        ]
+
+
+class WeeklyIntake(IntakeTotals):
+    """
+    Итоги дневника пользователя за неделю, начиная с понедельника.
+    """
+
+    week_start = models.DateField(verbose_name='Начало недели')
+    days_logged = models.PositiveSmallIntegerField(verbose_name='Дней с записями', default=0)
+
+    def __str__(self):
+        """
+        Возвращает пользователя и начало недели.
+        """
+        return f'{self.user}: {self.week_start}'
+
+    @property
+    def calories_per_day(self):
+        """Средние калории за день с записями."""
+        return self.calories / self.days_logged if self.days_logged else None
+
+    class Meta:
+        """Метаданные недельных итогов."""
+        verbose_name = 'Итоги недели'
+        verbose_name_plural = 'Итоги недель'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'week_start'], name='weekly_intake_user_week_uniq'),
+        ]
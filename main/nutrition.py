@@ -0,0 +1,191 @@
+"""
+Инкрементальное обновление сводок ``UserNutritionSummary``.
+
+Суммы и количества меняются на разницу между старым и новым
+значениями блюда. Минимум и максимум при добавлении обновляются
+сравнением, а при удалении граничного значения пересчитываются
+запросом, который идёт по индексу (user, <нутриент>).
+"""
+
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+
+from .models import MACRO_FIELDS, Dish, UserNutritionSummary
+
+
+def dish_macros(dish):
+    """
+    Возвращает значения нутриентов блюда в виде словаря.
+    """
+    return {field: getattr(dish, field) for field in MACRO_FIELDS}
+
+
+def _locked_summary(user_id):
+    summary, _ = UserNutritionSummary.objects.select_for_update().get_or_create(
+        user_id=user_id
+    )
+    return summary
+
+
+def apply_dish_change(user_id, old=None, new=None):
+    """
+    Учитывает в сводке пользователя создание (``old=None``),
+    изменение или удаление (``new=None``) блюда.
+    """
+    with transaction.atomic():
+        summary = _locked_summary(user_id)
+
+        if old is None and new is not None:
+            summary.dish_count += 1
+        elif old is not None and new is None:
+            summary.dish_count = max(summary.dish_count - 1, 0)
+
+        stale = []
+        for field in MACRO_FIELDS:
+            old_value = old.get(field) if old else None
+            new_value = new.get(field) if new else None
+            if old_value == new_value:
+                continue
+
+            count = getattr(summary, f'{field}_count')
+            total = getattr(summary, f'{field}_sum')
+            low = getattr(summary, f'{field}_min')
+            high = getattr(summary, f'{field}_max')
+
+            if old_value is not None:
+                count -= 1
+                total -= old_value
+                if old_value in (low, high):
+                    stale.append(field)
+
+            if new_value is not None:
+                count += 1
+                total += new_value
+                low = new_value if low is None else min(low, new_value)
+                high = new_value if high is None else max(high, new_value)
+
+            setattr(summary, f'{field}_count', max(count, 0))
+            setattr(summary, f'{field}_sum', total if count > 0 else 0)
+            setattr(summary, f'{field}_min', low)
+            setattr(summary, f'{field}_max', high)
+
+        for field in stale:
+            bounds = Dish.objects.filter(user_id=user_id).aggregate(
+                low=Min(field), high=Max(field)
+            )
+            setattr(summary, f'{field}_min', bounds['low'])
+            setattr(summary, f'{field}_max', bounds['high'])
+
+        summary.save()
+
+
+def apply_allergen_usage(deltas):
+    """
+    Изменяет счётчики аллергенов в сводках.
+
+    ``deltas`` — отображение ``(user_id, allergen_id) -> изменение``.
+    """
+    by_user = defaultdict(dict)
+    for (user_id, allergen_id), delta in deltas.items():
+        if delta:
+            by_user[user_id][str(allergen_id)] = delta
+
+    for user_id, changes in by_user.items():
+        with transaction.atomic():
+            summary = _locked_summary(user_id)
+            usage = dict(summary.allergen_usage)
+            for key, delta in changes.items():
+                value = usage.get(key, 0) + delta
+                if value > 0:
+                    usage[key] = value
+                else:
+                    usage.pop(key, None)
+            summary.allergen_usage = usage
+            summary.save(update_fields=['allergen_usage', 'updated_at'])
+
+
+def forget_allergen(allergen_id):
+    """
+    Удаляет счётчик удалённого аллергена из всех сводок.
+    """
+    key = str(allergen_id)
+    summaries = UserNutritionSummary.objects.filter(allergen_usage__has_key=key)
+    for summary in summaries:
+        summary.allergen_usage.pop(key, None)
+        summary.save(update_fields=['allergen_usage', 'updated_at'])
+
+
+def get_summary(user):
+    """
+    Возвращает сводку пользователя для чтения.
+
+    Строку создаёт только запись (``_locked_summary``), поэтому
+    у пользователя без блюд возвращается пустая несохранённая сводка:
+    GET-запросы не должны выполнять INSERT.
+    """
+    summary = UserNutritionSummary.objects.filter(user=user).first()
+    return summary or UserNutritionSummary(user=user)
+
+
+def rebuild_summaries(user_ids=None, dish_model=Dish,
+                      summary_model=UserNutritionSummary):
+    """
+    Пересчитывает сводки с нуля по таблице блюд.
+
+    Если ``user_ids`` не передан, пересчитываются сводки всех
+    пользователей, у которых есть блюда или сводка.
+    Возвращает число сводок, значения которых изменились.
+    """
+    dishes = dish_model.objects.all()
+    summaries = summary_model.objects.all()
+    if user_ids is not None:
+        dishes = dishes.filter(user_id__in=user_ids)
+        summaries = summaries.filter(user_id__in=user_ids)
+
+    aggregates = {'dish_count': Count('id')}
+    for field in MACRO_FIELDS:
+        aggregates[f'{field}_count'] = Count(field)
+        aggregates[f'{field}_sum'] = Sum(field)
+        aggregates[f'{field}_min'] = Min(field)
+        aggregates[f'{field}_max'] = Max(field)
+
+    rows = {
+        row.pop('user_id'): row
+        for row in dishes.order_by().values('user_id').annotate(**aggregates)
+    }
+
+    usage = defaultdict(Counter)
+    through = dish_model.allergens.through
+    links = through.objects.filter(dish__in=dishes).order_by().values(
+        'dish__user_id', 'allergen_id'
+    ).annotate(total=Count('id'))
+    for link in links:
+        usage[link['dish__user_id']][str(link['allergen_id'])] = link['total']
+
+    existing = {summary.user_id: summary for summary in summaries}
+    empty = dict.fromkeys(aggregates)
+    changed = 0
+
+    with transaction.atomic():
+        for user_id in set(rows) | set(existing):
+            values = rows.get(user_id, empty)
+            summary = existing.get(user_id) or summary_model(user_id=user_id)
+
+            fresh = {'allergen_usage': dict(usage.get(user_id, {}))}
+            for key, value in values.items():
+                if key.endswith(('_min', '_max')):
+                    fresh[key] = value
+                else:
+                    fresh[key] = value or 0
+
+            if user_id not in existing or any(
+                getattr(summary, key) != value for key, value in fresh.items()
+            ):
+                for key, value in fresh.items():
+                    setattr(summary, key, value)
+                summary.save()
+                changed += 1
+
+    return changed
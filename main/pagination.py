@@ -0,0 +1,204 @@
+"""
+Курсорная (keyset) пагинация списков блюд.
+
+В отличие от постраничной пагинации с OFFSET, страница выбирается
+условием «после последней показанной строки» по ключу сортировки
+и id, поэтому глубокие страницы стоят столько же, сколько первая,
+а COUNT(*) не нужен.
+"""
+
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from datetime import date, datetime
+
+from django.db import connections
+from django.db.models import F, Q
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или выдан для другой сортировки."""
+
+
+def encode_cursor(payload):
+    """
+    Кодирует данные курсора в непрозрачную строку для URL.
+    """
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Декодирует строку курсора, созданную :func:`encode_cursor`.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor('Некорректный курсор') from exc
+    if not isinstance(payload, dict):
+        raise InvalidCursor('Некорректный курсор')
+    return payload
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class CursorPage(Sequence):
+    """
+    Страница курсорной пагинации.
+
+    Ведёт себя как список объектов и дополнительно хранит
+    курсоры соседних страниц.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Пагинатор по ключу сортировки с id в качестве уточняющего ключа.
+
+    ``sort_key`` — имя поля модели, для убывающей сортировки
+    с префиксом ``-``. Пустые значения располагаются так же,
+    как при обычной сортировке в используемой базе данных,
+    чтобы запрос мог идти по индексу.
+    """
+
+    def __init__(self, queryset, sort_key, per_page):
+        self.queryset = queryset
+        self.sort_key = sort_key
+        self.per_page = per_page
+        self.descending = sort_key.startswith('-')
+        self.field = sort_key.lstrip('-')
+        self.nullable = queryset.model._meta.get_field(self.field).null
+
+        nulls_largest = connections[queryset.db].features.nulls_order_largest
+        # NULL в конце выдачи: по возрастанию, если база считает их
+        # наибольшими, по убыванию — если наименьшими.
+        self.nulls_last = nulls_largest != self.descending
+
+    def _ordering(self, descending):
+        if descending:
+            return [F(self.field).desc(), '-pk']
+        return [F(self.field).asc(), 'pk']
+
+    def _after(self, value, pk, descending, nulls_last):
+        """
+        Условие «строго после (value, pk)» в заданном порядке.
+        """
+        lookup = 'lt' if descending else 'gt'
+        field = self.field
+
+        if value is None:
+            condition = Q(**{f'{field}__isnull': True, f'pk__{lookup}': pk})
+            if not nulls_last:
+                condition |= Q(**{f'{field}__isnull': False})
+            return condition
+
+        condition = (
+            Q(**{f'{field}__{lookup}': value})
+            | Q(**{field: value, f'pk__{lookup}': pk})
+        )
+        if self.nullable and nulls_last:
+            condition |= Q(**{f'{field}__isnull': True})
+        return condition
+
+    def _make_cursor(self, obj, direction):
+        return encode_cursor({
+            's': self.sort_key,
+            'v': _serialize(getattr(obj, self.field)),
+            'id': obj.pk,
+            'd': direction,
+        })
+
+    def _parse_cursor(self, cursor):
+        payload = decode_cursor(cursor)
+        if payload.get('s') != self.sort_key or payload.get('d') not in ('n', 'p'):
+            raise InvalidCursor('Курсор выдан для другой сортировки')
+
+        field = self.queryset.model._meta.get_field(self.field)
+        try:
+            value = payload.get('v')
+            if value is not None:
+                value = field.to_python(value)
+            pk = int(payload['id'])
+        except Exception as exc:
+            raise InvalidCursor('Некорректный курсор') from exc
+        return payload['d'], value, pk
+
+    def get_page(self, cursor=None):
+        """
+        Возвращает страницу после (или перед) позицией курсора.
+        """
+        if not cursor:
+            rows = list(
+                self.queryset.order_by(
+                    *self._ordering(self.descending)
+                )[:self.per_page + 1]
+            )
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            return CursorPage(
+                rows,
+                next_cursor=self._make_cursor(rows[-1], 'n') if has_more else None,
+            )
+
+        direction, value, pk = self._parse_cursor(cursor)
+
+        if direction == 'n':
+            condition = self._after(value, pk, self.descending, self.nulls_last)
+            ordering = self._ordering(self.descending)
+        else:
+            condition = self._after(
+                value, pk, not self.descending, not self.nulls_last
+            )
+            ordering = self._ordering(not self.descending)
+
+        rows = list(
+            self.queryset.filter(condition).order_by(*ordering)[:self.per_page + 1]
+        )
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if direction == 'p':
+            rows.reverse()
+
+        if not rows:
+            return CursorPage(rows)
+
+        if direction == 'n':
+            next_cursor = self._make_cursor(rows[-1], 'n') if has_more else None
+            previous_cursor = self._make_cursor(rows[0], 'p')
+        else:
+            next_cursor = self._make_cursor(rows[-1], 'n')
+            previous_cursor = self._make_cursor(rows[0], 'p') if has_more else None
+
+        return CursorPage(
+            rows,
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor,
+        )
@@ -0,0 +1,249 @@
+"""
+Подбор набора блюд под дневную норму КБЖУ.
+
+Блюда пользователя загружаются одним запросом в матрицу NumPy
+(калории, белки, жиры, углеводы), и дальше поиск идёт только
+по массивам. Наборы из одного и двух блюд перебираются полностью,
+если это укладывается в ``EXHAUSTIVE_PAIRS``; большие наборы ищутся
+пакетным локальным поиском: из нескольких случайных наборов
+одновременно пробуется замена каждого блюда на каждое другое,
+пока оценка улучшается. Поиск ограничен по времени и возвращает
+лучший найденный набор.
+
+Оценка набора — относительное отклонение калорий от нормы плюс
+относительный выход белков, жиров и углеводов за заданные границы
+и небольшая добавка за каждое блюдо, чтобы при равенстве выбирался
+набор покороче. Блюдо участвует в подборе, только если у него указаны
+калории и все нутриенты, для которых заданы границы.
+"""
+
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .allergen_masks import exclude_dishes_with_allergens
+from .catalog import get_available_allergens
+from .models import MACRO_FIELDS, Dish
+
+DEFAULT_TIME_BUDGET = 0.5
+DEFAULT_MAX_DISHES = 3
+MAX_DISHES = 6
+
+# Набор считается попавшим в норму, если калории отличаются не больше чем на 5%.
+CALORIE_TOLERANCE = 0.05
+SIZE_PENALTY = 0.001
+
+# Сколько пар можно перебрать целиком и сколько наборов
+# обрабатывать одним массивом при локальном поиске.
+EXHAUSTIVE_PAIRS = 4_000_000
+CHUNK_CELLS = 1_000_000
+BATCH = 32
+MAX_ROUNDS = 8
+
+
+class PlanTarget:
+    """
+    Дневная норма: калории и необязательные границы по нутриентам.
+
+    ``bounds`` — словарь ``{'proteins': (минимум, максимум), ...}``,
+    любая граница может быть ``None``.
+    """
+
+    def __init__(self, calories, bounds=None):
+        self.calories = float(calories)
+        self.bounds = {
+            field: (low, high)
+            for field, (low, high) in (bounds or {}).items()
+            if low is not None or high is not None
+        }
+
+    @property
+    def required_fields(self):
+        return ('calories', *self.bounds)
+
+    def score(self, sums, size):
+        """
+        Оценка наборов по суммам нутриентов ``sums`` (последняя ось —
+        ``MACRO_FIELDS``); чем меньше, тем лучше.
+        """
+        total = np.abs(sums[..., 0] - self.calories) / self.calories
+        for field, (low, high) in self.bounds.items():
+            values = sums[..., MACRO_FIELDS.index(field)]
+            scale = max(high if high is not None else low, 1.0)
+            if low is not None:
+                total = total + np.maximum(low - values, 0) / scale
+            if high is not None:
+                total = total + np.maximum(values - high, 0) / scale
+        return total + SIZE_PENALTY * size
+
+    def is_met(self, totals):
+        """
+        Проверяет, что итоги набора укладываются в норму.
+        """
+        if abs(totals['calories'] - self.calories) > self.calories * CALORIE_TOLERANCE:
+            return False
+        return all(
+            (low is None or totals[field] >= low) and (high is None or totals[field] <= high)
+            for field, (low, high) in self.bounds.items()
+        )
+
+
+class SearchResult:
+    """
+    Лучший найденный набор: номера строк матрицы и оценка.
+    """
+
+    def __init__(self):
+        self.rows = ()
+        self.score = np.inf
+        self.evaluated = 0
+        self.timed_out = False
+
+    def offer(self, scores, combos):
+        self.evaluated += scores.size
+        if not scores.size:
+            return
+        best = int(np.argmin(scores))
+        if scores.flat[best] < self.score:
+            self.score = float(scores.flat[best])
+            self.rows = tuple(int(row) for row in combos(best))
+
+
+def _search_pairs(values, target, result, deadline):
+    n = len(values)
+    chunk = max(1, CHUNK_CELLS // n)
+    columns = np.arange(n)
+    for start in range(0, n, chunk):
+        if time.perf_counter() > deadline:
+            result.timed_out = True
+            return
+        stop = min(start + chunk, n)
+        scores = target.score(values[start:stop, None, :] + values[None, :, :], 2)
+        # Каждая пара один раз: второе блюдо с большим номером строки.
+        scores[columns[None, :] <= np.arange(start, stop)[:, None]] = np.inf
+        result.offer(scores, lambda flat: (start + flat // n, flat % n))
+
+
+def _local_search(values, target, size, result, deadline, rng):
+    n = len(values)
+    batch = min(BATCH, max(1, CHUNK_CELLS // n))
+    rows = np.arange(batch)[:, None]
+
+    for _ in range(MAX_ROUNDS):
+        combos = np.argpartition(rng.random((batch, n)), size - 1, axis=1)[:, :size]
+        sums = values[combos].sum(axis=1)
+        scores = target.score(sums, size)
+
+        improved = True
+        while improved:
+            improved = False
+            for position in range(size):
+                if time.perf_counter() > deadline:
+                    result.timed_out = True
+                    result.offer(scores, lambda best: combos[best])
+                    return
+                base = sums - values[combos[:, position]]
+                candidates = target.score(base[:, None, :] + values[None, :, :], size)
+                # Блюда, уже входящие в набор, повторно не берутся.
+                candidates[rows, combos] = np.inf
+                choice = np.argmin(candidates, axis=1)
+                new_scores = candidates[rows[:, 0], choice]
+                better = new_scores < scores - 1e-12
+                if better.any():
+                    improved = True
+                    combos[better, position] = choice[better]
+                    sums[better] = base[better] + values[choice[better]]
+                    scores[better] = new_scores[better]
+        result.offer(scores, lambda best: combos[best])
+
+
+def solve(values, target, max_dishes=DEFAULT_MAX_DISHES, time_budget=DEFAULT_TIME_BUDGET, seed=0):
+    """
+    Ищет набор строк ``values`` из не более чем ``max_dishes`` блюд
+    с наименьшей оценкой ``target.score``.
+
+    ``timed_out`` у результата истинно, если поиск остановлен по времени.
+    """
+    deadline = time.perf_counter() + time_budget
+    rng = np.random.default_rng(seed)
+    result = SearchResult()
+    n = len(values)
+
+    largest = min(max_dishes, n)
+    for size in range(1, largest + 1):
+        now = time.perf_counter()
+        if size > 1 and now > deadline:
+            result.timed_out = True
+            break
+        if size == 1:
+            result.offer(target.score(values, 1), lambda best: (best,))
+        elif size == 2 and n * n <= EXHAUSTIVE_PAIRS:
+            _search_pairs(values, target, result, deadline)
+        else:
+            # Оставшееся время делится поровну между размерами наборов.
+            share = (deadline - now) / (largest - size + 1)
+            _local_search(values, target, size, result, now + share, rng)
+    return result
+
+
+class MealPlan:
+    """
+    Подобранный набор блюд с итогами по нутриентам.
+    """
+
+    def __init__(self, target, dishes, candidates, result):
+        self.target = target
+        self.dishes = dishes
+        self.candidates = candidates
+        self.evaluated = result.evaluated
+        self.timed_out = result.timed_out
+        self.totals = {
+            field: sum(getattr(dish, field) or 0 for dish in dishes)
+            for field in MACRO_FIELDS
+        }
+        # Нутриенты, которые указаны не у всех блюд набора.
+        self.partial_fields = [
+            field for field in MACRO_FIELDS
+            if any(getattr(dish, field) is None for dish in dishes)
+        ]
+
+    @property
+    def is_met(self):
+        return bool(self.dishes) and self.target.is_met(self.totals)
+
+
+def load_candidates(user, target, exclude_allergen_ids=(), versions=None):
+    """
+    Загружает id и нутриенты блюд, подходящих для подбора.
+    """
+    queryset = Dish.objects.filter(user=user)
+    if exclude_allergen_ids:
+        queryset = exclude_dishes_with_allergens(
+            queryset, exclude_allergen_ids, get_available_allergens(user, versions)
+        )
+    for field in target.required_fields:
+        queryset = queryset.filter(**{f'{field}__isnull': False})
+
+    rows = list(queryset.order_by('pk').values_list('pk', *MACRO_FIELDS))
+    data = np.array(rows, dtype=np.float64).reshape(len(rows), len(MACRO_FIELDS) + 1)
+    # Нутриенты без границ в оценку не входят.
+    values = np.nan_to_num(data[:, 1:], nan=0.0)
+    return data[:, 0].astype(np.int64), values
+
+
+def plan_meals(user, target, exclude_allergen_ids=(), max_dishes=DEFAULT_MAX_DISHES,
+               time_budget=None, versions=None):
+    """
+    Подбирает до ``max_dishes`` блюд пользователя под норму ``target``,
+    исключая блюда с аллергенами ``exclude_allergen_ids``.
+    """
+    if time_budget is None:
+        time_budget = getattr(settings, 'MEAL_PLANNER_TIME_BUDGET', DEFAULT_TIME_BUDGET)
+    ids, values = load_candidates(user, target, exclude_allergen_ids, versions)
+    result = solve(values, target, max_dishes, time_budget)
+
+    chosen = [int(ids[row]) for row in result.rows]
+    found = Dish.objects.prefetch_related('allergens').in_bulk(chosen) if chosen else {}
+    dishes = [found[pk] for pk in chosen if pk in found]
+    return MealPlan(target, dishes, len(ids), result)
@@ -0,0 +1,40 @@
+"""
+Нутриенты блюд на 100 г и именованные порции.
+
+Значения блюда на порцию остаются основными: по ним считаются
+сводки, дневник и подбор блюд. Если у блюда указан вес порции,
+при сохранении рядом записываются значения на 100 г, а нутриенты
+каждой порции ``Serving`` хранятся готовыми. Поэтому фильтры
+по диапазону и «на порцию», и «на 100 г» идут по индексам
+(пользователь, столбец) без арифметики в условиях запроса.
+"""
+
+from django.db.models import F
+
+from .models import MACRO_FIELDS, PER_100G_FIELDS, Serving
+
+BASIS_SERVING = 'serving'
+BASIS_100G = '100g'
+BASIS_CHOICES = [
+    (BASIS_SERVING, 'На порцию'),
+    (BASIS_100G, 'На 100 г'),
+]
+
+
+def basis_field(field, basis):
+    """
+    Столбец блюда, в котором хранится нутриент ``field`` для основы ``basis``.
+    """
+    return PER_100G_FIELDS[field] if basis == BASIS_100G else field
+
+
+def refresh_servings(dish):
+    """
+    Пересчитывает нутриенты всех порций блюда одним запросом
+    из его значений на 100 г.
+    """
+    values = {}
+    for field in MACRO_FIELDS:
+        value = getattr(dish, PER_100G_FIELDS[field])
+        values[field] = None if value is None else F('weight_grams') * (value / 100)
+    return Serving.objects.filter(dish=dish).update(**values)
@@ -0,0 +1,179 @@
+"""
+Полнотекстовый поиск блюд по названию.
+
+На SQLite используется виртуальная таблица FTS5 с триграммным
+токенизатором, которая синхронизируется с ``main_dish`` триггерами.
+На PostgreSQL — GIN-индекс pg_trgm по ``UPPER(name)``, который
+подхватывается обычным ``icontains``.
+"""
+
+from django.db import connections
+from django.db.models import Func, TextField
+from django.db.models.expressions import RawSQL
+
+DISH_TABLE = 'main_dish'
+DISH_FTS_TABLE = 'main_dish_fts'
+DISH_TRGM_INDEX = 'main_dish_name_trgm'
+
+# Триграммный токенизатор FTS5 не умеет искать строки короче трёх символов.
+TRIGRAM_MIN_LENGTH = 3
+
+SQLITE_FTS_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {DISH_FTS_TABLE} USING fts5("
+    f"name, description, content='{DISH_TABLE}', content_rowid='id', "
+    f"tokenize='trigram')"
+)
+
+SQLITE_FTS_TRIGGERS = {
+    f'{DISH_FTS_TABLE}_ai': (
+        f"CREATE TRIGGER IF NOT EXISTS {DISH_FTS_TABLE}_ai "
+        f"AFTER INSERT ON {DISH_TABLE} BEGIN "
+        f"INSERT INTO {DISH_FTS_TABLE}(rowid, name, description) "
+        f"VALUES (new.id, new.name, new.description); END"
+    ),
+    f'{DISH_FTS_TABLE}_ad': (
+        f"CREATE TRIGGER IF NOT EXISTS {DISH_FTS_TABLE}_ad "
+        f"AFTER DELETE ON {DISH_TABLE} BEGIN "
+        f"INSERT INTO {DISH_FTS_TABLE}({DISH_FTS_TABLE}, rowid, name, description) "
+        f"VALUES ('delete', old.id, old.name, old.description); END"
+    ),
+    f'{DISH_FTS_TABLE}_au': (
+        f"CREATE TRIGGER IF NOT EXISTS {DISH_FTS_TABLE}_au "
+        f"AFTER UPDATE OF name, description ON {DISH_TABLE} BEGIN "
+        f"INSERT INTO {DISH_FTS_TABLE}({DISH_FTS_TABLE}, rowid, name, description) "
+        f"VALUES ('delete', old.id, old.name, old.description); "
+        f"INSERT INTO {DISH_FTS_TABLE}(rowid, name, description) "
+        f"VALUES (new.id, new.name, new.description); END"
+    ),
+}
+
+SQLITE_LOWER_FUNCTION = 'food_diary_lower'
+
+
+class UnicodeLower(Func):
+    """
+    Приведение строки к нижнему регистру с учётом Unicode.
+
+    Встроенная ``LOWER`` в SQLite понимает только ASCII, поэтому
+    для SQLite используется функция, зарегистрированная
+    в :func:`register_sqlite_functions`.
+    """
+
+    function = 'LOWER'
+    output_field = TextField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            function=SQLITE_LOWER_FUNCTION,
+            **extra_context
+        )
+
+
+def _unicode_lower(value):
+    return value.lower() if value is not None else None
+
+
+def register_sqlite_functions(sender, connection, **kwargs):
+    """
+    Регистрирует пользовательские SQL-функции для новых
+    соединений SQLite (обработчик сигнала ``connection_created``).
+    """
+    if connection.vendor != 'sqlite':
+        return
+    connection.connection.create_function(
+        SQLITE_LOWER_FUNCTION, 1, _unicode_lower, deterministic=True
+    )
+
+
+def install_search_index(connection):
+    """
+    Создаёт поисковый индекс для текущего бэкенда.
+
+    Операция идемпотентна. Если на SQLite триггеры синхронизации
+    отсутствовали (например, таблицу пересоздала миграция),
+    индекс перестраивается целиком.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                "AND tbl_name = %s",
+                [DISH_TABLE]
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+
+            cursor.execute(SQLITE_FTS_TABLE_SQL)
+            for sql in SQLITE_FTS_TRIGGERS.values():
+                cursor.execute(sql)
+
+            if not set(SQLITE_FTS_TRIGGERS) <= existing:
+                cursor.execute(
+                    f"INSERT INTO {DISH_FTS_TABLE}({DISH_FTS_TABLE}) "
+                    f"VALUES ('rebuild')"
+                )
+        elif connection.vendor == 'postgresql':
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {DISH_TRGM_INDEX} '
+                f'ON {DISH_TABLE} USING gin (UPPER(name) gin_trgm_ops)'
+            )
+
+
+def uninstall_search_index(connection):
+    """
+    Удаляет поисковый индекс (используется при откате миграции).
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for trigger in SQLITE_FTS_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            cursor.execute(f'DROP TABLE IF EXISTS {DISH_FTS_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {DISH_TRGM_INDEX}')
+
+
+def ensure_search_index(sender, using, **kwargs):
+    """
+    Обработчик ``post_migrate``: восстанавливает триггеры FTS
+    после миграций, пересоздающих таблицу блюд.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    if DISH_FTS_TABLE in connection.introspection.table_names():
+        install_search_index(connection)
+
+
+def _fts_phrase(query):
+    """
+    Экранирует строку запроса как фразу FTS5 по колонке ``name``.
+    """
+    return 'name : "{}"'.format(query.replace('"', '""'))
+
+
+def search_dishes(queryset, query):
+    """
+    Фильтрует queryset блюд по вхождению подстроки в название.
+
+    Поиск регистронезависимый, в том числе для кириллицы,
+    и выполняется целиком в базе данных.
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'sqlite':
+        if len(query) >= TRIGRAM_MIN_LENGTH:
+            return queryset.filter(id__in=RawSQL(
+                f'SELECT rowid FROM {DISH_FTS_TABLE} '
+                f'WHERE {DISH_FTS_TABLE} MATCH %s',
+                [_fts_phrase(query)]
+            ))
+        return queryset.alias(
+            name_lower=UnicodeLower('name')
+        ).filter(name_lower__contains=query.lower())
+
+    return queryset.filter(name__icontains=query)
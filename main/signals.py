@@ -0,0 +1,432 @@
+"""
+Обработчики сигналов моделей приложения.
+"""
+
+from collections import Counter
+
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .allergen_masks import assign_mask_bit, clear_mask_bit, update_dish_masks
+from .caching import bump_allergens_versions, bump_global_version, bump_user_versions
+from .composition import schedule_update
+from .intake import apply_entry_change, entry_values
+from .models import MACRO_FIELDS, Allergen, Dish, DishComponent, MealEntry, Serving
+from .nutrition import (
+    apply_allergen_usage,
+    apply_dish_change,
+    dish_macros,
+    forget_allergen,
+)
+from .portions import refresh_servings
+from .similarity import dish_deleted, dish_saved, expect_version_bumps
+from .storage import release_blob, retain_blob
+
+
+@receiver(post_save, sender=Allergen)
+def assign_allergen_mask_bit(sender, instance, raw=False, **kwargs):
+    """
+    Выдаёт сохранённому аллергену без бита бит в маске аллергенов блюд.
+
+    Обработчик стоит первым, чтобы сброс кеша справочника
+    уже видел выданный бит.
+    """
+    if raw or instance.mask_bit is not None:
+        return
+    assign_mask_bit(instance)
+
+
+@receiver(pre_delete, sender=Allergen)
+def release_allergen_mask_bit(sender, instance, **kwargs):
+    """
+    Убирает бит удаляемого аллергена из масок блюд.
+    """
+    clear_mask_bit(instance)
+
+
+@receiver(m2m_changed, sender=Dish.allergens.through)
+def sync_dish_allergen_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Поддерживает ``Dish.allergen_mask`` при изменении аллергенов блюда,
+    в том числе при ``DishForm.save_m2m``.
+    """
+    if action == 'pre_clear':
+        instance._mask_dish_ids = (
+            list(instance.dish_set.values_list('pk', flat=True))
+            if reverse else [instance.pk]
+        )
+        return
+
+    if action == 'post_clear':
+        dish_ids = getattr(instance, '_mask_dish_ids', [])
+    elif action in ('post_add', 'post_remove'):
+        dish_ids = pk_set if reverse else [instance.pk]
+    else:
+        return
+
+    masks = update_dish_masks(dish_ids)
+    if not reverse:
+        instance.allergen_mask = masks.get(instance.pk, 0)
+
+
+@receiver(post_delete, sender=Allergen)
+def forget_allergen_usage(sender, instance, **kwargs):
+    """
+    Убирает удалённый аллерген из сводок питания.
+    """
+    forget_allergen(instance.pk)
+
+
+@receiver(pre_save, sender=Dish)
+def fill_dish_per_100g(sender, instance, raw=False, **kwargs):
+    """
+    Пересчитывает нутриенты блюда на 100 г перед сохранением.
+    """
+    if not raw:
+        instance.fill_per_100g()
+
+
+@receiver(pre_save, sender=Dish)
+def remember_dish_before_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Запоминает владельца, нутриенты и фотографию блюда до изменения
+    и отмечает, изменились ли его вес или нутриенты.
+    """
+    instance._summary_old = None
+    instance._photo_old = None
+    instance._old_user_id = None
+    instance._macros_changed = False
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    fields = set(update_fields) if update_fields is not None else None
+    track_summary = fields is None or bool(
+        fields & {'user', 'user_id', 'weight_grams', *MACRO_FIELDS}
+    )
+    track_photo = fields is None or 'photo' in fields
+    if not (track_summary or track_photo):
+        return
+
+    old = Dish.objects.filter(pk=instance.pk).values(
+        'user_id', 'photo', 'weight_grams', *MACRO_FIELDS
+    ).first()
+    if old is None:
+        return
+    photo = old.pop('photo') or ''
+    instance._macros_changed = old.pop('weight_grams') != instance.weight_grams or any(
+        old[field] != getattr(instance, field) for field in MACRO_FIELDS
+    )
+    instance._old_user_id = old['user_id']
+    if track_photo:
+        instance._photo_old = photo
+    if track_summary:
+        instance._summary_old = old
+
+
+@receiver(post_save, sender=Dish)
+def update_summary_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Обновляет сводку питания после создания или изменения блюда.
+    """
+    if raw:
+        return
+    new = dish_macros(instance)
+    if created:
+        apply_dish_change(instance.user_id, new=new)
+        return
+
+    old = getattr(instance, '_summary_old', None)
+    if old is None:
+        return
+    old_user_id = old.pop('user_id')
+
+    if old_user_id == instance.user_id:
+        if old != new:
+            apply_dish_change(instance.user_id, old=old, new=new)
+        return
+
+    # Блюдо передано другому пользователю (например, через админку).
+    apply_dish_change(old_user_id, old=old)
+    apply_dish_change(instance.user_id, new=new)
+    usage = Counter()
+    for allergen_id in instance.allergens.values_list('pk', flat=True):
+        usage[(old_user_id, allergen_id)] -= 1
+        usage[(instance.user_id, allergen_id)] += 1
+    apply_allergen_usage(usage)
+
+
+@receiver(post_save, sender=Dish)
+def update_dish_servings(sender, instance, created, raw=False, **kwargs):
+    """
+    Пересчитывает нутриенты порций после изменения веса или нутриентов блюда.
+    """
+    if raw or created or not getattr(instance, '_macros_changed', False):
+        return
+    refresh_servings(instance)
+
+
+@receiver(post_save, sender=Dish)
+def update_photo_references(sender, instance, created, raw=False, **kwargs):
+    """
+    Переносит ссылку блюда со старого файла фотографии на новый.
+    """
+    if raw:
+        return
+    new = instance.photo.name or ''
+    if created:
+        retain_blob(new)
+        return
+
+    old = getattr(instance, '_photo_old', None)
+    if old is None or old == new:
+        return
+    retain_blob(new)
+    release_blob(old)
+
+
+def _is_dish_deletion(origin):
+    """
+    Проверяет, что удаляются сами блюда, а не их владелец.
+
+    При удалении пользователя его сводка удаляется каскадно,
+    поэтому обновлять её не нужно.
+    """
+    return isinstance(origin, Dish) or (
+        isinstance(origin, QuerySet) and origin.model is Dish
+    )
+
+
+@receiver(pre_delete, sender=Dish)
+def remember_dish_allergens(sender, instance, origin=None, **kwargs):
+    """
+    Запоминает аллергены блюда: связи удалятся каскадно без m2m_changed.
+    """
+    if _is_dish_deletion(origin):
+        instance._summary_allergen_ids = list(
+            instance.allergens.values_list('pk', flat=True)
+        )
+
+
+@receiver(post_delete, sender=Dish)
+def update_summary_on_delete(sender, instance, origin=None, **kwargs):
+    """
+    Вычитает удалённое блюдо из сводки питания.
+    """
+    if not _is_dish_deletion(origin):
+        return
+
+    apply_dish_change(instance.user_id, old=dish_macros(instance))
+    apply_allergen_usage(Counter({
+        (instance.user_id, allergen_id): -1
+        for allergen_id in getattr(instance, '_summary_allergen_ids', [])
+    }))
+
+
+@receiver(post_delete, sender=Dish)
+def release_dish_photo(sender, instance, **kwargs):
+    """
+    Снимает ссылку удалённого блюда на файл фотографии.
+    """
+    release_blob(instance.photo.name)
+
+
+@receiver(m2m_changed, sender=Dish.allergens.through)
+def update_allergen_usage(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Поддерживает счётчики аллергенов в сводках питания.
+    """
+    if action in ('pre_remove', 'pre_clear'):
+        links = sender.objects.filter(
+            **({'allergen': instance} if reverse else {'dish': instance})
+        )
+        if action == 'pre_remove':
+            links = links.filter(
+                **({'dish__in': pk_set} if reverse else {'allergen__in': pk_set})
+            )
+        instance._usage_links = list(
+            links.values_list('dish__user_id', 'allergen_id')
+        )
+        return
+
+    usage = Counter()
+    if action == 'post_add':
+        if reverse:
+            owners = Dish.objects.filter(pk__in=pk_set).values_list(
+                'user_id', flat=True
+            )
+            for user_id in owners:
+                usage[(user_id, instance.pk)] += 1
+        else:
+            for allergen_id in pk_set:
+                usage[(instance.user_id, allergen_id)] += 1
+    elif action in ('post_remove', 'post_clear'):
+        for link in getattr(instance, '_usage_links', []):
+            usage[link] -= 1
+    apply_allergen_usage(usage)
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+def bump_dish_cache_version(sender, instance, **kwargs):
+    """
+    Делает устаревшими закешированные страницы владельца блюда.
+    """
+    user_ids = (instance.user_id, getattr(instance, '_old_user_id', None))
+    bump_user_versions(*user_ids)
+    expect_version_bumps(*user_ids)
+
+
+@receiver(m2m_changed, sender=Dish.allergens.through)
+def bump_dish_allergens_cache_version(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Делает устаревшими страницы после изменения аллергенов блюд.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_user_versions(instance.user_id)
+        expect_version_bumps(instance.user_id)
+        return
+    dish_ids = pk_set if action != 'post_clear' else getattr(instance, '_mask_dish_ids', [])
+    owners = list(Dish.objects.filter(pk__in=dish_ids).values_list('user_id', flat=True).distinct())
+    bump_user_versions(*owners)
+    expect_version_bumps(*owners)
+
+
+@receiver(post_save, sender=Allergen)
+@receiver(post_delete, sender=Allergen)
+def bump_allergen_cache_version(sender, instance, **kwargs):
+    """
+    Делает устаревшими страницы, на которых виден аллерген.
+    """
+    if instance.is_global or instance.created_by_id is None:
+        bump_global_version()
+    else:
+        bump_user_versions(instance.created_by_id)
+        bump_allergens_versions(instance.created_by_id)
+        expect_version_bumps(instance.created_by_id)
+
+
+@receiver(post_save, sender=Dish)
+def update_similarity_index(sender, instance, raw=False, **kwargs):
+    """
+    Обновляет строку блюда в индексе похожих блюд.
+    """
+    if raw:
+        return
+    dish_saved(instance, getattr(instance, '_old_user_id', None))
+
+
+@receiver(post_delete, sender=Dish)
+def remove_from_similarity_index(sender, instance, **kwargs):
+    """
+    Убирает удалённое блюдо из индекса похожих блюд.
+    """
+    dish_deleted(instance)
+
+
+@receiver(post_save, sender=Dish)
+def update_recipes_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Пересчитывает рецепты, в которые входит блюдо, после изменения
+    его нутриентов, а у самого рецепта возвращает значения из состава.
+    """
+    if raw or created or getattr(instance, '_composition_update', False):
+        return
+    if getattr(instance, '_macros_changed', False):
+        schedule_update(instance.pk)
+
+
+@receiver(m2m_changed, sender=Dish.allergens.through)
+def update_recipes_on_allergens(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Пересчитывает аллергены рецептов после изменения аллергенов блюд.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        if not getattr(instance, '_composition_update', False):
+            schedule_update(instance.pk)
+        return
+    schedule_update(*(pk_set if action != 'post_clear' else getattr(instance, '_mask_dish_ids', [])))
+
+
+@receiver(post_save, sender=DishComponent)
+@receiver(post_delete, sender=DishComponent)
+def update_recipe_on_component_change(sender, instance, raw=False, **kwargs):
+    """
+    Пересчитывает рецепт после изменения его состава.
+    """
+    if not raw:
+        schedule_update(instance.parent_id)
+
+
+@receiver(pre_save, sender=Serving)
+def fill_serving_values(sender, instance, raw=False, **kwargs):
+    """
+    Считает нутриенты порции из значений блюда на 100 г.
+    """
+    if not raw:
+        instance.fill_from_dish()
+
+
+@receiver(pre_save, sender=MealEntry)
+def remember_entry_before_save(sender, instance, raw=False, **kwargs):
+    """
+    Вычисляет день записи и запоминает её значения до изменения.
+    """
+    instance.eaten_on = timezone.localdate(instance.eaten_at)
+    instance._intake_old = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._intake_old = MealEntry.objects.filter(pk=instance.pk).values(
+        'user_id', 'eaten_on', *MACRO_FIELDS
+    ).first()
+
+
+@receiver(post_save, sender=MealEntry)
+def update_intake_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Обновляет дневные и недельные итоги после изменения записи.
+    """
+    if raw:
+        return
+    new = entry_values(instance)
+    old = getattr(instance, '_intake_old', None)
+    if old is None:
+        if created:
+            apply_entry_change(instance.user_id, new=new)
+        return
+
+    old_user_id = old.pop('user_id')
+    old['day'] = old.pop('eaten_on')
+    if old_user_id == instance.user_id:
+        apply_entry_change(instance.user_id, old=old, new=new)
+    else:
+        apply_entry_change(old_user_id, old=old)
+        apply_entry_change(instance.user_id, new=new)
+
+
+def _is_entry_deletion(origin):
+    """
+    Проверяет, что удаляются сами записи дневника, а не их владелец.
+    """
+    return isinstance(origin, MealEntry) or (
+        isinstance(origin, QuerySet) and origin.model is MealEntry
+    )
+
+
+@receiver(post_delete, sender=MealEntry)
+def update_intake_on_delete(sender, instance, origin=None, **kwargs):
+    """
+    Вычитает удалённую запись из итогов.
+    """
+    if _is_entry_deletion(origin):
+        apply_entry_change(instance.user_id, old=entry_values(instance))
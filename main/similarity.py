@@ -0,0 +1,237 @@
+"""
+Поиск похожих блюд по профилю КБЖУ.
+
+Для каждого пользователя в памяти процесса хранится матрица
+(калории, белки, жиры, углеводы) его блюд в NumPy. Неизвестный
+нутриент хранится как NaN. Перед сравнением столбцы делятся
+на стандартное отклонение по блюдам пользователя, чтобы калории
+не заслоняли граммы.
+
+Расстояние считается только по нутриентам, известным у исходного блюда.
+Если у кандидата нутриента нет, вместо квадрата разницы добавляется
+штраф ``MISSING_PENALTY`` (одно стандартное отклонение в квадрате).
+Кандидаты, у которых общих известных нутриентов меньше ``MIN_SHARED``
+(или меньше, чем известно у исходного блюда, если их меньше двух),
+не показываются. У блюда без единого нутриента похожих нет.
+
+Индекс привязан к версиям данных ``CacheVersion`` пользователя
+и общих данных. Изменения блюд из этого процесса применяются
+к матрице построчно после фиксации транзакции вместе с числом
+ожидаемых увеличений версии; если версия ушла дальше (изменения
+из другого процесса, массовые правки), индекс строится заново.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.db import transaction
+
+from .models import MACRO_FIELDS, Dish
+
+MISSING_PENALTY = 1.0
+MIN_SHARED = 2
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Сколько пользователей держать в памяти процесса.
+MAX_INDEXES = 32
+
+_lock = threading.Lock()
+_indexes = OrderedDict()
+
+
+def macro_vector(dish):
+    """
+    Нутриенты блюда в виде вектора; неизвестные — NaN.
+    """
+    return np.array(
+        [getattr(dish, field) for field in MACRO_FIELDS], dtype=np.float64
+    )
+
+
+class DishIndex:
+    """
+    Матрица нутриентов блюд одного пользователя.
+
+    Строки хранятся в массивах с запасом, удалённая строка
+    заменяется последней.
+    """
+
+    def __init__(self, ids, values, versions):
+        self.size = len(ids)
+        capacity = max(self.size, 16)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.values = np.full((capacity, len(MACRO_FIELDS)), np.nan)
+        self.ids[:self.size] = ids
+        self.values[:self.size] = values
+        self.rows = {int(pk): row for row, pk in enumerate(ids)}
+        self.versions = versions
+        self.pending_bumps = 0
+        self._scale = None
+
+    @classmethod
+    def build(cls, user_id, versions):
+        rows = list(
+            Dish.objects.filter(user_id=user_id).values_list('pk', *MACRO_FIELDS)
+        )
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), len(MACRO_FIELDS) + 1)
+        return cls(data[:, 0].astype(np.int64), data[:, 1:], versions)
+
+    def upsert(self, dish_id, vector):
+        row = self.rows.get(dish_id)
+        if row is None:
+            if self.size == len(self.ids):
+                self._grow()
+            row = self.rows[dish_id] = self.size
+            self.ids[row] = dish_id
+            self.size += 1
+        self.values[row] = vector
+        self._scale = None
+
+    def remove(self, dish_id):
+        row = self.rows.pop(dish_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            moved = int(self.ids[last])
+            self.ids[row] = moved
+            self.values[row] = self.values[last]
+            self.rows[moved] = row
+        self.size = last
+        self._scale = None
+
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        ids = np.zeros(capacity, dtype=np.int64)
+        values = np.full((capacity, len(MACRO_FIELDS)), np.nan)
+        ids[:self.size] = self.ids[:self.size]
+        values[:self.size] = self.values[:self.size]
+        self.ids, self.values = ids, values
+
+    def scale(self):
+        """
+        Стандартное отклонение каждого нутриента по известным значениям;
+        для постоянного или неизвестного нутриента — 1.
+        """
+        if self._scale is None:
+            values = self.values[:self.size]
+            known = ~np.isnan(values)
+            counts = known.sum(axis=0)
+            filled = np.where(known, values, 0.0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = filled.sum(axis=0) / counts
+                spread = np.where(known, values - mean, 0.0)
+                std = np.sqrt((spread ** 2).sum(axis=0) / counts)
+            self._scale = np.where(np.isfinite(std) & (std > 0), std, 1.0)
+        return self._scale
+
+    def nearest(self, vector, limit, exclude=None):
+        """
+        Возвращает до ``limit`` пар (id блюда, расстояние),
+        начиная с самого близкого.
+        """
+        known = ~np.isnan(vector)
+        dims = int(known.sum())
+        if not dims or not self.size:
+            return []
+
+        columns = self.values[:self.size, known]
+        diff = (columns - vector[known]) / self.scale()[known]
+        present = ~np.isnan(diff)
+        squares = np.where(present, diff * diff, MISSING_PENALTY)
+        distances = np.sqrt(squares.sum(axis=1) / dims)
+        distances[present.sum(axis=1) < min(MIN_SHARED, dims)] = np.inf
+        if exclude is not None and exclude in self.rows:
+            distances[self.rows[exclude]] = np.inf
+
+        found = int(np.isfinite(distances).sum())
+        limit = min(limit, found)
+        if not limit:
+            return []
+        top = np.argpartition(distances, limit - 1)[:limit]
+        ids = self.ids[:self.size][top]
+        order = np.lexsort((ids, distances[top]))
+        return [(int(ids[i]), float(distances[top][i])) for i in order]
+
+
+def get_index(user_id, versions):
+    """
+    Возвращает индекс пользователя для версий ``versions``
+    (см. ``user_data_versions``), при необходимости строит его.
+    """
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is not None:
+            user_version, *other_versions = index.versions
+            if (user_version + index.pending_bumps, *other_versions) == tuple(versions):
+                index.versions = tuple(versions)
+                index.pending_bumps = 0
+                _indexes.move_to_end(user_id)
+                return index
+
+    index = DishIndex.build(user_id, tuple(versions))
+    with _lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def similar_dishes(dish, versions, limit=DEFAULT_LIMIT):
+    """
+    Возвращает до ``limit`` пар (id блюда, расстояние) из блюд
+    владельца ``dish``, ближайших к нему по нутриентам.
+    """
+    index = get_index(dish.user_id, versions)
+    with _lock:
+        return index.nearest(macro_vector(dish), limit, exclude=dish.pk)
+
+
+def _apply(user_id, change):
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is not None:
+            change(index)
+
+
+def dish_saved(dish, old_user_id=None):
+    """
+    Переносит новые нутриенты блюда в загруженный индекс
+    после фиксации транзакции.
+    """
+    dish_id, user_id, vector = dish.pk, dish.user_id, macro_vector(dish)
+    if old_user_id is not None and old_user_id != user_id:
+        transaction.on_commit(lambda: _apply(old_user_id, lambda index: index.remove(dish_id)))
+    transaction.on_commit(lambda: _apply(user_id, lambda index: index.upsert(dish_id, vector)))
+
+
+def dish_deleted(dish):
+    """
+    Убирает удалённое блюдо из загруженного индекса.
+    """
+    dish_id, user_id = dish.pk, dish.user_id
+    transaction.on_commit(lambda: _apply(user_id, lambda index: index.remove(dish_id)))
+
+
+def expect_version_bumps(*user_ids):
+    """
+    Отмечает увеличение версий пользователей, изменения для которого
+    уже учтены в индексах этого процесса.
+    """
+    def bump(index):
+        index.pending_bumps += 1
+
+    for user_id in dict.fromkeys(user_ids):
+        if user_id is not None:
+            transaction.on_commit(lambda user_id=user_id: _apply(user_id, bump))
+
+
+def clear_indexes():
+    """
+    Забывает все индексы процесса.
+    """
+    with _lock:
+        _indexes.clear()
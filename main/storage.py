@@ -0,0 +1,198 @@
+"""
+Хранилище фотографий блюд с адресацией по содержимому.
+
+Имя файла — SHA-256 его содержимого, разложенный по вложенным
+каталогам (``photos/ab/cd/abcd….jpg``), поэтому одинаковые фотографии
+хранятся один раз, а ни один каталог не разрастается. Сколько блюд
+ссылается на файл, учитывается в ``PhotoBlob``; файл и его
+уменьшенные копии удаляются, когда ссылок не остаётся.
+"""
+
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils.deconstruct import deconstructible
+
+PHOTOS_DIR = 'photos'
+
+# Глубина и ширина уровней вложенных каталогов.
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def file_digest(content):
+    """
+    Возвращает SHA-256 содержимого файла, не загружая его в память целиком.
+    """
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(digest, original_name=''):
+    """
+    Возвращает имя файла в хранилище по хешу его содержимого.
+    """
+    extension = os.path.splitext(original_name)[1].lower()
+    shards = [
+        digest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH]
+        for level in range(SHARD_DEPTH)
+    ]
+    return '/'.join([PHOTOS_DIR, *shards, digest + extension])
+
+
+def digest_from_name(name):
+    """
+    Возвращает хеш из имени файла в новой раскладке или ``None``.
+    """
+    stem = os.path.splitext(os.path.basename(name or ''))[0]
+    return stem if _DIGEST_RE.match(stem) else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, которое называет файлы по их содержимому.
+
+    Повторное сохранение тех же байтов возвращает имя уже
+    существующего файла и ничего не записывает.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        target = content_name(file_digest(content), name)
+        if self.exists(target):
+            return target
+
+        saved = super().save(target, content, max_length=max_length)
+        if saved != target:
+            # Тот же файл параллельно записал другой запрос:
+            # копия под изменённым именем не нужна.
+            self.delete(saved)
+        return target
+
+
+photo_storage = ContentAddressedStorage()
+
+
+def retain_blob(name):
+    """
+    Учитывает ещё одну ссылку на файл фотографии.
+    """
+    from .models import PhotoBlob
+
+    if not name:
+        return
+    updated = PhotoBlob.objects.filter(name=name).update(
+        ref_count=F('ref_count') + 1
+    )
+    if not updated:
+        _, created = PhotoBlob.objects.get_or_create(
+            name=name, defaults={'ref_count': 1}
+        )
+        if not created:
+            PhotoBlob.objects.filter(name=name).update(
+                ref_count=F('ref_count') + 1
+            )
+
+
+def release_blob(name, storage=None):
+    """
+    Снимает ссылку на файл фотографии.
+
+    Последняя ссылка удаляет запись ``PhotoBlob``, а сам файл
+    с копиями удаляется после фиксации транзакции.
+    """
+    from .models import PhotoBlob
+
+    if not name:
+        return
+    with transaction.atomic():
+        blob = PhotoBlob.objects.select_for_update().filter(name=name).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            blob.ref_count -= 1
+            blob.save(update_fields=['ref_count'])
+            return
+        blob.delete()
+
+    transaction.on_commit(lambda: delete_blob_files(name, storage))
+
+
+def delete_blob_files(name, storage=None):
+    """
+    Удаляет файл фотографии и его уменьшенные копии,
+    если на файл снова никто не ссылается.
+
+    Возвращает число освобождённых байтов.
+    """
+    from .images import RENDITIONS_DIR
+    from .models import PhotoBlob
+
+    storage = storage or photo_storage
+    if PhotoBlob.objects.filter(name=name).exists() or not storage.exists(name):
+        return 0
+
+    digest = digest_from_name(name)
+    if digest is None:
+        with storage.open(name, 'rb') as source:
+            digest = file_digest(source)
+
+    freed = storage.size(name)
+    storage.delete(name)
+
+    renditions_dir = f'{RENDITIONS_DIR}/{digest[:2]}'
+    if default_storage.exists(renditions_dir):
+        for filename in default_storage.listdir(renditions_dir)[1]:
+            if filename.startswith(f'{digest}_'):
+                path = f'{renditions_dir}/{filename}'
+                freed += default_storage.size(path)
+                default_storage.delete(path)
+    return freed
+
+
+def rebuild_blob_counts(dish_model=None, blob_model=None):
+    """
+    Пересчитывает ``PhotoBlob`` по фотографиям блюд.
+
+    Возвращает число учтённых файлов.
+    """
+    if dish_model is None or blob_model is None:
+        from .models import Dish, PhotoBlob
+        dish_model = dish_model or Dish
+        blob_model = blob_model or PhotoBlob
+
+    counts = dict(
+        dish_model.objects.exclude(photo='').exclude(photo=None)
+        .order_by().values('photo').annotate(total=Count('id'))
+        .values_list('photo', 'total')
+    )
+    with transaction.atomic():
+        blob_model.objects.exclude(name__in=list(counts)).delete()
+        existing = set(blob_model.objects.values_list('name', flat=True))
+        for name, total in counts.items():
+            if name in existing:
+                blob_model.objects.filter(name=name).update(ref_count=total)
+        blob_model.objects.bulk_create([
+            blob_model(name=name, ref_count=total)
+            for name, total in counts.items()
+            if name not in existing
+        ])
+    return len(counts)
@@ -1,3 +1,2139 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time as dt_time, timedelta
+from io import BytesIO, StringIO
+from multiprocessing import get_context
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+from django.urls import reverse
+
+from .allergen_masks import MASK_BITS_SCOPE
+from .management.commands.generate_photo_renditions import _init_worker, _render
+from .benchmarks import (
+    clear_benchmark_data,
+    compare_results,
+    default_benchmark_user,
+    default_scenarios,
+    percentile,
+    run_benchmarks,
+    seed_benchmark_data,
+)
+from .caching import bump_user_versions, page_cache_stats, user_data_versions
+from .catalog import get_available_allergens
+from .composition import CompositionCycle, creates_cycle, topological_order
+from .importers import import_dishes
+from .intake import rebuild_intake
+from .instrumentation import QueryBudgetExceeded, registry
+from .jobs import JOB_HANDLERS, enqueue, job_handler, requeue_stale_jobs, run_pending_jobs
+from .loadtest import histogram, parse_mix, run_load_test
+from .models import (
+    Allergen,
+    CacheVersion,
+    DailyIntake,
+    Dish,
+    DishComponent,
+    Job,
+    MealEntry,
+    PhotoBlob,
+    Serving,
+    UserNutritionSummary,
+    WeeklyIntake,
+)
+from .nutrition import rebuild_summaries
+from .planner import PlanTarget, plan_meals, solve
+from .search import DISH_FTS_TABLE, SQLITE_LOWER_FUNCTION, search_dishes
+from .similarity import clear_indexes, get_index, similar_dishes
+from .storage import photo_storage
+from .urls import build_urlpatterns
+from .views import DishesListView, ExportDishesView
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class DishesListQueryCountTest(TestCase):
+    """
+    Проверяет, что число запросов страницы блюд
+    не зависит от количества блюд на странице.
+    """
+
+    # Сессия, пользователь, агрегат статистики, версии данных,
+    # страница блюд и предзагрузка аллергенов. Список аллергенов
+    # для фильтра берётся из кешированного справочника.
+    EXPECTED_QUERIES = 6
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.allergens = [
+            Allergen.objects.create(name='Глютен', is_global=True),
+            Allergen.objects.create(name='Орехи', is_global=True),
+            Allergen.objects.create(
+                name='Киви', is_global=False, created_by=cls.user
+            ),
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create_dishes(self, count):
+        for index in range(count):
+            dish = Dish.objects.create(
+                user=self.user,
+                name=f'Блюдо {index}',
+                calories=100 + index,
+            )
+            dish.allergens.set(self.allergens[:index % 3 + 1])
+
+    def assert_page_queries(self, **params):
+        get_available_allergens(self.user)
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self.client.get(reverse('dishes'), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_single_dish(self):
+        self.create_dishes(1)
+        self.assert_page_queries()
+
+    def test_full_page(self):
+        self.create_dishes(10)
+        response = self.assert_page_queries()
+        self.assertEqual(len(response.context['dishes']), 10)
+        self.assertContains(response, 'Киви')
+
+    def test_second_page_with_filters(self):
+        self.create_dishes(25)
+        response = self.assert_page_queries(
+            page=2, sort_by='calories', calories_min=101
+        )
+        self.assertEqual(len(response.context['dishes']), 10)
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class DishesListStatsTest(TestCase):
+    """
+    Проверяет статистику БЖУ по всей отфильтрованной выборке.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        for index in range(1, 16):
+            Dish.objects.create(
+                user=cls.user,
+                name=f'Блюдо {index}',
+                calories=index * 10,
+                proteins=None if index % 5 == 0 else index,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_stats_cover_all_pages(self):
+        response = self.client.get(reverse('dishes'), {'page': 2})
+        stats = response.context['dish_stats']
+
+        self.assertEqual(stats['count'], 15)
+        self.assertEqual(response.context['avg_calories'], 80)
+        self.assertEqual(stats['calories']['min'], 10)
+        self.assertEqual(stats['calories']['max'], 150)
+        self.assertEqual(stats['calories']['sum'], 1200)
+        # Пустые значения не участвуют в среднем.
+        self.assertEqual(stats['proteins']['sum'], 90)
+        self.assertEqual(response.context['avg_protein'], 7.5)
+
+    def test_stats_respect_filters(self):
+        response = self.client.get(
+            reverse('dishes'), {'calories_min': 100}
+        )
+        stats = response.context['dish_stats']
+
+        self.assertEqual(stats['count'], 6)
+        self.assertEqual(stats['calories']['avg'], 125)
+        self.assertEqual(response.context['paginator'].count, 6)
+
+    def test_extreme_created_dates(self):
+        params = {'created_after': '0001-01-01', 'created_before': '9999-12-31'}
+        response = self.client.get(reverse('dishes'), params)
+        self.assertEqual(response.context['dish_stats']['count'], 15)
+
+        response = self.client.get(reverse('dishes_export'), {**params, 'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 16)
+
+        response = self.client.get(reverse('api_dishes'), {**params, 'fields': 'id'})
+        self.assertEqual(len(response.json()['results']), 15)
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class DishesCursorPaginationTest(TestCase):
+    """
+    Проверяет курсорный режим пагинации списка блюд.
+    """
+
+    SORT_KEYS = (
+        'name', '-name', 'calories', '-calories', 'proteins', '-proteins',
+        'fats', '-fats', 'carbohydrates', '-carbohydrates',
+        'created_at', '-created_at',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        for index in range(23):
+            # Повторы и пустые значения проверяют уточняющий ключ и NULL.
+            value = None if index % 4 == 0 else index % 5
+            Dish.objects.create(
+                user=cls.user,
+                name=f'Блюдо {index % 7}',
+                calories=value,
+                proteins=value,
+                fats=value,
+                carbohydrates=value,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def walk(self, sort_by):
+        ids = []
+        pages = []
+        params = {'pagination': 'cursor', 'sort_by': sort_by}
+        while True:
+            response = self.client.get(reverse('dishes'), params)
+            self.assertEqual(response.status_code, 200)
+            page = response.context['page_obj']
+            pages.append(page)
+            ids.extend(dish.id for dish in page)
+            if not page.has_next():
+                return ids, pages
+            params['cursor'] = page.next_cursor
+
+    def test_cursor_matches_offset_order(self):
+        for sort_by in self.SORT_KEYS:
+            with self.subTest(sort_by=sort_by):
+                offset_ids = []
+                for page_number in (1, 2, 3):
+                    response = self.client.get(
+                        reverse('dishes'),
+                        {'sort_by': sort_by, 'page': page_number}
+                    )
+                    offset_ids.extend(d.id for d in response.context['dishes'])
+
+                cursor_ids, pages = self.walk(sort_by)
+                self.assertEqual(cursor_ids, offset_ids)
+                self.assertEqual(len(pages), 3)
+
+    def test_previous_cursor(self):
+        for sort_by in self.SORT_KEYS:
+            with self.subTest(sort_by=sort_by):
+                _, pages = self.walk(sort_by)
+                response = self.client.get(reverse('dishes'), {
+                    'pagination': 'cursor',
+                    'sort_by': sort_by,
+                    'cursor': pages[2].previous_cursor,
+                })
+                self.assertEqual(
+                    [d.id for d in response.context['page_obj']],
+                    [d.id for d in pages[1]]
+                )
+
+    def test_filtered_stats_not_recounted_per_page(self):
+        cache.clear()
+        params = {'pagination': 'cursor', 'calories_min': 1}
+        response = self.client.get(reverse('dishes'), params)
+        self.assertEqual(response.context['dish_stats']['count'], 14)
+
+        params['cursor'] = response.context['page_obj'].next_cursor
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('dishes'), params)
+        self.assertEqual(response.context['dish_stats']['count'], 14)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in ctx.captured_queries))
+
+        Dish.objects.create(user=self.user, name='Суп', calories=3)
+        response = self.client.get(reverse('dishes'), params)
+        self.assertEqual(response.context['dish_stats']['count'], 15)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            reverse('dishes'), {'pagination': 'cursor', 'cursor': 'garbage'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_from_other_sort_rejected(self):
+        _, pages = self.walk('calories')
+        response = self.client.get(reverse('dishes'), {
+            'pagination': 'cursor',
+            'sort_by': 'name',
+            'cursor': pages[0].next_cursor,
+        })
+        self.assertEqual(response.status_code, 404)
+
+
+class DishIndexUsageTest(TestCase):
+    """
+    Проверяет по EXPLAIN, что запросы списка блюд идут по индексам.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        Dish.objects.bulk_create([
+            Dish(user=cls.user, name=f'Блюдо {i}', calories=i, proteins=i)
+            for i in range(50)
+        ])
+
+    def get_queryset(self, **params):
+        request = RequestFactory().get('/dishes/', params)
+        request.user = self.user
+        view = DishesListView()
+        view.setup(request)
+        return view.get_queryset()
+
+    def assert_uses_index(self, queryset, index_name):
+        if connection.vendor != 'sqlite':
+            self.skipTest('План запроса проверяется только для SQLite')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_default_sorting(self):
+        self.assert_uses_index(self.get_queryset(), 'dish_user_created_idx')
+
+    def test_sorting_by_macro(self):
+        self.assert_uses_index(
+            self.get_queryset(sort_by='-calories'), 'dish_user_calories_idx'
+        )
+
+    def test_sorting_by_name(self):
+        self.assert_uses_index(
+            self.get_queryset(sort_by='name'), 'dish_user_name_idx'
+        )
+
+    def test_date_range_filter(self):
+        queryset = self.get_queryset(
+            created_after='2024-01-01', created_before='2024-12-31'
+        )
+        self.assert_uses_index(queryset, 'dish_user_created_idx')
+        self.assertNotIn('django_datetime_cast_date', str(queryset.query))
+
+    def test_macro_range_filter(self):
+        queryset = self.get_queryset(
+            protein_min=10, protein_max=20, sort_by='proteins'
+        )
+        self.assert_uses_index(queryset, 'dish_user_proteins_idx')
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class AllergenMaskTest(TestCase):
+    """
+    Проверяет поддержку битовой маски аллергенов и фильтр по ней.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.other = User.objects.create_user('other', password='secret123')
+        cls.gluten = Allergen.objects.create(name='Глютен', is_global=True)
+        cls.nuts = Allergen.objects.create(name='Орехи', is_global=True)
+        cls.kiwi = Allergen.objects.create(
+            name='Киви', is_global=False, created_by=cls.user
+        )
+        cls.other_kiwi = Allergen.objects.create(
+            name='Киви', is_global=False, created_by=cls.other
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create_dish(self, name, *allergens):
+        dish = Dish.objects.create(user=self.user, name=name)
+        dish.allergens.set(allergens)
+        dish.refresh_from_db()
+        return dish
+
+    def bit(self, allergen):
+        return 1 << allergen.mask_bit
+
+    def test_bits_are_unique_per_user(self):
+        bits = [self.gluten.mask_bit, self.nuts.mask_bit, self.kiwi.mask_bit]
+        self.assertEqual(len(set(bits)), 3)
+        self.assertNotIn(
+            self.other_kiwi.mask_bit,
+            [self.gluten.mask_bit, self.nuts.mask_bit]
+        )
+        self.assertEqual(
+            Allergen.objects.get(pk=self.kiwi.pk).mask_bit, self.kiwi.mask_bit
+        )
+
+    def test_bit_allocation_is_serialised(self):
+        before = CacheVersion.objects.filter(scope=MASK_BITS_SCOPE).first()
+        Allergen.objects.create(name='Соя', is_global=True)
+        after = CacheVersion.objects.get(scope=MASK_BITS_SCOPE)
+        self.assertTrue(before is None or after.version == before.version + 1)
+
+    def test_duplicate_bits_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Allergen.objects.filter(pk=self.nuts.pk).update(mask_bit=self.gluten.mask_bit)
+        other_own = Allergen.objects.create(name='Манго', is_global=False, created_by=self.other)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Allergen.objects.filter(pk=other_own.pk).update(mask_bit=self.other_kiwi.mask_bit)
+
+    def test_mask_follows_allergen_changes(self):
+        dish = self.create_dish('Торт', self.gluten, self.nuts)
+        self.assertEqual(
+            dish.allergen_mask, self.bit(self.gluten) | self.bit(self.nuts)
+        )
+
+        dish.allergens.remove(self.nuts)
+        dish.refresh_from_db()
+        self.assertEqual(dish.allergen_mask, self.bit(self.gluten))
+
+        self.kiwi.dish_set.add(dish)
+        dish.refresh_from_db()
+        self.assertEqual(
+            dish.allergen_mask, self.bit(self.gluten) | self.bit(self.kiwi)
+        )
+
+        dish.allergens.clear()
+        dish.refresh_from_db()
+        self.assertEqual(dish.allergen_mask, 0)
+
+    def test_deleting_allergen_clears_bit(self):
+        dish = self.create_dish('Салат', self.kiwi, self.nuts)
+        self.kiwi.delete()
+        dish.refresh_from_db()
+        self.assertEqual(dish.allergen_mask, self.bit(self.nuts))
+
+    def test_form_save_updates_mask(self):
+        response = self.client.post(reverse('create_dish'), {
+            'name': 'Паста',
+            'allergens': [self.gluten.pk, self.kiwi.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        dish = Dish.objects.get(name='Паста')
+        self.assertEqual(
+            dish.allergen_mask, self.bit(self.gluten) | self.bit(self.kiwi)
+        )
+
+    def test_exclusion_filter(self):
+        self.create_dish('Торт', self.gluten, self.nuts)
+        self.create_dish('Салат', self.kiwi)
+        self.create_dish('Суп')
+
+        response = self.client.get(reverse('dishes'), {
+            'exclude_allergens': [self.nuts.pk, self.kiwi.pk],
+        })
+        names = [dish.name for dish in response.context['dishes']]
+        self.assertEqual(names, ['Суп'])
+
+        sql = str(response.context['view'].object_list.query)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertNotIn('main_dish_allergens', sql)
+
+    def test_foreign_allergen_ignored(self):
+        self.create_dish('Салат', self.kiwi)
+        response = self.client.get(reverse('dishes'), {
+            'exclude_allergens': [self.other_kiwi.pk],
+        })
+        self.assertEqual(len(response.context['dishes']), 1)
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class NutritionSummaryTest(TestCase):
+    """
+    Проверяет инкрементальное обновление сводки питания.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.other = User.objects.create_user('other', password='secret123')
+        cls.gluten = Allergen.objects.create(name='Глютен', is_global=True)
+        cls.nuts = Allergen.objects.create(name='Орехи', is_global=True)
+
+    def summary(self, user=None):
+        return UserNutritionSummary.objects.get(user=user or self.user)
+
+    def assert_no_drift(self):
+        self.assertEqual(rebuild_summaries(), 0)
+
+    def test_create_update_delete(self):
+        soup = Dish.objects.create(user=self.user, name='Суп', calories=100, fats=5)
+        cake = Dish.objects.create(user=self.user, name='Торт', calories=400)
+        stats = self.summary().as_stats()
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['calories']['avg'], 250)
+        self.assertEqual(stats['calories']['max'], 400)
+        self.assertEqual(stats['fats']['avg'], 5)
+        self.assert_no_drift()
+
+        cake.calories = 300
+        cake.save()
+        self.assertEqual(self.summary().calories_max, 300)
+        self.assert_no_drift()
+
+        soup.delete()
+        stats = self.summary().as_stats()
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['calories']['min'], 300)
+        self.assertIsNone(stats['fats']['avg'])
+        self.assert_no_drift()
+
+        Dish.objects.filter(user=self.user).delete()
+        self.assertEqual(self.summary().dish_count, 0)
+        self.assert_no_drift()
+
+    def test_allergen_usage(self):
+        cake = Dish.objects.create(user=self.user, name='Торт')
+        bread = Dish.objects.create(user=self.user, name='Хлеб')
+        cake.allergens.set([self.gluten, self.nuts])
+        self.gluten.dish_set.add(bread)
+        self.assertEqual(
+            self.summary().allergen_usage,
+            {str(self.gluten.pk): 2, str(self.nuts.pk): 1}
+        )
+        self.assert_no_drift()
+
+        cake.allergens.remove(self.nuts)
+        bread.delete()
+        self.assertEqual(self.summary().allergen_usage, {str(self.gluten.pk): 1})
+        self.assert_no_drift()
+
+        self.gluten.delete()
+        self.assertEqual(self.summary().allergen_usage, {})
+        self.assert_no_drift()
+
+    def test_owner_change(self):
+        cake = Dish.objects.create(user=self.user, name='Торт', calories=400)
+        cake.allergens.add(self.nuts)
+        cake.user = self.other
+        cake.save()
+        self.assertEqual(self.summary().dish_count, 0)
+        self.assertEqual(self.summary(self.other).calories_sum, 400)
+        self.assert_no_drift()
+
+    def test_user_deletion(self):
+        cake = Dish.objects.create(user=self.other, name='Торт', calories=400)
+        cake.allergens.add(self.nuts)
+        self.other.delete()
+        self.assertFalse(
+            UserNutritionSummary.objects.filter(user_id=self.other.pk).exists()
+        )
+
+    def test_rebuild_repairs_drift(self):
+        Dish.objects.create(user=self.user, name='Суп', calories=100)
+        UserNutritionSummary.objects.filter(user=self.user).update(dish_count=7)
+        self.assertEqual(rebuild_summaries(), 1)
+        self.assertEqual(self.summary().dish_count, 1)
+
+    def test_pages_read_summary(self):
+        Dish.objects.create(user=self.user, name='Суп', calories=100)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.context['dish_stats']['count'], 1)
+
+        UserNutritionSummary.objects.filter(user=self.user).update(dish_count=5)
+        response = self.client.get(reverse('dishes'))
+        self.assertEqual(response.context['dish_stats']['count'], 5)
+        response = self.client.get(reverse('dishes'), {'name': 'Суп'})
+        self.assertEqual(response.context['dish_stats']['count'], 1)
+
+    def test_reads_do_not_create_summary(self):
+        self.client.force_login(self.other)
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.context['dish_stats']['count'], 0)
+        response = self.client.get(reverse('dishes'))
+        self.assertIsNone(response.context['dish_stats']['calories']['avg'])
+        self.assertFalse(
+            UserNutritionSummary.objects.filter(user_id=self.other.pk).exists()
+        )
+
+        Dish.objects.create(user=self.other, name='Суп', calories=100)
+        self.assertEqual(self.summary(self.other).dish_count, 1)
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class DishExportTest(TestCase):
+    """
+    Проверяет потоковую выгрузку блюд.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.milk = Allergen.objects.create(name='Молоко', is_global=True)
+        cls.nuts = Allergen.objects.create(name='Орехи', is_global=True)
+        for i in range(5):
+            dish = Dish.objects.create(
+                user=cls.user, name=f'Блюдо {i}', calories=100 * i, proteins=i
+            )
+            dish.allergens.add(cls.milk if i % 2 else cls.nuts)
+        Dish.objects.create(user=User.objects.create_user('other'), name='Чужое')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse('dishes_export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_respects_filters_and_sorting(self):
+        content = self.export(
+            format='csv', calories_min='100', sort_by='calories',
+            exclude_allergens=self.nuts.pk
+        ).decode('utf-8-sig')
+        rows = list(csv.reader(StringIO(content)))
+
+        self.assertEqual(rows[0][0], 'Название')
+        self.assertEqual([row[0] for row in rows[1:]], ['Блюдо 1', 'Блюдо 3'])
+        self.assertEqual(rows[1][-1], 'Молоко')
+
+    def test_jsonl(self):
+        lines = self.export(format='jsonl').decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['name'], 'Блюдо 4')
+        self.assertEqual(rows[0]['allergens'], ['Орехи'])
+        self.assertEqual(rows[0]['calories'], 400)
+
+    def test_xlsx(self):
+        content = self.export(format='xlsx', name='Блюдо 2')
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+
+        self.assertEqual(sheet.count('<row>'), 2)
+        self.assertIn('Блюдо 2', sheet)
+        self.assertNotIn('Блюдо 3', sheet)
+
+    def test_allergens_prefetched_per_chunk(self):
+        with mock.patch.object(ExportDishesView, 'chunk_size', 2):
+            response = self.client.get(reverse('dishes_export'), {'format': 'jsonl'})
+            # Блюда одним запросом и аллергены на каждую порцию из двух блюд.
+            with self.assertNumQueries(4):
+                lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 5)
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('dishes_export'), {'format': 'pdf'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class DishImportTest(TestCase):
+    """
+    Проверяет массовый импорт блюд.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.milk = Allergen.objects.create(name='Молоко', is_global=True)
+        cls.own_milk = Allergen.objects.create(
+            name='молоко', is_global=False, created_by=cls.user
+        )
+        cls.nuts = Allergen.objects.create(name='Орехи', is_global=True)
+        Allergen.objects.create(
+            name='Соя', is_global=False, created_by=User.objects.create_user('other')
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def csv_file(self, *rows):
+        lines = ['name,calories,proteins,url,allergens', *rows]
+        return BytesIO('\n'.join(lines).encode())
+
+    def test_csv_rows_validated_and_linked(self):
+        report = import_dishes(self.user, self.csv_file(
+            'Каша,250,8,,Молоко; Орехи',
+            'Суп,-5,1,,',
+            'Салат,80,2,not-a-url,',
+            'Тофу,120,12,,Соя',
+            ',100,1,,',
+        ))
+
+        self.assertEqual(report.created, 1)
+        self.assertEqual([line for line, _ in report.errors], [3, 4, 5, 6])
+        self.assertIn('Калории', report.errors[0][1])
+        self.assertIn('Неизвестные аллергены: Соя', report.errors[2][1])
+
+        dish = Dish.objects.get(name='Каша')
+        self.assertEqual(set(dish.allergens.all()), {self.own_milk, self.nuts})
+        self.assertEqual(
+            dish.allergen_mask,
+            (1 << self.own_milk.mask_bit) | (1 << self.nuts.mask_bit)
+        )
+        summary = UserNutritionSummary.objects.get(user=self.user)
+        self.assertEqual(summary.dish_count, 1)
+        self.assertEqual(summary.allergen_usage, {
+            str(self.own_milk.pk): 1, str(self.nuts.pk): 1
+        })
+
+    def test_rows_written_in_batches(self):
+        rows = [f'Блюдо {i},{i},1,,Орехи' for i in range(30)]
+        with CaptureQueriesContext(connection) as queries:
+            report = import_dishes(self.user, self.csv_file(*rows), batch_size=10)
+        self.assertEqual(report.created, 30)
+
+        inserts = [q['sql'] for q in queries if q['sql'].startswith('INSERT INTO "main_dish')]
+        # По одной вставке блюд и связей на пачку из десяти строк.
+        self.assertEqual(len(inserts), 6)
+        self.assertEqual(Dish.allergens.through.objects.count(), 30)
+
+    def test_jsonl_and_export_roundtrip(self):
+        source = User.objects.create_user('source')
+        dish = Dish.objects.create(user=source, name='Плов', calories=300)
+        dish.allergens.add(self.nuts)
+        self.client.force_login(source)
+        exported = b''.join(self.client.get(
+            reverse('dishes_export'), {'format': 'jsonl'}
+        ).streaming_content)
+
+        report = import_dishes(self.user, BytesIO(exported), file_format='jsonl')
+        self.assertEqual(report.created, 1)
+        imported = Dish.objects.get(user=self.user)
+        self.assertEqual((imported.name, imported.calories), ('Плов', 300))
+        self.assertEqual(list(imported.allergens.all()), [self.nuts])
+
+    def test_web_upload(self):
+        upload = SimpleUploadedFile('dishes.csv', self.csv_file('Каша,250,8,,').getvalue())
+        response = self.client.post(reverse('dishes_import'), {'file': upload})
+
+        self.assertContains(response, 'Добавлено блюд: 1')
+        self.assertTrue(Dish.objects.filter(user=self.user, name='Каша').exists())
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as source:
+            source.write(self.csv_file('Каша,250,8,,', 'Суп,-5,1,,').getvalue())
+        self.addCleanup(os.remove, source.name)
+
+        out, err = StringIO(), StringIO()
+        call_command('import_dishes', source.name, user='eater', stdout=out, stderr=err)
+        self.assertIn('Добавлено блюд: 1, строк с ошибками: 1', out.getvalue())
+        self.assertIn('Строка 3', err.getvalue())
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class DishApiTest(TestCase):
+    """
+    Проверяет JSON API блюд и аллергенов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.nuts = Allergen.objects.create(name='Орехи', is_global=True)
+        cls.own = Allergen.objects.create(name='Киви', is_global=False, created_by=cls.user)
+        Allergen.objects.create(
+            name='Соя', is_global=False, created_by=User.objects.create_user('other')
+        )
+        for i in range(5):
+            dish = Dish.objects.create(
+                user=cls.user, name=f'Блюдо {i}', description='…', calories=100 * i
+            )
+            dish.allergens.add(cls.nuts)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('api_dishes'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_sparse_fields_and_filters(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api_dishes'), {
+                'fields': 'id,name', 'calories_min': 200, 'sort_by': 'calories',
+            })
+        data = response.json()
+
+        self.assertEqual([row['name'] for row in data['results']], ['Блюдо 2', 'Блюдо 3', 'Блюдо 4'])
+        self.assertEqual(set(data['results'][0]), {'id', 'name'})
+        dish_query = [q['sql'] for q in queries if 'FROM "main_dish"' in q['sql']]
+        self.assertEqual(len(dish_query), 1)
+        self.assertNotIn('"description"', dish_query[0])
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('api_dishes'), {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination(self):
+        names = []
+        params = {'fields': 'name', 'limit': 2}
+        while True:
+            data = self.client.get(reverse('api_dishes'), params).json()
+            names += [row['name'] for row in data['results']]
+            if not data['next']:
+                break
+            params['cursor'] = data['next']
+        self.assertEqual(names, [f'Блюдо {i}' for i in range(4, -1, -1)])
+
+    def test_etag_revalidation(self):
+        response = self.client.get(reverse('api_dishes'))
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+
+        # Сессия, пользователь и версии данных; блюда не запрашиваются.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('api_dishes'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        dish = Dish.objects.get(name='Блюдо 4')
+        dish.calories = 1
+        dish.save()
+        response = self.client.get(reverse('api_dishes'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_dish_detail(self):
+        dish = Dish.objects.get(name='Блюдо 1')
+        data = self.client.get(reverse('api_dish', args=[dish.pk])).json()
+        self.assertEqual(data['allergens'], [{'id': self.nuts.pk, 'name': 'Орехи'}])
+        self.assertIsNone(data['photo'])
+
+        other = Dish.objects.create(user=User.objects.get(username='other'), name='Чужое')
+        response = self.client.get(reverse('api_dish', args=[other.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_allergens(self):
+        data = self.client.get(reverse('api_allergens')).json()
+        self.assertEqual([row['name'] for row in data['results']], ['Киви', 'Орехи'])
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class PageCacheTest(TestCase):
+    """
+    Проверяет кеш отрисованных страниц списка блюд.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.other = User.objects.create_user('other')
+        cls.milk = Allergen.objects.create(name='Молоко', is_global=True)
+        Dish.objects.create(user=cls.user, name='Каша', calories=200)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.client.cookies['csrftoken'] = 'a' * 32
+
+    def get(self, **params):
+        return self.client.get(reverse('dishes'), params)
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.get(sort_by='calories')
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+
+        # Сессия, пользователь и версии данных.
+        with self.assertNumQueries(3):
+            second = self.get(sort_by='calories', name='')
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(page_cache_stats()['hits'], 1)
+        self.assertEqual(page_cache_stats()['misses'], 1)
+
+    def test_user_changes_invalidate(self):
+        self.get()
+        Dish.objects.create(user=self.user, name='Суп')
+        response = self.get()
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Суп')
+
+        allergen = Allergen.objects.create(
+            name='Киви', is_global=False, created_by=self.user
+        )
+        self.assertEqual(self.get()['X-Page-Cache'], 'miss')
+        Dish.objects.get(name='Суп').allergens.add(allergen)
+        self.assertEqual(self.get()['X-Page-Cache'], 'miss')
+
+    def test_global_allergen_change_invalidates(self):
+        self.get()
+        self.milk.name = 'Лактоза'
+        self.milk.save()
+        response = self.get()
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Лактоза')
+
+    def test_other_users_changes_keep_cache(self):
+        self.get()
+        Dish.objects.create(user=self.other, name='Чужое')
+        Allergen.objects.create(name='Соя', is_global=False, created_by=self.other)
+        self.assertEqual(self.get()['X-Page-Cache'], 'hit')
+
+    def test_pending_messages_bypass_cache(self):
+        self.get()
+        self.client.post(reverse('create_dish'), {'name': 'Плов'})
+        response = self.get()
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'успешно создано')
+
+    def test_without_csrf_cookie_not_cached(self):
+        del self.client.cookies['csrftoken']
+        response = self.get()
+        self.assertNotIn('X-Page-Cache', response)
+
+    def test_file_based_backend(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }}):
+            self.assertEqual(self.get()['X-Page-Cache'], 'miss')
+            self.assertEqual(self.get()['X-Page-Cache'], 'hit')
+            self.assertEqual(page_cache_stats()['hits'], 1)
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class AllergenCatalogTest(TestCase):
+    """
+    Проверяет кешированный справочник аллергенов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.staff = User.objects.create_user('admin', password='secret123', is_staff=True)
+        cls.milk = Allergen.objects.create(name='Молоко', is_global=True)
+        cls.kiwi = Allergen.objects.create(name='Киви', is_global=False, created_by=cls.user)
+        Allergen.objects.create(
+            name='Соя', is_global=False, created_by=User.objects.create_user('other')
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, user=None):
+        return [allergen.name for allergen in get_available_allergens(user or self.user)]
+
+    def test_lists_are_cached(self):
+        self.assertEqual(self.names(), ['Киви', 'Молоко'])
+        # Остаётся только чтение версий.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names(), ['Киви', 'Молоко'])
+
+    def test_user_list_survives_dish_changes(self):
+        self.names()
+        dish = Dish.objects.create(user=self.user, name='Каша')
+        dish.allergens.add(self.kiwi)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names(), ['Киви', 'Молоко'])
+
+    def test_global_list_reread_without_version_row(self):
+        self.names()
+        CacheVersion.objects.filter(scope='global').delete()
+        # Версии, глобальный список и личный (его ключ включает версию global).
+        with self.assertNumQueries(3):
+            self.assertEqual(self.names(), ['Киви', 'Молоко'])
+        Allergen.objects.filter(pk=self.milk.pk).update(name='Лактоза')
+        self.assertEqual(self.names(), ['Киви', 'Лактоза'])
+
+    def test_admin_views_invalidate_global_list(self):
+        self.names()
+        self.client.force_login(self.staff)
+        self.client.post(reverse('admin_create_allergen'), {'name': 'Арахис'})
+        self.assertEqual(self.names(), ['Арахис', 'Киви', 'Молоко'])
+
+        self.client.post(reverse('global_allergen_edit', args=[self.milk.pk]), {'name': 'Лактоза'})
+        self.assertEqual(self.names(), ['Арахис', 'Киви', 'Лактоза'])
+
+        self.client.post(reverse('global_allergen_delete', args=[self.milk.pk]))
+        self.assertEqual(self.names(), ['Арахис', 'Киви'])
+
+    def test_user_views_invalidate_user_list(self):
+        self.names()
+        self.client.force_login(self.user)
+        self.client.post(reverse('user_create_allergen'), {'name': 'Мёд'})
+        self.assertEqual(self.names(), ['Киви', 'Молоко', 'Мёд'])
+
+        self.client.post(reverse('allergen_edit', args=[self.kiwi.pk]), {'name': 'Ананас'})
+        self.assertEqual(self.names(), ['Ананас', 'Молоко', 'Мёд'])
+
+        self.client.post(reverse('allergen_delete', args=[self.kiwi.pk]))
+        self.assertEqual(self.names(), ['Молоко', 'Мёд'])
+
+    def test_dish_form_uses_catalog(self):
+        dish = Dish.objects.create(user=self.user, name='Каша')
+        dish.allergens.add(self.milk)
+        get_available_allergens(self.user)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('dish_edit', args=[dish.pk]))
+        self.assertContains(response, 'Киви')
+        self.assertNotContains(response, 'Соя')
+        self.assertContains(response, f'value="{self.milk.pk}"\n                               checked')
+
+        response = self.client.post(reverse('create_dish'), {
+            'name': 'Суп', 'allergens': [self.kiwi.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(Dish.objects.get(name='Суп').allergens.all()), [self.kiwi])
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class InstrumentationTest(TestCase):
+    """
+    Проверяет замеры запросов и бюджеты представлений.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.staff = User.objects.create_user('admin', password='secret123', is_staff=True)
+        milk = Allergen.objects.create(name='Молоко', is_global=True)
+        for i in range(3):
+            dish = Dish.objects.create(user=cls.user, name=f'Блюдо {i}', calories=100)
+            dish.allergens.add(milk)
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.client.force_login(self.user)
+
+    def stats_for(self, view_name):
+        return next(row for row in registry.snapshot() if row['view_name'] == view_name)
+
+    def test_server_timing_and_registry(self):
+        self.client.force_login(self.staff)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('dishes'))
+
+        self.assertIn(f'desc="{len(ctx)} queries"', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        stats = self.stats_for('dishes')
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['max_queries'], len(ctx))
+        self.assertEqual(stats['budget'], DishesListView.query_budget)
+        self.assertGreater(stats['avg_render_ms'], 0)
+        self.assertEqual(stats['avg_bytes'], len(response.content))
+
+    def test_server_timing_hidden_from_regular_users(self):
+        response = self.client.get(reverse('dishes'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.stats_for('dishes')['requests'], 1)
+
+        with override_settings(SERVER_TIMING_HEADER=True):
+            response = self.client.get(reverse('dishes'))
+        self.assertIn('Server-Timing', response)
+
+    def test_streaming_response_is_measured_to_the_end(self):
+        response = self.client.get(reverse('dishes_export'), {'format': 'csv'})
+        self.assertFalse(any(row['view_name'] == 'dishes_export' for row in registry.snapshot()))
+
+        content = b''.join(response.streaming_content)
+        stats = self.stats_for('dishes_export')
+        self.assertEqual(stats['avg_bytes'], len(content))
+        self.assertGreaterEqual(stats['max_queries'], 3)
+
+    def test_budget_exceeded_raises(self):
+        with mock.patch.object(DishesListView, 'query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('dishes'))
+
+    @override_settings(QUERY_BUDGETS_RAISE=False)
+    def test_budget_exceeded_logs_warning(self):
+        with mock.patch.object(DishesListView, 'query_budget', 1):
+            with self.assertLogs('main.instrumentation', 'WARNING') as logs:
+                response = self.client.get(reverse('dishes'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('dishes', logs.output[0])
+        self.assertEqual(self.stats_for('dishes')['over_budget'], 1)
+
+    def test_budget_ignored_for_writes(self):
+        self.client.post(reverse('create_dish'), {'name': 'Суп'})
+        self.assertIsNone(self.stats_for('create_dish')['budget'])
+
+    def test_stats_page_is_staff_only(self):
+        self.client.get(reverse('dishes'))
+        response = self.client.get(reverse('instrumentation_stats'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('instrumentation_stats'))
+        self.assertContains(response, 'dishes')
+        self.assertContains(response, 'Кеш страниц')
+
+        self.client.post(reverse('instrumentation_stats'))
+        self.assertEqual(
+            [row['view_name'] for row in registry.snapshot()],
+            ['instrumentation_stats']
+        )
+
+
+class BenchmarkTest(TestCase):
+    """
+    Проверяет генератор данных и прогон сценариев замеров.
+    """
+
+    def seed(self, seed=7):
+        return seed_benchmark_data(users=4, median_dishes=5, max_dishes=20, seed=seed)
+
+    def test_seed_is_deterministic(self):
+        created = self.seed()
+        names = list(Dish.objects.order_by('user__username', 'pk').values_list('name', 'calories'))
+        self.assertEqual(created['users'], 4)
+        self.assertEqual(created['dishes'], len(names))
+        summary = UserNutritionSummary.objects.get(user=default_benchmark_user())
+        self.assertEqual(summary.dish_count, Dish.objects.filter(user=summary.user).count())
+
+        clear_benchmark_data()
+        self.assertFalse(Dish.objects.exists())
+        self.seed()
+        self.assertEqual(
+            list(Dish.objects.order_by('user__username', 'pk').values_list('name', 'calories')),
+            names
+        )
+
+    def test_run_and_compare(self):
+        self.seed()
+        scenarios = [
+            scenario for scenario in default_scenarios()
+            if scenario.name in ('dishes[allergens|name]', 'dish_edit[post]', 'profile')
+        ]
+        results = run_benchmarks(default_benchmark_user(), scenarios, iterations=3, warmup=1)
+
+        self.assertEqual(set(results['results']), {scenario.name for scenario in scenarios})
+        row = results['results']['profile']
+        self.assertLessEqual(row['p50_ms'], row['p95_ms'])
+        self.assertGreater(row['queries'], 0)
+        self.assertGreater(row['peak_kb'], 0)
+        # Запись откатывается после каждого замера.
+        self.assertFalse(Dish.objects.filter(name='Замер').exists())
+
+        slower = json.loads(json.dumps(results))
+        slower['results']['profile']['p95_ms'] *= 2
+        slower['results']['profile']['queries'] += 1
+        rows = {row['name']: row for row in compare_results(results, slower)}
+        self.assertTrue(rows['profile']['regression'])
+        self.assertFalse(rows['dish_edit[post]']['regression'])
+
+    def test_percentile(self):
+        self.assertEqual(percentile([3, 1, 2, 4], 0.5), 2.5)
+        self.assertEqual(percentile([5], 0.95), 5)
+
+
+class LoadTestTest(TransactionTestCase):
+    """
+    Проверяет нагрузочный прогон на одном пользователе.
+    """
+
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix('browse=3, create=1'), {'browse': 3.0, 'create': 1.0})
+        with self.assertRaises(ValueError):
+            parse_mix('fly=1')
+        with self.assertRaises(ValueError):
+            parse_mix('browse=0')
+
+    def test_histogram(self):
+        counts = histogram([1, 7, 7, 20000])
+        self.assertEqual(counts['<=5'], 1)
+        self.assertEqual(counts['<=10'], 2)
+        self.assertEqual(counts['>10000'], 1)
+
+    @override_settings(
+        ALLOWED_HOSTS=['testserver'],
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    )
+    def test_asgi_run(self):
+        seed_benchmark_data(users=1, median_dishes=5, max_dishes=5)
+        user = default_benchmark_user()
+        dishes_before = Dish.objects.filter(user=user).count()
+
+        report = run_load_test(
+            target='asgi', users=1, duration=1,
+            mix={'browse': 1, 'create': 1, 'edit': 1, 'delete': 1}
+        )
+
+        self.assertGreater(report['requests'], 2)
+        self.assertEqual(report['actions']['login']['requests'], 2)
+        self.assertNotIn('500', report['statuses'])
+        self.assertEqual(report['lock_timeouts'], 0)
+        # Блюда прогона удалены, сводка пересчитана.
+        self.assertEqual(Dish.objects.filter(user=user).count(), dishes_before)
+        self.assertEqual(
+            UserNutritionSummary.objects.get(user=user).dish_count, dishes_before
+        )
+
+
+class SyncReadUrls:
+    urlpatterns = build_urlpatterns(async_reads=False)
+
+
+class AsyncReadUrls:
+    urlpatterns = build_urlpatterns(async_reads=True)
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class AsyncReadViewsTest(TestCase):
+    """
+    Проверяет, что асинхронные страницы чтения отдают то же,
+    что и синхронные.
+    """
+
+    CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="[^"]+"')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123', is_staff=True)
+        cls.milk = Allergen.objects.create(name='Молоко', is_global=True, created_by=cls.user)
+        cls.kiwi = Allergen.objects.create(name='Киви', is_global=False, created_by=cls.user)
+        for number in range(25):
+            dish = Dish.objects.create(
+                user=cls.user, name=f'Блюдо {number:02d}',
+                calories=100 + number, proteins=number % 7
+            )
+            if number % 3 == 0:
+                dish.allergens.add(cls.milk)
+            if number % 5 == 0:
+                dish.allergens.add(cls.kiwi)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def normalize(self, response):
+        return self.CSRF_TOKEN.sub('', response.content.decode())
+
+    async def fetch_async(self, path, params):
+        await self.async_client.aforce_login(self.user)
+        with override_settings(ROOT_URLCONF=AsyncReadUrls):
+            return await self.async_client.get(path, params)
+
+    def assert_same_page(self, name, params=None):
+        params = params or {}
+        path = reverse(name)
+        with override_settings(ROOT_URLCONF=SyncReadUrls):
+            expected = self.client.get(path, params)
+        actual = async_to_sync(self.fetch_async)(path, params)
+        self.assertEqual(actual.status_code, expected.status_code)
+        if expected.status_code == 200:
+            self.assertEqual(self.normalize(actual), self.normalize(expected))
+
+    @override_settings(PAGE_CACHE_ENABLED=False)
+    def test_dishes_match_sync(self):
+        for params in [
+            {},
+            {'page': 2},
+            {'page': 'last', 'sort_by': 'name'},
+            {'page': 9},
+            {'calories_min': '110', 'sort_by': '-proteins'},
+            {'exclude_allergens': [str(self.milk.pk), str(self.kiwi.pk)]},
+            {'name': 'Блюдо 1'},
+            {'pagination': 'cursor', 'sort_by': 'calories'},
+            {'pagination': 'cursor', 'cursor': 'broken'},
+        ]:
+            with self.subTest(params=params):
+                self.assert_same_page('dishes', params)
+
+    def test_other_pages_match_sync(self):
+        for name in ('profile', 'admin_create_allergen', 'user_create_allergen'):
+            with self.subTest(name=name):
+                self.assert_same_page(name)
+
+    def test_anonymous_redirected(self):
+        self.client.logout()
+        with override_settings(ROOT_URLCONF=AsyncReadUrls):
+            for name in ('dishes', 'profile', 'user_create_allergen'):
+                response = async_to_sync(self.async_client.get)(reverse(name))
+                self.assertEqual(response.status_code, 302)
+                self.assertIn(reverse('login'), response['Location'])
+
+    def test_post_uses_sync_view(self):
+        async def post():
+            await self.async_client.aforce_login(self.user)
+            with override_settings(ROOT_URLCONF=AsyncReadUrls):
+                return await self.async_client.post(
+                    reverse('user_create_allergen'), {'name': 'Соя'}
+                )
+
+        response = async_to_sync(post)()
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Allergen.objects.filter(name='Соя', created_by=self.user).exists())
+
+    def test_page_cache(self):
+        cache.clear()
+
+        async def get_twice():
+            await self.async_client.aforce_login(self.user)
+            self.async_client.cookies['csrftoken'] = 'a' * 32
+            with override_settings(ROOT_URLCONF=AsyncReadUrls):
+                first = await self.async_client.get(reverse('dishes'))
+                second = await self.async_client.get(reverse('dishes'))
+            return first, second
+
+        first, second = async_to_sync(get_twice)()
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class SimilarDishesTest(TestCase):
+    """
+    Проверяет поиск похожих блюд по КБЖУ.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.other = User.objects.create_user('other')
+        cls.soup = Dish.objects.create(
+            user=cls.user, name='Суп', calories=100, proteins=5, fats=3, carbohydrates=10
+        )
+        cls.broth = Dish.objects.create(
+            user=cls.user, name='Бульон', calories=90, proteins=6, fats=2, carbohydrates=8
+        )
+        cls.salad = Dish.objects.create(
+            user=cls.user, name='Салат', calories=110, proteins=4, fats=None, carbohydrates=9
+        )
+        cls.cake = Dish.objects.create(
+            user=cls.user, name='Торт', calories=450, proteins=6, fats=25, carbohydrates=50
+        )
+        cls.unknown = Dish.objects.create(user=cls.user, name='Что-то', calories=95)
+        Dish.objects.create(user=cls.other, name='Чужой суп', calories=100, proteins=5)
+
+    def setUp(self):
+        clear_indexes()
+        self.client.force_login(self.user)
+
+    def versions(self):
+        return user_data_versions(self.user.pk)
+
+    def names(self, dish, limit=10):
+        found = dict(Dish.objects.values_list('pk', 'name'))
+        return [found[pk] for pk, _ in similar_dishes(dish, self.versions(), limit)]
+
+    def test_ranking_and_missing_macros(self):
+        # Салат без жиров получает штраф, но остаётся ближе торта;
+        # у «Что-то» известны только калории — меньше двух общих показателей.
+        self.assertEqual(self.names(self.soup), ['Бульон', 'Салат', 'Торт'])
+        self.assertEqual(self.names(self.soup, limit=1), ['Бульон'])
+        # Сравнение только по калориям, если больше ничего не известно.
+        self.assertEqual(self.names(self.unknown)[:2], ['Суп', 'Бульон'])
+        self.assertEqual(
+            self.names(Dish(user=self.user, name='Пусто')), []
+        )
+
+    def test_index_updated_incrementally(self):
+        index = get_index(self.user.pk, self.versions())
+        with self.captureOnCommitCallbacks(execute=True):
+            twin = Dish.objects.create(
+                user=self.user, name='Двойник', calories=100, proteins=5, fats=3, carbohydrates=10
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.broth.delete()
+        self.assertIs(get_index(self.user.pk, self.versions()), index)
+        self.assertEqual(self.names(self.soup)[0], 'Двойник')
+        self.assertNotIn('Бульон', self.names(self.soup))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            twin.calories = 400
+            twin.save()
+        self.assertIs(get_index(self.user.pk, self.versions()), index)
+        self.assertEqual(self.names(self.soup)[0], 'Салат')
+
+    def test_foreign_changes_rebuild_index(self):
+        index = get_index(self.user.pk, self.versions())
+        # Массовое изменение без сигналов, как при импорте.
+        Dish.objects.filter(pk=self.cake.pk).update(calories=100, fats=3, carbohydrates=10)
+        bump_user_versions(self.user.pk)
+        rebuilt = get_index(self.user.pk, self.versions())
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(self.names(self.soup)[0], 'Торт')
+
+    def test_view(self):
+        response = self.client.get(reverse('dish_similar', args=[self.soup.pk]), {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [match['dish'].name for match in response.context['similar']],
+            ['Бульон', 'Салат']
+        )
+        self.assertContains(response, reverse('dish_similar', args=[self.broth.pk]))
+
+        foreign = Dish.objects.get(name='Чужой суп')
+        response = self.client.get(reverse('dish_similar', args=[foreign.pk]))
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(reverse('dish_similar', args=[self.unknown.pk]))
+        self.assertContains(response, '1 из 4')
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class MealPlannerTest(TestCase):
+    """
+    Проверяет подбор блюд под дневную норму.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.nuts = Allergen.objects.create(name='Орехи', is_global=True)
+        cls.porridge = Dish.objects.create(
+            user=cls.user, name='Каша', calories=400, proteins=12, fats=8, carbohydrates=70
+        )
+        cls.chicken = Dish.objects.create(
+            user=cls.user, name='Курица', calories=600, proteins=60, fats=20, carbohydrates=0
+        )
+        cls.pasta = Dish.objects.create(
+            user=cls.user, name='Паста', calories=1000, proteins=30, fats=30, carbohydrates=150
+        )
+        cls.granola = Dish.objects.create(
+            user=cls.user, name='Гранола', calories=1000, proteins=20, fats=40, carbohydrates=120
+        )
+        cls.granola.allergens.add(cls.nuts)
+        Dish.objects.create(user=cls.user, name='Без калорий', proteins=10)
+
+    def test_solve_pairs_and_local_search(self):
+        values = np.array([
+            [400, 12, 8, 70],
+            [600, 60, 20, 0],
+            [1000, 30, 30, 150],
+            [250, 5, 5, 40],
+        ], dtype=float)
+        result = solve(values, PlanTarget(1600), max_dishes=2)
+        self.assertEqual(sorted(result.rows), [1, 2])
+        self.assertFalse(result.timed_out)
+
+        # Тройка ищется локальным поиском.
+        rng = np.random.default_rng(3)
+        values = np.column_stack([rng.uniform(2000, 3000, (300, 1)), rng.uniform(0, 50, (300, 3))])
+        values[[10, 20, 30], 0] = [400, 500, 600]
+        result = solve(values, PlanTarget(1500), max_dishes=3, time_budget=5)
+        self.assertEqual(sorted(result.rows), [10, 20, 30])
+
+    def test_time_budget_returns_best_so_far(self):
+        values = np.random.default_rng(0).uniform(100, 900, (3000, 4))
+        started = time.perf_counter()
+        result = solve(values, PlanTarget(2000), max_dishes=4, time_budget=0)
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertTrue(result.timed_out)
+        self.assertEqual(len(result.rows), 1)
+
+    def test_plan_respects_bounds_and_allergens(self):
+        plan = plan_meals(self.user, PlanTarget(1600), [self.nuts.pk])
+        self.assertEqual({dish.name for dish in plan.dishes}, {'Курица', 'Паста'})
+        self.assertTrue(plan.is_met)
+        self.assertEqual(plan.candidates, 3)
+
+        # Белков не больше 50 г: курица не подходит, ближе всего паста с кашей.
+        target = PlanTarget(1600, {'proteins': (None, 50)})
+        plan = plan_meals(self.user, target, [self.nuts.pk])
+        self.assertEqual({dish.name for dish in plan.dishes}, {'Каша', 'Паста'})
+        self.assertFalse(plan.is_met)
+
+    def test_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('meal_planner'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['plan'])
+
+        response = self.client.get(reverse('meal_planner'), {
+            'calories': '2000', 'protein_min': '40', 'exclude_allergens': [str(self.nuts.pk)],
+        })
+        plan = response.context['plan']
+        self.assertNotIn('Гранола', [dish.name for dish in plan.dishes])
+        self.assertContains(response, 'Курица')
+
+        response = self.client.get(reverse('meal_planner'), {
+            'calories': '2000', 'fat_min': '30', 'fat_max': '10',
+        })
+        self.assertIsNone(response.context['plan'])
+        self.assertContains(response, 'Верхняя граница меньше нижней.')
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class FoodLogTest(TestCase):
+    """
+    Проверяет записи дневника и их дневные и недельные итоги.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.soup = Dish.objects.create(
+            user=cls.user, name='Суп', calories=200, proteins=10, fats=5, carbohydrates=20
+        )
+        cls.tea = Dish.objects.create(user=cls.user, name='Чай', calories=5)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def eat(self, dish, when, portion=1):
+        entry = MealEntry(user=self.user, dish=dish, portion=portion, eaten_at=when)
+        entry.fill_from_dish()
+        entry.save()
+        return entry
+
+    def at(self, day, hour=12):
+        return timezone.make_aware(datetime.combine(day, dt_time(hour)))
+
+    def totals(self):
+        daily = {
+            row['day']: row for row in DailyIntake.objects.values(
+                'day', 'entry_count', 'incomplete_entries', 'calories', 'proteins'
+            )
+        }
+        weekly = {
+            row['week_start']: row for row in WeeklyIntake.objects.values(
+                'week_start', 'days_logged', 'entry_count', 'calories'
+            )
+        }
+        return daily, weekly
+
+    def test_rollups_follow_changes(self):
+        monday = date(2024, 5, 6)
+        first = self.eat(self.soup, self.at(monday), portion=2)
+        self.eat(self.tea, self.at(monday, 18))
+        moved = self.eat(self.soup, self.at(monday + timedelta(days=2)))
+
+        daily, weekly = self.totals()
+        self.assertEqual(daily[monday]['calories'], 405)
+        self.assertEqual(daily[monday]['proteins'], 20)
+        self.assertEqual(daily[monday]['incomplete_entries'], 1)
+        self.assertEqual(weekly[monday]['days_logged'], 2)
+        self.assertEqual(weekly[monday]['calories'], 605)
+
+        # Перенос записи на следующую неделю.
+        next_week = monday + timedelta(days=7)
+        moved.eaten_at = self.at(next_week)
+        moved.save()
+        daily, weekly = self.totals()
+        self.assertNotIn(monday + timedelta(days=2), daily)
+        self.assertEqual(weekly[monday]['days_logged'], 1)
+        self.assertEqual(weekly[monday]['calories'], 405)
+        self.assertEqual(weekly[next_week]['calories'], 200)
+
+        first.delete()
+        moved.delete()
+        daily, weekly = self.totals()
+        self.assertEqual(daily[monday]['calories'], 5)
+        self.assertNotIn(next_week, weekly)
+
+        # Блюдо удалено — записи дневника и итоги остаются.
+        self.tea.delete()
+        self.assertEqual(MealEntry.objects.get().name, 'Чай')
+        self.assertEqual(self.totals()[0][monday]['calories'], 5)
+
+    def test_rebuild_matches_incremental(self):
+        day = date(2024, 5, 10)
+        for offset in range(10):
+            self.eat(self.soup if offset % 3 else self.tea, self.at(day + timedelta(days=offset % 4)), portion=1 + offset / 2)
+        before = self.totals()
+        rebuild_intake()
+        self.assertEqual(self.totals(), before)
+        self.assertEqual(rebuild_intake([self.user.pk]), 4)
+
+    def test_views(self):
+        day = timezone.localdate()
+        response = self.client.post(
+            reverse('meal_entry_create', args=[self.soup.pk]),
+            {'portion': '1.5', 'eaten_at': self.at(day).strftime('%Y-%m-%dT%H:%M')}
+        )
+        entry = MealEntry.objects.get()
+        self.assertRedirects(response, reverse('diary_day', args=(day.year, day.month, day.day)))
+        self.assertEqual(entry.calories, 300)
+
+        self.client.post(
+            reverse('meal_entry_edit', args=[entry.pk]),
+            {'portion': '0.5', 'eaten_at': self.at(day).strftime('%Y-%m-%dT%H:%M')}
+        )
+        entry.refresh_from_db()
+        self.assertEqual(entry.calories, 100)
+        self.assertEqual(DailyIntake.objects.get(day=day).calories, 100)
+
+        response = self.client.get(reverse('diary'), {'month': day.strftime('%Y-%m')})
+        self.assertContains(response, '100 ккал')
+        response = self.client.get(reverse('diary_day', args=(day.year, day.month, day.day)))
+        self.assertContains(response, 'Суп')
+        response = self.client.get(reverse('diary_trends'))
+        self.assertEqual(response.context['series'][-1]['totals'].calories, 100)
+
+        other = User.objects.create_user('other')
+        foreign = Dish.objects.create(user=other, name='Чужое', calories=1)
+        response = self.client.get(reverse('meal_entry_create', args=[foreign.pk]))
+        self.assertEqual(response.status_code, 404)
+
+        self.client.post(reverse('meal_entry_delete', args=[entry.pk]))
+        self.assertFalse(DailyIntake.objects.exists())
+        self.assertFalse(WeeklyIntake.objects.exists())
+
+    def test_extreme_dates(self):
+        this_month = timezone.localdate().strftime('%Y-%m')
+        for month in ('9999-12', '0001-01', '10000-01', 'май'):
+            response = self.client.get(reverse('diary'), {'month': month})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['weeks'][1]['days'][0]['day'].strftime('%Y-%m'), this_month)
+
+        for args in ((9999, 12, 31), (1, 1, 1), (2024, 2, 30)):
+            response = self.client.get(reverse('diary_day', args=args))
+            self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('diary'), {'month': '9998-12'})
+        self.assertEqual(response.context['next_month'], '9999-01')
+        response = self.client.get(reverse('diary_day', args=(9998, 12, 31)))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class DishPortionsTest(TestCase):
+    """
+    Проверяет значения на 100 г, порции блюд и фильтры по основе.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        # 500 ккал на порцию 250 г — 200 ккал на 100 г.
+        cls.pasta = Dish.objects.create(
+            user=cls.user, name='Паста', weight_grams=250,
+            calories=500, proteins=20, fats=10, carbohydrates=80
+        )
+        # 300 ккал на порцию 100 г — 300 ккал на 100 г.
+        cls.cake = Dish.objects.create(user=cls.user, name='Кекс', weight_grams=100, calories=300)
+        cls.soup = Dish.objects.create(user=cls.user, name='Суп', calories=250)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def names(self, params):
+        response = self.client.get(reverse('dishes'), params)
+        return sorted(dish.name for dish in response.context['dishes'])
+
+    def test_per_100g_values_follow_weight(self):
+        self.assertEqual(self.pasta.calories_100g, 200)
+        self.assertEqual(self.pasta.carbohydrates_100g, 32)
+        self.assertIsNone(self.soup.calories_100g)
+
+        self.soup.weight_grams = 500
+        self.soup.save()
+        self.soup.refresh_from_db()
+        self.assertEqual(self.soup.calories_100g, 50)
+        self.assertIsNone(self.soup.proteins_100g)
+
+    def test_filters_by_basis(self):
+        range_params = {'calories_min': 250, 'calories_max': 350}
+        self.assertEqual(self.names(range_params), ['Кекс', 'Суп'])
+        self.assertEqual(self.names({**range_params, 'basis': '100g'}), ['Кекс'])
+        self.assertEqual(self.names({'calories_max': 250, 'basis': '100g'}), ['Паста'])
+
+    def test_servings_precomputed_and_refreshed(self):
+        bowl = Serving.objects.create(dish=self.pasta, name='Миска', weight_grams=400)
+        self.assertEqual(bowl.calories, 800)
+        self.assertEqual(bowl.proteins, 32)
+        self.assertEqual(bowl.portion, 1.6)
+
+        self.pasta.calories = 250
+        self.pasta.save()
+        bowl.refresh_from_db()
+        self.assertEqual(bowl.calories, 400)
+
+        self.pasta.weight_grams = None
+        self.pasta.save()
+        bowl.refresh_from_db()
+        self.assertIsNone(bowl.calories)
+
+    def test_form_accepts_values_per_100g(self):
+        response = self.client.post(reverse('create_dish'), {
+            'name': 'Рис', 'weight_grams': 150, 'basis': '100g',
+            'calories': 130, 'proteins': 2.7,
+        })
+        self.assertEqual(response.status_code, 302)
+        rice = Dish.objects.get(name='Рис')
+        self.assertAlmostEqual(rice.calories, 195)
+        self.assertAlmostEqual(rice.proteins, 4.05)
+        self.assertAlmostEqual(rice.calories_100g, 130)
+
+        response = self.client.post(reverse('create_dish'), {
+            'name': 'Гречка', 'basis': '100g', 'calories': 110,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('weight_grams', response.context['form'].errors)
+
+    def test_servings_page(self):
+        response = self.client.post(
+            reverse('dish_servings', args=[self.pasta.pk]), {'name': 'Миска', 'weight_grams': 400}
+        )
+        self.assertRedirects(response, reverse('dish_servings', args=[self.pasta.pk]))
+        response = self.client.get(reverse('dish_servings', args=[self.pasta.pk]))
+        self.assertContains(response, 'Миска')
+        self.assertContains(response, '?portion=1.600"')
+
+        serving = Serving.objects.get(name='Миска')
+        other = User.objects.create_user('other', password='secret123')
+        self.client.force_login(other)
+        response = self.client.post(reverse('serving_delete', args=[serving.pk]))
+        self.assertEqual(response.status_code, 404)
+        self.client.force_login(self.user)
+        self.client.post(reverse('serving_delete', args=[serving.pk]))
+        self.assertFalse(Serving.objects.exists())
+
+    def test_meal_entry_portion_from_query(self):
+        response = self.client.get(
+            reverse('meal_entry_create', args=[self.pasta.pk]), {'portion': '1.6'}
+        )
+        self.assertEqual(response.context['form'].initial['portion'], 1.6)
+
+    def test_import_fills_per_100g(self):
+        rows = BytesIO('name,weight_grams,calories\nХлеб,50,130\n'.encode())
+        import_dishes(self.user, rows, file_format='csv')
+        self.assertEqual(Dish.objects.get(name='Хлеб').calories_100g, 260)
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class DishCompositionTest(TestCase):
+    """
+    Проверяет блюда-рецепты и пересчёт их итогов по составу.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cook', password='secret123')
+        cls.milk = Allergen.objects.create(name='Молоко', is_global=True)
+        cls.gluten = Allergen.objects.create(name='Глютен', is_global=True)
+        cls.pasta = Dish.objects.create(
+            user=cls.user, name='Паста', calories=300, proteins=10, carbohydrates=60
+        )
+        cls.pasta.allergens.add(cls.gluten)
+        cls.sauce = Dish.objects.create(
+            user=cls.user, name='Соус', calories=100, proteins=2, fats=8
+        )
+        cls.sauce.allergens.add(cls.milk)
+        cls.cheese = Dish.objects.create(user=cls.user, name='Сыр', calories=50, fats=4)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def recipe(self, name, *parts):
+        with self.captureOnCommitCallbacks(execute=True):
+            dish = Dish.objects.create(user=self.user, name=name)
+            for component, quantity in parts:
+                DishComponent.objects.create(parent=dish, component=component, quantity=quantity)
+        dish.refresh_from_db()
+        return dish
+
+    def macros(self, dish):
+        dish.refresh_from_db()
+        return [getattr(dish, field) for field in ('calories', 'proteins', 'fats', 'carbohydrates')]
+
+    def test_totals_and_allergens_materialized(self):
+        plate = self.recipe('Паста с соусом', (self.pasta, 1), (self.sauce, 0.5))
+        self.assertEqual(self.macros(plate), [350, 11, 4, 60])
+        self.assertEqual(set(plate.allergens.all()), {self.milk, self.gluten})
+        self.assertNotEqual(plate.allergen_mask, 0)
+
+        response = self.client.get(reverse('dishes'), {'calories_min': 340, 'calories_max': 360})
+        self.assertEqual([dish.name for dish in response.context['dishes']], ['Паста с соусом'])
+
+    def test_component_edits_propagate_up_the_dag(self):
+        # Соус входит в ужин и напрямую, и через пасту с соусом.
+        plate = self.recipe('Паста с соусом', (self.pasta, 1), (self.sauce, 1))
+        dinner = self.recipe('Ужин', (plate, 1), (self.sauce, 1), (self.cheese, 2))
+        self.assertEqual(self.macros(dinner)[0], 600)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sauce.calories = 200
+            self.sauce.save()
+        self.assertEqual(self.macros(plate)[0], 500)
+        self.assertEqual(self.macros(dinner)[0], 800)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheese.allergens.add(self.gluten)
+            self.sauce.allergens.remove(self.milk)
+        self.assertEqual(set(plate.allergens.all()), {self.gluten})
+        self.assertEqual(set(dinner.allergens.all()), {self.gluten})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sauce.delete()
+        self.assertEqual(self.macros(plate), [300, 10, None, 60])
+        self.assertEqual(self.macros(dinner)[0], 400)
+
+        summary = UserNutritionSummary.objects.get(user=self.user)
+        self.assertEqual(summary.calories_sum, 300 + 50 + 300 + 400)
+
+    def test_recipe_values_restored_after_manual_edit(self):
+        plate = self.recipe('Паста с соусом', (self.pasta, 1), (self.sauce, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            plate.calories = 1
+            plate.save()
+        self.assertEqual(self.macros(plate)[0], 400)
+
+    def test_cycles_rejected(self):
+        plate = self.recipe('Паста с соусом', (self.pasta, 1))
+        dinner = self.recipe('Ужин', (plate, 1))
+        self.assertTrue(creates_cycle(self.pasta.pk, dinner.pk))
+        self.assertTrue(creates_cycle(plate.pk, plate.pk))
+        self.assertFalse(creates_cycle(dinner.pk, self.sauce.pk))
+
+        response = self.client.post(
+            reverse('dish_components', args=[plate.pk]), {'component': dinner.pk, 'quantity': 1}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('component', response.context['form'].errors)
+        self.assertEqual(DishComponent.objects.count(), 2)
+
+        with self.assertRaises(CompositionCycle):
+            topological_order({1: [2], 2: [3], 3: [1]})
+
+    def test_topological_order(self):
+        order = topological_order({1: [2, 3], 2: [3], 3: [4], 5: [1]})
+        self.assertEqual(order, [3, 2, 1, 5])
+
+    def test_components_page(self):
+        plate = self.recipe('Паста с соусом')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('dish_components', args=[plate.pk]), {'component': self.pasta.pk, 'quantity': 2}
+            )
+        self.assertRedirects(response, reverse('dish_components', args=[plate.pk]))
+        self.assertEqual(self.macros(plate)[0], 600)
+
+        response = self.client.get(reverse('dish_components', args=[plate.pk]))
+        self.assertContains(response, 'Паста')
+        response = self.client.get(reverse('dish_components', args=[self.pasta.pk]))
+        self.assertContains(response, 'Паста с соусом')
+
+        link = DishComponent.objects.get()
+        other = User.objects.create_user('other', password='secret123')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('dish_components', args=[plate.pk])).status_code, 404)
+        self.assertEqual(self.client.post(reverse('dish_component_delete', args=[link.pk])).status_code, 404)
+
+    def test_component_chosen_by_name(self):
+        plate = self.recipe('Паста с соусом')
+        response = self.client.get(reverse('dish_components', args=[plate.pk]))
+        self.assertNotContains(response, '<select')
+        self.assertNotContains(response, 'Сыр')
+
+        url = reverse('dish_components', args=[plate.pk])
+        response = self.client.post(url, {'component_name': 'Бургер', 'quantity': 1})
+        self.assertIn('component', response.context['form'].errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'component_name': 'Сыр', 'quantity': 2})
+        self.assertRedirects(response, url)
+        self.assertEqual(self.macros(plate)[0], 100)
+
+    def test_recipe_macros_read_only_in_dish_form(self):
+        plate = self.recipe('Паста с соусом', (self.pasta, 1), (self.sauce, 1))
+        url = reverse('dish_edit', args=[plate.pk])
+        response = self.client.get(url)
+        self.assertContains(response, 'Считается по составу блюда')
+        self.assertTrue(response.context['form'].fields['calories'].disabled)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {
+                'name': 'Паста под соусом', 'calories': 1, 'basis': '100g',
+                'allergens': [],
+            })
+        self.assertRedirects(response, reverse('dishes'))
+        plate.refresh_from_db()
+        self.assertEqual(plate.name, 'Паста под соусом')
+        self.assertEqual(self.macros(plate)[0], 400)
+        self.assertEqual(set(plate.allergens.all()), {self.milk, self.gluten})
+
+        response = self.client.get(reverse('dish_edit', args=[self.pasta.pk]))
+        self.assertFalse(response.context['form'].fields['calories'].disabled)
+
+    def test_rebuild_command(self):
+        plate = self.recipe('Паста с соусом', (self.pasta, 1), (self.sauce, 1))
+        Dish.objects.filter(pk=plate.pk).update(calories=0)
+        call_command('rebuild_dish_compositions', stdout=StringIO())
+        self.assertEqual(self.macros(plate)[0], 400)
+
+
+class DishSearchTest(TestCase):
+    """
+    Проверяет поиск блюд по названию.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+        cls.borscht = Dish.objects.create(user=cls.user, name='Борщ Украинский')
+        cls.salad = Dish.objects.create(user=cls.user, name='Салат оливье')
+        cls.yogurt = Dish.objects.create(user=cls.user, name='Йогурт')
+
+    def names(self, query):
+        queryset = search_dishes(Dish.objects.filter(user=self.user), query)
+        return sorted(dish.name for dish in queryset)
+
+    def test_case_insensitive_cyrillic(self):
+        self.assertEqual(self.names('борщ'), ['Борщ Украинский'])
+        self.assertEqual(self.names('УКРАИН'), ['Борщ Украинский'])
+        self.assertEqual(self.names('ОлИвЬе'), ['Салат оливье'])
+        self.assertEqual(self.names('  '), ['Борщ Украинский', 'Йогурт', 'Салат оливье'])
+        self.assertEqual(self.names('пельмени'), [])
+
+    def test_short_query_uses_lower_contains(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.names('йо'), ['Йогурт'])
+        self.assertIn(SQLITE_LOWER_FUNCTION, queries[0]['sql'])
+        self.assertNotIn(DISH_FTS_TABLE, queries[0]['sql'])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.names('йог'), ['Йогурт'])
+        self.assertIn(DISH_FTS_TABLE, queries[0]['sql'])
+
+    def test_triggers_follow_rename_and_delete(self):
+        self.salad.name = 'Винегрет'
+        self.salad.save()
+        self.assertEqual(self.names('оливье'), [])
+        self.assertEqual(self.names('винегрет'), ['Винегрет'])
+
+        self.borscht.delete()
+        self.assertEqual(self.names('борщ'), [])
+
+    def test_quotes_in_query(self):
+        Dish.objects.create(user=self.user, name='Торт "Наполеон"')
+        self.assertEqual(self.names('"наполеон"'), ['Торт "Наполеон"'])
+
+
+@override_settings(QUERY_BUDGETS_RAISE=True)
+class PhotoRenditionsTest(TestCase):
+    """
+    Проверяет построение уменьшенных копий фотографии блюда.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.user)
+
+    def make_upload(self, size=(2000, 1500)):
+        image = Image.new('RGB', size, 'orange')
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'  # Make
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile(
+            'plate.jpg', buffer.getvalue(), content_type='image/jpeg'
+        )
+
+    def test_command_marks_failed_photos_ready(self):
+        photo = default_storage.save('plate.jpg', self.make_upload())
+        dish = Dish.objects.create(
+            user=self.user, name='Плов', photo=photo, photo_status=Dish.PHOTO_FAILED
+        )
+        call_command('generate_photo_renditions', workers=1, stdout=StringIO())
+        dish.refresh_from_db()
+        self.assertEqual(dish.photo_status, Dish.PHOTO_READY)
+        self.assertEqual(set(dish.photo_renditions), {'thumb', 'medium'})
+
+    def test_command_workers_start_under_spawn(self):
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context('spawn'), initializer=_init_worker
+        ) as pool:
+            dish_id, renditions, error = pool.submit(_render, 7, 'missing.jpg').result()
+        self.assertEqual((dish_id, renditions), (7, None))
+        self.assertIn('missing.jpg', error)
+
+    def test_upload_builds_renditions(self):
+        response = self.client.post(reverse('create_dish'), {
+            'name': 'Плов', 'photo': self.make_upload(),
+        })
+        self.assertEqual(response.status_code, 302)
+
+        dish = Dish.objects.get(name='Плов')
+        self.assertEqual(dish.photo_status, Dish.PHOTO_PROCESSING)
+        self.assertEqual(dish.photo_renditions, {})
+        response = self.client.get(reverse('dishes'))
+        self.assertContains(response, 'Обрабатывается')
+
+        self.assertEqual(run_pending_jobs(), 1)
+        dish.refresh_from_db()
+        self.assertEqual(dish.photo_status, Dish.PHOTO_READY)
+        self.assertEqual(set(dish.photo_renditions), {'thumb', 'medium'})
+        thumb = dish.photo_renditions['thumb']
+        self.assertEqual(thumb['width'], 320)
+
+        with default_storage.open(thumb['jpeg']) as stored:
+            with Image.open(stored) as image:
+                self.assertEqual(image.size, (320, 240))
+                self.assertFalse(image.getexif())
+
+        response = self.client.get(reverse('dishes'))
+        self.assertContains(response, 'srcset=')
+        self.assertContains(response, dish.photo_thumb_url)
+
+    def test_small_photo_is_not_upscaled(self):
+        self.client.post(reverse('create_dish'), {
+            'name': 'Плов', 'photo': self.make_upload(size=(200, 100)),
+        })
+        run_pending_jobs()
+        dish = Dish.objects.get(name='Плов')
+        self.assertEqual(dish.photo_renditions['medium']['width'], 200)
+
+
+class PhotoStorageTest(TestCase):
+    """
+    Проверяет хранилище фотографий с адресацией по содержимому.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('eater', password='secret123')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.user)
+
+    def image_bytes(self, color='orange'):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), color).save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def upload(self, name, color='orange'):
+        self.client.post(reverse('create_dish'), {
+            'name': name,
+            'photo': SimpleUploadedFile(
+                'plate.jpg', self.image_bytes(color), content_type='image/jpeg'
+            ),
+        })
+        return Dish.objects.get(name=name)
+
+    def test_same_photo_stored_once(self):
+        first = self.upload('Плов')
+        second = self.upload('Рис')
+        run_pending_jobs()
+        first.refresh_from_db()
+
+        self.assertEqual(first.photo.name, second.photo.name)
+        self.assertRegex(first.photo.name, r'^photos/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(PhotoBlob.objects.get(name=first.photo.name).ref_count, 2)
+        thumb = first.photo_renditions['thumb']['jpeg']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('dish_delete', args=[first.pk]))
+        self.assertTrue(photo_storage.exists(second.photo.name))
+        self.assertEqual(PhotoBlob.objects.get(name=second.photo.name).ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('dish_delete', args=[second.pk]))
+        self.assertFalse(photo_storage.exists(second.photo.name))
+        self.assertFalse(default_storage.exists(thumb))
+        self.assertFalse(PhotoBlob.objects.exists())
+
+    def test_replaced_photo_is_released(self):
+        dish = self.upload('Плов')
+        old_name = dish.photo.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('dish_edit', args=[dish.pk]), {
+                'name': 'Плов',
+                'photo': SimpleUploadedFile(
+                    'new.jpg', self.image_bytes('green'), content_type='image/jpeg'
+                ),
+            })
+        dish.refresh_from_db()
+
+        self.assertNotEqual(dish.photo.name, old_name)
+        self.assertFalse(photo_storage.exists(old_name))
+        self.assertEqual(
+            list(PhotoBlob.objects.values_list('name', 'ref_count')),
+            [(dish.photo.name, 1)]
+        )
+
+    def test_migrate_legacy_files(self):
+        data = self.image_bytes()
+        for name in ('a.jpg', 'b.jpg', 'orphan.jpg'):
+            with open(photo_storage.path(name), 'wb') as legacy:
+                legacy.write(data)
+        Dish.objects.create(user=self.user, name='Плов', photo='a.jpg')
+        Dish.objects.create(user=self.user, name='Рис', photo='b.jpg')
+
+        out = StringIO()
+        call_command('migrate_photo_storage', '--delete-orphans', stdout=out)
+
+        names = set(Dish.objects.values_list('photo', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(photo_storage.exists(name))
+        self.assertEqual(photo_storage.listdir('')[1], [])
+        self.assertEqual(PhotoBlob.objects.get(name=name).ref_count, 2)
+        self.assertIn(f'({2 * len(data)} байт)', out.getvalue())
+
+
+class JobQueueTest(TestCase):
+    """
+    Проверяет очередь фоновых задач.
+    """
+
+    def setUp(self):
+        self.calls = []
+
+        @job_handler('test_job')
+        def handler(payload):
+            self.calls.append(payload)
+            if payload.get('fail'):
+                raise RuntimeError('сбой')
+
+        self.addCleanup(JOB_HANDLERS.pop, 'test_job')
+
+    def test_job_runs_once(self):
+        job = enqueue('test_job', {'n': 1})
+        self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(run_pending_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(self.calls, [{'n': 1}])
+
+    def test_failed_job_is_retried_then_failed(self):
+        job = enqueue('test_job', {'fail': True}, max_attempts=2)
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('RuntimeError', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_stale_job_is_requeued(self):
+        job = enqueue('test_job', {})
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING,
+            locked_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(run_pending_jobs(), 1)
+
+    def test_unknown_kind_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue('no_such_job', {})
@@ -1,20 +1,51 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, views
 
-urlpatterns = [
-    path('', views.home, name='home'),
-    path('register/', views.register_view, name='register'),
-    path('login/', views.login_view, name='login'),
-    path('logout/', views.logout_view, name='logout'),
-    path('profile/', views.profile_view, name='profile'),
-    path('allergens/global/add/', views.admin_create_allergen, name='admin_create_allergen'),
-    path('allergens/global/<int:pk>/edit/', views.UpdateGlobalAllergenView.as_view(), name='global_allergen_edit'),
-    path('allergens/global/<int:pk>/delete/', views.DeleteGlobalAllergenView.as_view(), name='global_allergen_delete'),
-    path('my/allergen/add', views.user_create_allergen, name='user_create_allergen'),
-    path('my/allergen/<int:pk>/edit/', views.UpdateAllergenView.as_view(), name='allergen_edit'),
-    path('my/allergen/<int:pk>/delete/', views.DeleteAllergenView.as_view(), name='allergen_delete'),
-    path('dishes/create/', views.create_dish, name='create_dish'),
-    path('dishes/', views.DishesListView.as_view(), name='dishes'),
-    path('dishes/<int:pk>/edit/', views.UpdateDishView.as_view(), name='dish_edit'),
-    path('dishes/<int:pk>/delete/', views.DeleteDishView.as_view(), name='dish_delete')
-]
\ No newline at end of file
+
+def build_urlpatterns(async_reads=False):
+    """
+    Собирает маршруты приложения.
+
+    При ``async_reads`` список блюд, профиль и списки аллергенов
+    обслуживают асинхронные представления из ``async_views``.
+    """
+    read_views = async_views if async_reads else views
+    return [
+        path('', views.home, name='home'),
+        path('register/', views.register_view, name='register'),
+        path('login/', views.login_view, name='login'),
+        path('logout/', views.logout_view, name='logout'),
+        path('profile/', read_views.profile_view, name='profile'),
+        path('allergens/global/add/', read_views.admin_create_allergen, name='admin_create_allergen'),
+        path('allergens/global/<int:pk>/edit/', views.UpdateGlobalAllergenView.as_view(), name='global_allergen_edit'),
+        path('allergens/global/<int:pk>/delete/', views.DeleteGlobalAllergenView.as_view(), name='global_allergen_delete'),
+        path('my/allergen/add', read_views.user_create_allergen, name='user_create_allergen'),
+        path('my/allergen/<int:pk>/edit/', views.UpdateAllergenView.as_view(), name='allergen_edit'),
+        path('my/allergen/<int:pk>/delete/', views.DeleteAllergenView.as_view(), name='allergen_delete'),
+        path('dishes/create/', views.create_dish, name='create_dish'),
+        path('dishes/', read_views.DishesListView.as_view(), name='dishes'),
+        path('dishes/export/', views.ExportDishesView.as_view(), name='dishes_export'),
+        path('dishes/import/', views.import_dishes_view, name='dishes_import'),
+        path('dishes/plan/', views.meal_planner_view, name='meal_planner'),
+        path('dishes/<int:pk>/edit/', views.UpdateDishView.as_view(), name='dish_edit'),
+        path('dishes/<int:pk>/delete/', views.DeleteDishView.as_view(), name='dish_delete'),
+        path('dishes/<int:pk>/similar/', views.SimilarDishesView.as_view(), name='dish_similar'),
+        path('dishes/<int:pk>/servings/', views.dish_servings_view, name='dish_servings'),
+        path('dishes/servings/<int:pk>/delete/', views.ServingDeleteView.as_view(), name='serving_delete'),
+        path('dishes/<int:pk>/components/', views.dish_components_view, name='dish_components'),
+        path('dishes/components/<int:pk>/delete/', views.DishComponentDeleteView.as_view(), name='dish_component_delete'),
+        path('diary/', views.diary_month_view, name='diary'),
+        path('diary/trends/', views.diary_trends_view, name='diary_trends'),
+        path('diary/<int:year>/<int:month>/<int:day>/', views.diary_day_view, name='diary_day'),
+        path('diary/add/<int:dish_pk>/', views.MealEntryCreateView.as_view(), name='meal_entry_create'),
+        path('diary/entries/<int:pk>/edit/', views.MealEntryUpdateView.as_view(), name='meal_entry_edit'),
+        path('diary/entries/<int:pk>/delete/', views.MealEntryDeleteView.as_view(), name='meal_entry_delete'),
+        path('stats/', views.instrumentation_stats_view, name='instrumentation_stats'),
+        path('api/dishes/', api.DishListApiView.as_view(), name='api_dishes'),
+        path('api/dishes/<int:pk>/', api.DishDetailApiView.as_view(), name='api_dish'),
+        path('api/allergens/', api.AllergenListApiView.as_view(), name='api_allergens'),
+    ]
+
+
+urlpatterns = build_urlpatterns(settings.ASYNC_READ_VIEWS)
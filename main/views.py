@@ -1,23 +1,68 @@
-from django.shortcuts import render, redirect
+import calendar
+import hashlib
+from datetime import MAXYEAR, MINYEAR, date, datetime, time, timedelta
+
+from django.conf import settings
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import HttpResponse
-from django.views.generic import ListView
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views.generic import DetailView, ListView, View
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.db.models import Q
-from django.views.generic.edit import DeleteView, UpdateView
-from django.urls import reverse_lazy
-
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Prefetch, Q, Sum
+from django.views.generic.edit import CreateView, DeleteView, UpdateView
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .allergen_masks import exclude_dishes_with_allergens, parse_allergen_ids
+from .caching import (
+    VersionedPageCacheMixin,
+    get_page_cache,
+    normalized_query,
+    page_cache_stats,
+    request_data_versions,
+    reset_page_cache_stats,
+    user_data_versions,
+)
+from .catalog import get_available_allergens
+from .exports import EXPORT_FORMATS
 from .forms import (
     CustomUserCreationForm,
     GlobalAllergenForm,
     UserAllergenForm,
+    DishComponentForm,
     DishForm,
+    DishImportForm,
+    MealEntryForm,
+    MealPlanForm,
+    ServingForm,
 )
-from .models import Allergen, Dish
+from .importers import detect_format, import_dishes
+from .instrumentation import query_budget, registry
+from .jobs import schedule_photo_processing
+from .intake import week_start
+from .models import (
+    MACRO_FIELDS,
+    Allergen,
+    DailyIntake,
+    Dish,
+    DishComponent,
+    MealEntry,
+    Serving,
+    WeeklyIntake,
+)
+from .nutrition import get_summary
+from .pagination import CursorPaginator, InvalidCursor
+from .planner import DEFAULT_MAX_DISHES, PlanTarget, plan_meals
+from .portions import BASIS_100G, BASIS_SERVING, basis_field
+from .search import search_dishes
+from .similarity import DEFAULT_LIMIT, MAX_LIMIT, similar_dishes
 
 
+@query_budget(2)
 def home(request):
     """
     Отображает главную страницу приложения.
@@ -73,12 +118,33 @@ def logout_view(request):
     return redirect('home')
 
 
+@query_budget(4)
 @login_required
 def profile_view(request):
     """
-    Отображает страницу профиля авторизованного пользователя.
+    Отображает страницу профиля авторизованного пользователя
+    со сводной статистикой по его блюдам.
     """
-    return render(request, 'main/profile.html')
+    summary = get_summary(request.user)
+
+    top_usage = sorted(
+        summary.allergen_usage.items(),
+        key=lambda item: item[1],
+        reverse=True
+    )[:5]
+    names = dict(
+        Allergen.objects.filter(
+            pk__in=[int(pk) for pk, _ in top_usage]
+        ).values_list('pk', 'name')
+    ) if top_usage else {}
+
+    return render(request, 'main/profile.html', {
+        'dish_stats': summary.as_stats(),
+        'top_allergens': [
+            {'name': names[int(pk)], 'count': count}
+            for pk, count in top_usage if int(pk) in names
+        ],
+    })
 
 
 def staff_required(user):
@@ -88,6 +154,7 @@ def staff_required(user):
     return user.is_staff
 
 
+@query_budget(3)
 @login_required
 def admin_create_allergen(request):
     """
@@ -113,7 +180,7 @@ def admin_create_allergen(request):
 
     global_allergens = Allergen.objects.filter(
         is_global=True
-    ).order_by('name')
+    ).select_related('created_by').order_by('name')
 
     return render(
         request,
@@ -122,6 +189,7 @@ def admin_create_allergen(request):
     )
 
 
+@query_budget(3)
 @login_required
 def user_create_allergen(request):
     """
@@ -160,6 +228,7 @@ def user_create_allergen(request):
     )
 
 
+@query_budget(5)
 @login_required
 def create_dish(request):
     """
@@ -177,8 +246,13 @@ def create_dish(request):
         if form.is_valid():
             dish = form.save(commit=False)
             dish.user = request.user
-            dish.save()
-            form.save_m2m()
+            if dish.photo:
+                dish.photo_status = Dish.PHOTO_PROCESSING
+            with transaction.atomic():
+                dish.save()
+                form.save_m2m()
+                if dish.photo:
+                    schedule_photo_processing(dish)
             messages.success(
                 request,
                 f"Блюдо «{dish.name}» успешно создано!"
@@ -194,33 +268,121 @@ def create_dish(request):
     )
 
 
-class DishesListView(LoginRequiredMixin, ListView):
+@query_budget(2)
+@login_required
+def import_dishes_view(request):
     """
-    Отображает список блюд пользователя.
+    Массовый импорт блюд из файла CSV или JSON Lines.
+    """
+    report = None
+    if request.method == 'POST':
+        form = DishImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            report = import_dishes(
+                request.user,
+                upload.file,
+                file_format=detect_format(upload.name)
+            )
+            if report.created:
+                messages.success(
+                    request,
+                    f"Импортировано блюд: {report.created}"
+                )
+    else:
+        form = DishImportForm()
+
+    return render(
+        request,
+        'main/dish_import.html',
+        {'form': form, 'report': report}
+    )
+
 
-    Поддерживает фильтрацию, сортировку и пагинацию.
+
+@query_budget(8)
+@login_required
+def meal_planner_view(request):
     """
+    Подбор набора своих блюд под дневную норму КБЖУ.
 
-    template_name = 'main/dishes.html'
-    context_object_name = 'dishes'
-    paginate_by = 10
+    Форма отправляется GET-запросом, поэтому подбор можно
+    сохранить ссылкой. Исключение аллергенов работает так же,
+    как в списке блюд.
+    """
+    versions = request_data_versions(request)
+    exclude_allergens = request.GET.getlist('exclude_allergens')
+    form = MealPlanForm(
+        request.GET if 'calories' in request.GET else None,
+        user=request.user,
+        versions=versions
+    )
 
-    def get_queryset(self):
+    plan = None
+    if form.is_valid():
+        plan = plan_meals(
+            request.user,
+            PlanTarget(form.cleaned_data['calories'], form.bounds()),
+            exclude_allergen_ids=parse_allergen_ids(exclude_allergens),
+            max_dishes=form.cleaned_data['max_dishes'] or DEFAULT_MAX_DISHES,
+            versions=versions
+        )
+
+    return render(request, 'main/meal_planner.html', {
+        'form': form,
+        'plan': plan,
+        'available_allergens': form.available_allergens,
+        'current_exclude_allergens': [int(a) for a in exclude_allergens if a.isdigit()],
+    })
+
+
+@login_required
+@user_passes_test(staff_required)
+def instrumentation_stats_view(request):
+    """
+    Статистика запросов к базе, времени SQL и шаблонов
+    по представлениям. Доступна только администраторам.
+    """
+    if request.method == 'POST':
+        registry.reset()
+        reset_page_cache_stats()
+        messages.success(request, "Статистика сброшена")
+        return redirect('instrumentation_stats')
+
+    return render(request, 'main/stats.html', {
+        'views_stats': registry.snapshot(),
+        'page_cache': page_cache_stats(),
+    })
+
+
+# Параметры запроса, которые сужают список блюд.
+FILTER_PARAMS = (
+    'name',
+    'calories_min', 'calories_max',
+    'protein_min', 'protein_max',
+    'fat_min', 'fat_max',
+    'carbs_min', 'carbs_max',
+    'created_after', 'created_before',
+    'exclude_allergens',
+)
+
+
+class DishFilterMixin:
+    """
+    Фильтрация и сортировка блюд текущего пользователя
+    по параметрам запроса.
+
+    Общая для списка блюд и выгрузки, чтобы выгружалось
+    ровно то, что пользователь видит в списке.
+    """
+
+    def filter_dishes(self, queryset):
         """
-        Формирует queryset блюд текущего пользователя
-        с учётом параметров фильтрации и сортировки.
+        Применяет к queryset поиск по названию, фильтры и сортировку.
         """
-        queryset = Dish.objects.filter(user=self.request.user)
-
         name = self.request.GET.get('name')
         if name:
-            name_lower = name.lower()
-            queryset = [
-                dish for dish in queryset
-                if name_lower in dish.name.lower()
-            ]
-            dish_ids = [dish.id for dish in queryset]
-            queryset = Dish.objects.filter(id__in=dish_ids)
+            queryset = search_dishes(queryset, name)
 
         queryset = self.apply_filters(queryset)
         queryset = self.apply_sorting(queryset)
@@ -229,17 +391,29 @@ class DishesListView(LoginRequiredMixin, ListView):
     def get_available_allergens(self):
         """
         Возвращает список глобальных и пользовательских аллергенов
-        для фильтрации.
+        для фильтрации из кешированного справочника.
         """
-        return (
-            Allergen.objects.filter(is_global=True) |
-            Allergen.objects.filter(created_by=self.request.user)
-        ).order_by('name').distinct()
+        if getattr(self, '_available_allergens', None) is None:
+            self._available_allergens = get_available_allergens(
+                self.request.user,
+                versions=request_data_versions(self.request)
+            )
+        return self._available_allergens
+
+    def get_basis(self):
+        """
+        Возвращает основу фильтров по нутриентам: на порцию или на 100 г.
+        """
+        basis = self.request.GET.get('basis')
+        return basis if basis == BASIS_100G else BASIS_SERVING
 
     def apply_filters(self, queryset):
         """
         Применяет фильтры по параметрам запроса
         (калории, БЖУ, дата создания).
+
+        Границы нутриентов относятся к порции или, при ``basis=100g``,
+        к 100 г и сравниваются с готовыми столбцами блюда.
         """
         def parse_float(value):
             if value is None or value == '':
@@ -256,42 +430,53 @@ class DishesListView(LoginRequiredMixin, ListView):
             'carbohydrates': ('carbs_min', 'carbs_max'),
         }
 
+        basis = self.get_basis()
         for field, (min_key, max_key) in filters_map.items():
             min_value = parse_float(self.request.GET.get(min_key))
             max_value = parse_float(self.request.GET.get(max_key))
+            column = basis_field(field, basis)
 
             if min_value is not None:
-                queryset = queryset.filter(**{f'{field}__gte': min_value})
+                queryset = queryset.filter(**{f'{column}__gte': min_value})
 
             if max_value is not None:
-                queryset = queryset.filter(**{f'{field}__lte': max_value})
+                queryset = queryset.filter(**{f'{column}__lte': max_value})
 
-        created_after = self.request.GET.get('created_after')
-        created_before = self.request.GET.get('created_before')
+        def parse_day_start(value, days=0):
+            # days=1 даёт начало следующего дня; у date.max его нет,
+            # и такая граница просто не ограничивает выборку.
+            try:
+                day = parse_date(value or '')
+                if day is None:
+                    return None
+                day += timedelta(days=days)
+            except (ValueError, OverflowError):
+                return None
+            return timezone.make_aware(datetime.combine(day, time.min))
+
+        # Границы дат переводятся в диапазон по самому полю created_at,
+        # чтобы условие шло по индексу, а не через приведение к дате.
+        created_after = parse_day_start(self.request.GET.get('created_after'))
+        created_before = parse_day_start(self.request.GET.get('created_before'), days=1)
 
         if created_after:
-            queryset = queryset.filter(
-                created_at__date__gte=created_after
-            )
+            queryset = queryset.filter(created_at__gte=created_after)
 
         if created_before:
-            queryset = queryset.filter(
-                created_at__date__lte=created_before
-            )
+            queryset = queryset.filter(created_at__lt=created_before)
 
         exclude_allergens = self.request.GET.getlist('exclude_allergens')
         if exclude_allergens:
-            try:
-                allergen_ids = [int(a) for a in exclude_allergens]
-                queryset = queryset.exclude(allergens__id__in=allergen_ids).distinct()
-            except (ValueError, TypeError):
-                pass
+            allergen_ids = parse_allergen_ids(exclude_allergens)
+            queryset = exclude_dishes_with_allergens(
+                queryset, allergen_ids, self.get_available_allergens()
+            )
 
         return queryset
 
-    def apply_sorting(self, queryset):
+    def get_sort_key(self):
         """
-        Применяет сортировку списка блюд.
+        Возвращает проверенный ключ сортировки из параметров запроса.
         """
         sort_by = self.request.GET.get(
             'sort_by',
@@ -308,14 +493,165 @@ class DishesListView(LoginRequiredMixin, ListView):
         }
 
         if sort_by in valid_sort_fields:
-            return queryset.order_by(sort_by)
+            return sort_by
+
+        return '-created_at'
+
+    def apply_sorting(self, queryset):
+        """
+        Применяет сортировку списка блюд.
+
+        id используется как уточняющий ключ, чтобы порядок
+        блюд с одинаковыми значениями был стабильным между страницами.
+        """
+        sort_by = self.get_sort_key()
+        tie_breaker = '-id' if sort_by.startswith('-') else 'id'
+        return queryset.order_by(sort_by, tie_breaker)
 
-        return queryset.order_by('-created_at')
+
+class DishesListView(LoginRequiredMixin, VersionedPageCacheMixin, DishFilterMixin, ListView):
+    """
+    Отображает список блюд пользователя.
+
+    Поддерживает фильтрацию, сортировку и пагинацию
+    (постраничную или курсорную). Отрисованные страницы кешируются
+    до изменения данных пользователя.
+    """
+
+    query_budget = 8
+
+    template_name = 'main/dishes.html'
+    context_object_name = 'dishes'
+    paginate_by = 10
+
+    def get_queryset(self):
+        """
+        Формирует queryset блюд текущего пользователя
+        с учётом параметров фильтрации и сортировки.
+        """
+        queryset = Dish.objects.filter(
+            user=self.request.user
+        ).prefetch_related(
+            Prefetch(
+                'allergens',
+                queryset=Allergen.objects.only('id', 'name', 'is_global')
+            )
+        )
+        return self.filter_dishes(queryset)
+
+    def is_cursor_pagination(self):
+        """
+        Курсорная пагинация включается параметром ``pagination=cursor``.
+        """
+        return self.request.GET.get('pagination') == 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        В курсорном режиме выбирает страницу по ключу сортировки
+        без OFFSET и без подсчёта общего количества строк.
+        """
+        if not self.is_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(queryset, self.get_sort_key(), page_size)
+        try:
+            page = paginator.get_page(self.request.GET.get('cursor'))
+        except InvalidCursor as exc:
+            raise Http404(str(exc))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def has_active_filters(self):
+        """
+        Проверяет, сужают ли параметры запроса список блюд.
+        """
+        return any(
+            value.strip()
+            for key in FILTER_PARAMS
+            for value in self.request.GET.getlist(key)
+        )
+
+    def get_dish_stats(self):
+        """
+        Считает количество блюд и среднее, минимум, максимум и сумму
+        по каждому нутриенту для всего отфильтрованного набора
+        одним агрегирующим запросом.
+
+        Без фильтров статистика берётся из сводки пользователя.
+        С фильтрами агрегат проходит весь отфильтрованный набор,
+        поэтому его результат кешируется по фильтрам и версиям данных:
+        следующие страницы (в том числе курсорные) его не повторяют.
+        При выключенном кеше страниц агрегат считается на каждой странице.
+        """
+        if getattr(self, '_dish_stats', None) is not None:
+            return self._dish_stats
+
+        if not self.has_active_filters():
+            self._dish_stats = get_summary(self.request.user).as_stats()
+            return self._dish_stats
+
+        use_cache = getattr(settings, 'PAGE_CACHE_ENABLED', True)
+        key = self.get_stats_cache_key() if use_cache else None
+        stats = get_page_cache().get(key) if use_cache else None
+        if stats is None:
+            row = self.object_list.order_by().aggregate(**self.get_stats_aggregates())
+            stats = self.stats_from_row(row)
+            if use_cache:
+                get_page_cache().set(key, stats, self.page_cache_timeout)
+        self._dish_stats = stats
+        return self._dish_stats
+
+    def get_stats_cache_key(self):
+        """
+        Ключ статистики: пользователь, версии его данных и параметры,
+        от которых зависит набор блюд (без страницы и сортировки).
+        """
+        parts = [
+            *map(str, request_data_versions(self.request)),
+            normalized_query(
+                self.request.GET, ignore=('page', 'cursor', 'pagination', 'sort_by')
+            ),
+        ]
+        digest = hashlib.sha256(':'.join(parts).encode()).hexdigest()
+        return f'dish-stats:{self.request.user.pk}:{digest}'
+
+    def get_stats_aggregates(self):
+        """
+        Агрегаты статистики: количество и среднее, минимум,
+        максимум и сумма по каждому нутриенту.
+        """
+        aggregates = {'count': Count('id')}
+        for field in MACRO_FIELDS:
+            aggregates[f'{field}_avg'] = Avg(field)
+            aggregates[f'{field}_min'] = Min(field)
+            aggregates[f'{field}_max'] = Max(field)
+            aggregates[f'{field}_sum'] = Sum(field)
+        return aggregates
+
+    def stats_from_row(self, row):
+        """
+        Раскладывает результат агрегирующего запроса по нутриентам.
+        """
+        stats = {'count': row['count']}
+        for field in MACRO_FIELDS:
+            stats[field] = {
+                kind: row[f'{field}_{kind}']
+                for kind in ('avg', 'min', 'max', 'sum')
+            }
+        return stats
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        """
+        Передаёт пагинатору количество блюд из агрегата,
+        чтобы не выполнять отдельный COUNT.
+        """
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        paginator.count = self.get_dish_stats()['count']
+        return paginator
 
     def get_context_data(self, **kwargs):
         """
         Добавляет дополнительные данные в контекст шаблона,
-        включая текущие фильтры и средние значения БЖУ.
+        включая текущие фильтры и статистику БЖУ по всей выборке.
         """
         context = super().get_context_data(**kwargs)
 
@@ -328,42 +664,78 @@ class DishesListView(LoginRequiredMixin, ListView):
             'sort_by'
         ]:
             context[f'current_{key}'] = self.request.GET.get(key, '')
+        context['current_basis'] = self.get_basis()
 
-        filtered_dishes = context['dishes']
         context['available_allergens'] = self.get_available_allergens()
         context['current_exclude_allergens'] = [
             int(a) for a in self.request.GET.getlist('exclude_allergens') if a.isdigit()
         ]
 
-        def safe_average(values):
-            valid_values = [v for v in values if v is not None]
-            return (
-                sum(valid_values) / len(valid_values)
-                if valid_values else 0
-            )
+        page_query = self.request.GET.copy()
+        for key in ('page', 'cursor'):
+            page_query.pop(key, None)
+        context['page_query'] = page_query.urlencode()
+        context['cursor_pagination'] = self.is_cursor_pagination()
 
-        if filtered_dishes:
-            context['avg_calories'] = safe_average(
-                d.calories for d in filtered_dishes
-            )
-            context['avg_protein'] = safe_average(
-                d.proteins for d in filtered_dishes
-            )
-            context['avg_fat'] = safe_average(
-                d.fats for d in filtered_dishes
-            )
-            context['avg_carbs'] = safe_average(
-                d.carbohydrates for d in filtered_dishes
-            )
-        else:
-            context['avg_calories'] = 0
-            context['avg_protein'] = 0
-            context['avg_fat'] = 0
-            context['avg_carbs'] = 0
+        stats = self.get_dish_stats()
+        context['dish_stats'] = stats
+        context['avg_calories'] = stats['calories']['avg']
+        context['avg_protein'] = stats['proteins']['avg']
+        context['avg_fat'] = stats['fats']['avg']
+        context['avg_carbs'] = stats['carbohydrates']['avg']
 
         return context
 
-class UpdateDishView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class ExportDishesView(LoginRequiredMixin, DishFilterMixin, View):
+    """
+    Потоковая выгрузка всех блюд пользователя в CSV, JSON Lines или XLSX.
+
+    Принимает те же параметры фильтрации и сортировки, что и список блюд.
+    Блюда читаются частями вместе с аллергенами, поэтому расход
+    памяти не зависит от размера дневника.
+    """
+
+    chunk_size = 2000
+
+    def get_queryset(self):
+        queryset = Dish.objects.filter(
+            user=self.request.user
+        ).only(
+            'id', 'name', 'description', 'created_at', 'weight_grams', *MACRO_FIELDS
+        ).prefetch_related(
+            Prefetch('allergens', queryset=Allergen.objects.only('id', 'name'))
+        )
+        return self.filter_dishes(queryset)
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise Http404('Неизвестный формат выгрузки')
+        export, content_type, extension = EXPORT_FORMATS[export_format]
+
+        dishes = self.get_queryset().iterator(chunk_size=self.chunk_size)
+        response = StreamingHttpResponse(export(dishes), content_type=content_type)
+        filename = f'dishes-{timezone.localdate():%Y-%m-%d}.{extension}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class CachedObjectMixin:
+    """
+    Читает объект один раз за запрос: его запрашивают
+    и проверка прав, и само представление.
+    """
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_cached_object'):
+            self._cached_object = super().get_object()
+        return self._cached_object
+
+
+class UpdateDishView(LoginRequiredMixin, UserPassesTestMixin, CachedObjectMixin, UpdateView):
+    query_budget = 8
     model = Dish
     form_class = DishForm
     template_name = 'main/dish_form.html'
@@ -374,7 +746,7 @@ class UpdateDishView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         Ограничивает набор редактируемых блюд владельцем.
         Администратор может редактировать любое блюдо.
         """
-        qs = Dish.objects.all()
+        qs = Dish.objects.select_related('user')
         if self.request.user.is_staff:
             return qs
         return qs.filter(user=self.request.user)
@@ -394,11 +766,26 @@ class UpdateDishView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     def test_func(self):
         dish = self.get_object()
         return (
-            dish.user == self.request.user
+            dish.user_id == self.request.user.pk
             or self.request.user.is_staff
         )
 
-class DeleteDishView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+    def form_valid(self, form):
+        """
+        Сохраняет блюдо и ставит новую фотографию в очередь на обработку.
+        """
+        photo_changed = 'photo' in form.changed_data and bool(form.instance.photo)
+        if photo_changed:
+            form.instance.photo_status = Dish.PHOTO_PROCESSING
+            form.instance.photo_renditions = {}
+        with transaction.atomic():
+            response = super().form_valid(form)
+            if photo_changed:
+                schedule_photo_processing(self.object)
+        return response
+
+class DeleteDishView(LoginRequiredMixin, UserPassesTestMixin, CachedObjectMixin, DeleteView):
+    query_budget = 3
     model = Dish
     template_name = 'main/dish_confirm_delete.html'
     success_url = reverse_lazy('dishes')
@@ -411,7 +798,7 @@ class DeleteDishView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
     def test_func(self):
         dish = self.get_object()
-        return (dish.user==self.request.user or self.request.user.is_staff)
+        return (dish.user_id==self.request.user.pk or self.request.user.is_staff)
 
     def post(self, request, *args, **kwargs):
         # Удаляем сразу по POST и перенаправляем на список блюд
@@ -419,7 +806,66 @@ class DeleteDishView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         messages.success(request, "Блюдо удалено")
         return response
 
+
+class SimilarDishesView(LoginRequiredMixin, UserPassesTestMixin, CachedObjectMixin, DetailView):
+    """
+    Показывает блюда владельца, ближайшие к выбранному по КБЖУ.
+
+    Количество задаётся параметром ``limit`` (не больше ``MAX_LIMIT``).
+    """
+
+    query_budget = 7
+    model = Dish
+    template_name = 'main/similar_dishes.html'
+    context_object_name = 'dish'
+
+    def get_queryset(self):
+        qs = Dish.objects.all()
+        if self.request.user.is_staff:
+            return qs
+        return qs.filter(user=self.request.user)
+
+    def test_func(self):
+        dish = self.get_object()
+        return (dish.user_id == self.request.user.pk or self.request.user.is_staff)
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', DEFAULT_LIMIT))
+        except (TypeError, ValueError):
+            return DEFAULT_LIMIT
+        return min(max(limit, 1), MAX_LIMIT)
+
+    def get_context_data(self, **kwargs):
+        """
+        Добавляет найденные блюда в порядке близости.
+        """
+        context = super().get_context_data(**kwargs)
+        dish = self.object
+        if dish.user_id == self.request.user.pk:
+            versions = request_data_versions(self.request)
+        else:
+            versions = user_data_versions(dish.user_id)
+
+        matches = similar_dishes(dish, versions, self.get_limit())
+        found = Dish.objects.prefetch_related(
+            Prefetch(
+                'allergens',
+                queryset=Allergen.objects.only('id', 'name', 'is_global')
+            )
+        ).in_bulk([dish_id for dish_id, _ in matches]) if matches else {}
+
+        context['similar'] = [
+            {'dish': found[dish_id], 'distance': distance}
+            for dish_id, distance in matches if dish_id in found
+        ]
+        context['known_macros'] = [
+            field for field in MACRO_FIELDS if getattr(dish, field) is not None
+        ]
+        return context
+
 class UpdateAllergenView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+    query_budget = 5
     model = Allergen
     form_class = UserAllergenForm
     template_name = 'main/user_allergen_form.html'
@@ -450,6 +896,7 @@ class DeleteAllergenView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
 
 class UpdateGlobalAllergenView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+    query_budget = 4
     model = Allergen
     form_class = GlobalAllergenForm
     template_name = 'main/admin_create_allergen.html'
@@ -463,7 +910,9 @@ class UpdateGlobalAllergenView(LoginRequiredMixin, UserPassesTestMixin, UpdateVi
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['allergens'] = Allergen.objects.filter(is_global=True).order_by('name')
+        context['allergens'] = Allergen.objects.filter(
+            is_global=True
+        ).select_related('created_by').order_by('name')
         return context
 
 
@@ -483,4 +932,309 @@ class DeleteGlobalAllergenView(LoginRequiredMixin, UserPassesTestMixin, DeleteVi
         return self.post(request, *args, **kwargs)
 
 
+# Годы, для которых у соседних месяцев и дней тоже есть даты.
+DIARY_YEARS = range(MINYEAR + 1, MAXYEAR)
+
+MONTH_NAMES = [
+    'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+    'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь',
+]
+
+
+def parse_month(value):
+    """
+    Разбирает месяц вида ``2024-05``; по умолчанию и для годов
+    вне ``DIARY_YEARS`` — текущий месяц.
+    """
+    try:
+        year, month = (int(part) for part in (value or '').split('-'))
+        if year in DIARY_YEARS:
+            return date(year, month, 1)
+    except ValueError:
+        pass
+    return timezone.localdate().replace(day=1)
+
+
+def diary_day_url(day):
+    return reverse('diary_day', args=(day.year, day.month, day.day))
+
+
+@query_budget(4)
+@login_required
+def diary_month_view(request):
+    """
+    Календарь дневника за месяц с итогами по дням и неделям.
+
+    Читает только готовые итоги ``DailyIntake`` и ``WeeklyIntake``.
+    """
+    first = parse_month(request.GET.get('month'))
+    weeks = calendar.Calendar().monthdatescalendar(first.year, first.month)
+
+    daily = {
+        row.day: row for row in DailyIntake.objects.filter(
+            user=request.user, day__range=(weeks[0][0], weeks[-1][-1])
+        )
+    }
+    weekly = {
+        row.week_start: row for row in WeeklyIntake.objects.filter(
+            user=request.user, week_start__range=(weeks[0][0], weeks[-1][0])
+        )
+    }
+
+    return render(request, 'main/diary_month.html', {
+        'month_title': f'{MONTH_NAMES[first.month - 1]} {first.year}',
+        'weeks': [
+            {
+                'totals': weekly.get(week[0]),
+                'days': [
+                    {
+                        'day': day,
+                        'url': diary_day_url(day),
+                        'totals': daily.get(day),
+                        'in_month': day.month == first.month,
+                    }
+                    for day in week
+                ],
+            }
+            for week in weeks
+        ],
+        'prev_month': (first - timedelta(days=1)).strftime('%Y-%m'),
+        'next_month': (first + timedelta(days=31)).strftime('%Y-%m'),
+        'today': timezone.localdate(),
+    })
+
+
+@query_budget(4)
+@login_required
+def diary_day_view(request, year, month, day):
+    """
+    Записи дневника за день и их итоги.
+    """
+    if year not in DIARY_YEARS:
+        raise Http404('Неверная дата')
+    try:
+        current = date(year, month, day)
+    except ValueError:
+        raise Http404('Неверная дата')
+
+    entries = MealEntry.objects.filter(
+        user=request.user, eaten_on=current
+    ).order_by('eaten_at', 'pk')
+    totals = DailyIntake.objects.filter(user=request.user, day=current).first()
+
+    return render(request, 'main/diary_day.html', {
+        'day': current,
+        'entries': entries,
+        'totals': totals,
+        'month': current.strftime('%Y-%m'),
+        'prev_url': diary_day_url(current - timedelta(days=1)),
+        'next_url': diary_day_url(current + timedelta(days=1)),
+    })
+
+
+@query_budget(3)
+@login_required
+def diary_trends_view(request):
+    """
+    Итоги дневника по неделям за последние ``weeks`` недель (до 104).
+    """
+    try:
+        weeks = min(max(int(request.GET.get('weeks', 12)), 1), 104)
+    except ValueError:
+        weeks = 12
+
+    since = week_start(timezone.localdate()) - timedelta(weeks=weeks - 1)
+    rows = {
+        row.week_start: row for row in WeeklyIntake.objects.filter(
+            user=request.user, week_start__gte=since
+        )
+    }
+    series = []
+    for number in range(weeks):
+        start = since + timedelta(weeks=number)
+        series.append({'start': start, 'end': start + timedelta(days=6), 'totals': rows.get(start)})
+
+    return render(request, 'main/diary_trends.html', {
+        'series': series,
+        'weeks': weeks,
+        'max_calories': max((row.calories for row in rows.values()), default=0),
+    })
+
+
+class MealEntryCreateView(LoginRequiredMixin, CreateView):
+    """
+    Запись блюда в дневник.
+    """
+
+    query_budget = 3
+    model = MealEntry
+    form_class = MealEntryForm
+    template_name = 'main/meal_entry_form.html'
+
+    def get_dish(self):
+        if not hasattr(self, '_dish'):
+            self._dish = get_object_or_404(Dish, pk=self.kwargs['dish_pk'], user=self.request.user)
+        return self._dish
+
+    def get_initial(self):
+        """
+        Подставляет размер порции из параметра ``portion``,
+        с которым ведут ссылки со страницы порций блюда.
+        """
+        initial = super().get_initial()
+        try:
+            portion = float(self.request.GET.get('portion', ''))
+        except ValueError:
+            return initial
+        if 0 < portion <= 20:
+            initial['portion'] = round(portion, 3)
+        return initial
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['dish'] = self.get_dish()
+        return context
+
+    def form_valid(self, form):
+        """
+        Сохраняет запись с нутриентами блюда на размер порции.
+        """
+        entry = form.instance
+        entry.user = self.request.user
+        entry.dish = self.get_dish()
+        entry.fill_from_dish()
+        response = super().form_valid(form)
+        messages.success(self.request, f"Блюдо {entry.name} записано в дневник")
+        return response
+
+    def get_success_url(self):
+        return diary_day_url(self.object.eaten_on)
+
+
+class MealEntryUpdateView(LoginRequiredMixin, UpdateView):
+    """
+    Изменение порции или времени записи дневника.
+    """
+
+    query_budget = 3
+    model = MealEntry
+    form_class = MealEntryForm
+    template_name = 'main/meal_entry_form.html'
+
+    def get_queryset(self):
+        return MealEntry.objects.filter(user=self.request.user)
+
+    def form_valid(self, form):
+        """
+        Пересчитывает нутриенты записи пропорционально новой порции.
+        """
+        entry = form.instance
+        old_portion = form.initial['portion']
+        if 'portion' in form.changed_data and old_portion:
+            ratio = entry.portion / old_portion
+            for field in MACRO_FIELDS:
+                value = getattr(entry, field)
+                if value is not None:
+                    setattr(entry, field, value * ratio)
+        return super().form_valid(form)
+
+    def get_success_url(self):
+        return diary_day_url(self.object.eaten_on)
+
+
+class MealEntryDeleteView(LoginRequiredMixin, DeleteView):
+    """
+    Удаление записи дневника по POST.
+    """
+
+    model = MealEntry
+    http_method_names = ['post']
+
+    def get_queryset(self):
+        return MealEntry.objects.filter(user=self.request.user)
+
+    def get_success_url(self):
+        return diary_day_url(self.object.eaten_on)
+
+
+@query_budget(4)
+@login_required
+def dish_servings_view(request, pk):
+    """
+    Порции блюда с готовыми нутриентами и добавление новой порции.
+    """
+    dish = get_object_or_404(Dish, pk=pk, user=request.user)
+    if request.method == 'POST':
+        form = ServingForm(request.POST)
+        if form.is_valid():
+            serving = form.save(commit=False)
+            serving.dish = dish
+            serving.save()
+            messages.success(request, f"Порция «{serving.name}» добавлена")
+            return redirect('dish_servings', pk=dish.pk)
+    else:
+        form = ServingForm()
+
+    return render(request, 'main/dish_servings.html', {
+        'dish': dish,
+        'servings': dish.servings.all(),
+        'form': form,
+    })
+
+
+class ServingDeleteView(LoginRequiredMixin, DeleteView):
+    """
+    Удаление порции блюда по POST.
+    """
+
+    model = Serving
+    http_method_names = ['post']
+
+    def get_queryset(self):
+        return Serving.objects.filter(dish__user=self.request.user)
+
+    def get_success_url(self):
+        return reverse('dish_servings', args=[self.object.dish_id])
+
+
+@query_budget(6)
+@login_required
+def dish_components_view(request, pk):
+    """
+    Состав блюда-рецепта и добавление в него других блюд.
+
+    Итоги рецепта пересчитываются после сохранения состава.
+    """
+    dish = get_object_or_404(Dish, pk=pk, user=request.user)
+    if request.method == 'POST':
+        form = DishComponentForm(request.POST, parent=dish)
+        if form.is_valid():
+            component = form.save(commit=False)
+            component.parent = dish
+            component.save()
+            messages.success(request, f"Блюдо {component.component.name} добавлено в состав")
+            return redirect('dish_components', pk=dish.pk)
+    else:
+        form = DishComponentForm(parent=dish)
+
+    return render(request, 'main/dish_components.html', {
+        'dish': dish,
+        'components': dish.components.select_related('component').order_by('component__name'),
+        'used_in': dish.used_in.select_related('parent').order_by('parent__name'),
+        'form': form,
+    })
+
+
+class DishComponentDeleteView(LoginRequiredMixin, DeleteView):
+    """
+    Удаление блюда из состава рецепта по POST.
+    """
+
+    model = DishComponent
+    http_method_names = ['post']
+
+    def get_queryset(self):
+        return DishComponent.objects.filter(parent__user=self.request.user)
 
+    def get_success_url(self):
+        return reverse('dish_components', args=[self.object.parent_id])